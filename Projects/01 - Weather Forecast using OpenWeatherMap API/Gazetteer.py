@@ -0,0 +1,248 @@
+# Gazetteer.py
+# Purpose: Offline geocoding index used by GetWeather.py
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+#
+# The index is built from GeoNames dumps (https://download.geonames.org):
+#  - Cities (e.g. cities500.txt, tab separated, 19 columns)
+#  - Postal codes (e.g. US.txt from the postal code dumps, 12 columns)
+#
+# Build an index:
+#   python Gazetteer.py build cities500.txt US.txt -o gazetteer.idx
+# Look up a place:
+#   python Gazetteer.py lookup gazetteer.idx city "Bellevue,NE,US"
+
+import argparse
+import csv
+import mmap
+import re
+import struct
+import sys
+from itertools import chain
+
+# Constants:
+MAGIC = b"GAZ1"
+HEADER = struct.Struct("<4sI")            # Magic, number of keys
+OFFSET = struct.Struct("<I")              # Start of a key in the key blob
+COORDS = struct.Struct("<ff")             # Lat, lon
+CITY_COLUMNS = 19
+POSTAL_COLUMNS = 12
+VALID_NAME = re.compile(r"[a-zA-Z ]+")    # Same rule as the city menu
+
+# GeoNames feature codes that are populated places, without the
+# historical/abandoned ones
+POPULATED_PLACES = {"PPL", "PPLA", "PPLA2", "PPLA3", "PPLA4", "PPLA5",
+                    "PPLC", "PPLG", "PPLS", "PPLX"}
+
+
+# ------------------------------------------------------------------
+# Normalized keys. They are built the same way as the place strings
+# of GetWeather.py's menus ("City,State,CC" and "ZIP,CC"), prefixed
+# with the kind of lookup like the geocoding cache keys.
+# ------------------------------------------------------------------
+def city_key(city: str, state: str, country: str):
+    if state:
+        state = state.upper() if len(state) == 2 else state.title()
+        return f"city:{city.title()},{state},{country.upper()}"
+    return f"city:{city.title()},{country.upper()}"
+
+
+def zip_key(zip_code: str, country: str):
+    return f"zip:{zip_code},{country.upper()}"
+
+
+# ------------------------------------------------------------------
+# Yields (key, lat, lon, population) from a GeoNames cities dump.
+# Every city is indexed as "City,CC" and, when the first-level
+# administrative code is a two letter state (US, CA, ...), also as
+# "City,State,CC".
+# ------------------------------------------------------------------
+def read_cities(rows):
+    for row in rows:
+        if len(row) != CITY_COLUMNS or row[7] not in POPULATED_PLACES:
+            continue
+
+        name, country, state = row[2], row[8], row[10]
+        if not VALID_NAME.fullmatch(name) or len(country) != 2:
+            continue
+
+        lat, lon = float(row[4]), float(row[5])
+        population = int(row[14] or 0)
+
+        yield city_key(name, "", country), lat, lon, population
+        if state.isalpha() and len(state) == 2:
+            yield city_key(name, state, country), lat, lon, population
+
+
+# ------------------------------------------------------------------
+# Yields (key, lat, lon, population) from a GeoNames postal codes
+# dump. Postal codes with spaces or dashes can't be entered in the
+# zip code menu and are skipped.
+# ------------------------------------------------------------------
+def read_postal_codes(rows):
+    for row in rows:
+        if len(row) != POSTAL_COLUMNS or not row[9] or not row[10]:
+            continue
+
+        country, zip_code = row[0], row[1]
+        if not zip_code.isalnum() or len(country) != 2:
+            continue
+
+        yield zip_key(zip_code, country), float(row[9]), float(row[10]), 0
+
+
+# ------------------------------------------------------------------
+# Builds an index file from GeoNames dumps. When a key appears more
+# than once (several Springfields in the US), the most populated
+# place wins, which is what the web service returns first too.
+#
+# File layout (little endian):
+#   header            magic, number of keys (N)
+#   offsets           N + 1 uint32, start of each key in the key blob
+#   coordinates       N pairs of float32 (lat, lon)
+#   key blob          UTF-8 keys, sorted, concatenated
+# ------------------------------------------------------------------
+def build_index(source_paths: list, output_path: str):
+    places = {}     # key -> (population, lat, lon)
+
+    for path in source_paths:
+        with open(path, encoding="utf-8", newline="") as source:
+            rows = csv.reader(source, delimiter="\t",
+                              quoting=csv.QUOTE_NONE)
+            first = next(rows, [])
+
+            if len(first) == CITY_COLUMNS:
+                reader = read_cities
+            elif len(first) == POSTAL_COLUMNS:
+                reader = read_postal_codes
+            else:
+                raise ValueError(f"{path} is not a GeoNames cities or "
+                                 f"postal codes dump")
+
+            for key, lat, lon, population in reader(chain([first], rows)):
+                known = places.get(key)
+                if known is None or population > known[0]:
+                    places[key] = (population, lat, lon)
+
+    keys = sorted(key.encode("utf-8") for key in places)
+
+    with open(output_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, len(keys)))
+
+        offset = 0
+        for key in keys:
+            output.write(OFFSET.pack(offset))
+            offset += len(key)
+        output.write(OFFSET.pack(offset))
+
+        for key in keys:
+            _, lat, lon = places[key.decode("utf-8")]
+            output.write(COORDS.pack(lat, lon))
+
+        for key in keys:
+            output.write(key)
+
+    return len(keys)
+
+
+# -------------------------------------------------------------------
+# Read-only gazetteer index, memory-mapped from disk.
+#
+# Nothing is loaded up front: the operating system pages the file in
+# as it's used, so opening is instant and several processes share the
+# same memory. lookup() is a binary search over the sorted keys.
+# -------------------------------------------------------------------
+class Gazetteer:
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        magic, self._count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a gazetteer index")
+
+        self._offsets_start = HEADER.size
+        self._coords_start = (self._offsets_start
+                              + OFFSET.size * (self._count + 1))
+        self._keys_start = self._coords_start + COORDS.size * self._count
+
+    def _key(self, index: int):
+        position = self._offsets_start + OFFSET.size * index
+        start = OFFSET.unpack_from(self._map, position)[0]
+        end = OFFSET.unpack_from(self._map, position + OFFSET.size)[0]
+        return self._map[self._keys_start + start:self._keys_start + end]
+
+    # ------------------------------------------------------------
+    # Returns (lat, lon) for a "city" or "zip" place, or None if
+    # the place is not in the index
+    # ------------------------------------------------------------
+    def lookup(self, kind: str, place: str):
+        key = f"{kind}:{place}".encode("utf-8")
+        low, high = 0, self._count
+
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._count and self._key(low) == key:
+            lat, lon = COORDS.unpack_from(
+                self._map, self._coords_start + COORDS.size * low)
+            # float32 keeps ~7 digits, don't show the noise after them
+            return round(lat, 5), round(lon, 5)
+
+        return None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._map.close()
+
+
+# ------------------------------------
+# Command line
+# ------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or query the offline gazetteer index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="build an index from GeoNames dumps")
+    build_parser.add_argument("sources", nargs="+", metavar="DUMP",
+                              help="GeoNames cities or postal codes file")
+    build_parser.add_argument("-o", "--output", default="gazetteer.idx",
+                              help="index file (default: gazetteer.idx)")
+
+    lookup_parser = subparsers.add_parser(
+        "lookup", help="look up a place in an index")
+    lookup_parser.add_argument("index", help="index file")
+    lookup_parser.add_argument("kind", choices=["city", "zip"])
+    lookup_parser.add_argument("place",
+                               help='normalized place, e.g. "Paris,FR"')
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.sources, args.output)
+        print(f"{count} places written to {args.output}")
+    else:
+        gazetteer = Gazetteer(args.index)
+        coords = gazetteer.lookup(args.kind, args.place)
+        gazetteer.close()
+        if coords is None:
+            print(f"{args.place} not found")
+            sys.exit(1)
+        print(f"{args.place}: {coords[0]:.5f}, {coords[1]:.5f}")
+
+
+if __name__ == "__main__":
+    main()
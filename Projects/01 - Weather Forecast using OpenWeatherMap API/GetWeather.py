@@ -3,12 +3,39 @@
 # Author: Javier Corpus
 # Changelog:
 # 11/03/2024 - Initial version
-
+# 10/18/2026 - Added non-interactive batch mode (--batch)
+# 10/18/2026 - Added persistent geocoding cache (--geo-cache)
+# 10/18/2026 - Added TTL weather cache (--weather-ttl, --weather-cache)
+# 10/18/2026 - Weather is fetched once in Kelvin and converted locally
+# 10/18/2026 - Requests go through a pooled WeatherTransport with
+#              timeouts, retries and a rate limiter
+# 10/18/2026 - Replaced the global variables with a thread-safe
+#              WeatherClient
+# 10/18/2026 - Added optional offline gazetteer (--gazetteer)
+# 10/18/2026 - Reuse of recent weather from nearby places (--reuse-radius)
+# 10/18/2026 - Added watch mode that only reports changes (--watch)
+# 10/18/2026 - Added daemon mode serving lookups over HTTP (--serve)
+# 10/18/2026 - Tables are built in a buffer and written at once; new
+#              table, compact and comparison batch formats
+# 10/18/2026 - Observations are kept as compact Observation records,
+#              decoded straight from the response bytes
+# 10/18/2026 - Latency histograms and counters (--stats, --stats-file,
+#              /metrics in daemon mode)
+
+import argparse
+import csv
+import heapq
 import json
-import requests
 import math
 import re
 import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from requests.exceptions import (
     HTTPError,
     ConnectionError,
@@ -18,48 +45,389 @@ from requests.exceptions import (
 
 from dotenv import load_dotenv
 
+# orjson is optional. It parses the responses straight from bytes and
+# is several times faster than the json module.
+try:
+    from orjson import loads as decode_json
+except ImportError:
+    from json import loads as decode_json
+
+from Gazetteer import Gazetteer
+from WeatherCache import GeocodeCache, WeatherCache, WEATHER_TTL, MISS
+from WeatherTransport import (
+    WeatherTransport,
+    DEFAULT_CALLS_PER_MINUTE,
+    DEFAULT_RETRIES
+)
+from WeatherServer import DEFAULT_ADDRESS, serve
+from WeatherStats import WeatherStats
+
 load_dotenv()
-api_key = os.getenv("OPENMAP_API_KEY")                                 
+API_KEY = os.getenv("OPENMAP_API_KEY")
 
 # Constants:
 
-GEOCODING_CITY_URL = 'https://api.openweathermap.org/geo/1.0/direct'
-GEOCODING_ZIP_URL = 'https://api.openweathermap.org/geo/1.0/zip'
-CURRENT_WEATHER_URL = 'https://api.openweathermap.org/data/2.5/weather'
+# The base URL can be pointed to a local stub server for testing
+API_BASE_URL = os.getenv("OPENMAP_BASE_URL",
+                         "https://api.openweathermap.org").rstrip("/")
+GEOCODING_CITY_URL = f'{API_BASE_URL}/geo/1.0/direct'
+GEOCODING_ZIP_URL = f'{API_BASE_URL}/geo/1.0/zip'
+CURRENT_WEATHER_URL = f'{API_BASE_URL}/data/2.5/weather'
 HORIZONTAL_LINE = "-" * 80
+WEATHER_UNITS = ["imperial", "metric", "standard"]
+
+# Weather is always fetched in the API's default unit ("standard":
+# Kelvin and meters/second) and converted locally, so switching units
+# doesn't need a new request
+CANONICAL_UNIT = "standard"
+KELVIN_OFFSET = 273.15
+METERS_PER_SECOND_TO_MPH = 1 / 0.44704
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+
+# Columns written by the batch mode, in output order
+BATCH_FIELDS = ["query", "location", "lat", "lon", "temp", "feels_like",
+                "temp_min", "temp_max", "pressure", "humidity",
+                "description", "wind_speed", "units", "reuse_km", "error"]
+
+# Default units for the interactive menu and the batch mode
+DEFAULT_UNIT = "imperial"
+
+# Exception classes reported in the error stats, in the same order as
+# the except blocks of the interactive functions. Anything else is
+# reported as "Exception".
+ERROR_CLASSES = (HTTPError, ConnectionError, Timeout, RequestException)
+
+
+# -------------------------------------------------------------------
+# Coordinates of a place, as returned by WeatherClient.geocode()
+# -------------------------------------------------------------------
+@dataclass(frozen=True)
+class Location:
+    kind: str           # "city" or "zip"
+    place: str          # Normalized place, e.g. "Bellevue,NE,US"
+    name: str           # Name displayed in the weather table
+    lat: float
+    lon: float
+    source: str         # "gazetteer", "cache" or "web service"
+
+
+# -------------------------------------------------------------------
+# Weather observation with only the fields this program uses.
+#
+# The web service answers with a nested dictionary of ~40 values;
+# keeping only these fields in a __slots__ object takes about a
+# tenth of the memory, which matters for caches holding hundreds of
+# thousands of observations. Descriptions are interned, since there
+# are only a few dozen different ones.
+#
+# Observations are cached in the canonical unit; in_units() returns
+# a converted copy.
+# -------------------------------------------------------------------
+class Observation:
+
+    __slots__ = ("temp", "feels_like", "temp_min", "temp_max",
+                 "pressure", "humidity", "description", "wind_speed",
+                 "observed_at")
+
+    def __init__(self, temp: float, feels_like: float, temp_min: float,
+                 temp_max: float, pressure: int, humidity: int,
+                 description: str, wind_speed: float, observed_at: int):
+        self.temp = temp
+        self.feels_like = feels_like
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.pressure = pressure
+        self.humidity = humidity
+        self.description = sys.intern(description)
+        self.wind_speed = wind_speed
+        self.observed_at = observed_at
+
+    # ------------------------------------------------------------
+    # Builds an observation from the decoded web service response
+    # ------------------------------------------------------------
+    @classmethod
+    def from_response(cls, weather_info_dict: dict):
+        main = weather_info_dict['main']
+        return cls(main['temp'], main['feels_like'], main['temp_min'],
+                   main['temp_max'], main['pressure'], main['humidity'],
+                   weather_info_dict['weather'][0]['description'],
+                   weather_info_dict['wind']['speed'],
+                   weather_info_dict.get('dt', 0))
+
+    # ------------------------------------------------------------
+    # Returns a copy with the temperatures and wind speed converted
+    # from the canonical unit to the given unit
+    # ------------------------------------------------------------
+    def in_units(self, unit: str):
+        wind_speed = self.wind_speed
+        if unit == "imperial":
+            wind_speed = round(wind_speed * METERS_PER_SECOND_TO_MPH, 2)
+
+        return Observation(convert_temperature(self.temp, unit),
+                           convert_temperature(self.feels_like, unit),
+                           convert_temperature(self.temp_min, unit),
+                           convert_temperature(self.temp_max, unit),
+                           self.pressure, self.humidity, self.description,
+                           wind_speed, self.observed_at)
+
+    # ------------------------------------------------------------
+    # Returns the fields as a dictionary, using the same names as
+    # the BATCH_FIELDS columns
+    # ------------------------------------------------------------
+    def as_dict(self):
+        return {
+            "temp": self.temp,
+            "feels_like": self.feels_like,
+            "temp_min": self.temp_min,
+            "temp_max": self.temp_max,
+            "pressure": self.pressure,
+            "humidity": self.humidity,
+            "description": self.description,
+            "wind_speed": self.wind_speed,
+        }
+
+    # Serialization used by the persistent weather cache
+    def to_json(self):
+        return json.dumps([getattr(self, field) for field in self.__slots__])
+
+    @classmethod
+    def from_json(cls, data: str):
+        return cls(*json.loads(data))
+
+
+# -------------------------------------------------------------------
+# Current weather of a location, as returned by WeatherClient.lookup()
+# The observation is kept in the canonical unit; use in_units() to
+# get it in the unit the user selected.
+# -------------------------------------------------------------------
+@dataclass(frozen=True)
+class WeatherReport:
+    location: Location
+    observation: Observation
+    cached: bool        # Observation came from the weather cache
+    distance_km: float  # How far the observation is from the location
+
+    def in_units(self, unit: str):
+        return self.observation.in_units(unit)
+
+
+# -------------------------------------------------------------------
+# Client for the OpenWeatherMap web service.
+#
+# The client keeps no per-lookup state: every method returns its
+# result, so one client can be shared by several threads. The caches
+# and the transport it uses are thread-safe.
+#
+# The fetch_* methods only talk to the web service. They don't print
+# anything and they let the request exceptions (HTTPError,
+# ConnectionError, Timeout, ...) propagate to the caller.
+#
+# With a WeatherStats, cache hits/misses and errors are counted (the
+# transport records the request latencies and retries).
+# -------------------------------------------------------------------
+class WeatherClient:
+
+    def __init__(self, api_key: str = API_KEY,
+                 transport: WeatherTransport = None,
+                 geocode_cache: GeocodeCache = None,
+                 weather_cache: WeatherCache = None,
+                 gazetteer: Gazetteer = None,
+                 stats: WeatherStats = None):
+        self.api_key = api_key
+        self.transport = transport or WeatherTransport(stats=stats)
+        self.geocode_cache = geocode_cache
+        self.weather_cache = weather_cache
+        self.gazetteer = gazetteer
+        self.stats = stats
+
+    def count_cache(self, cache: str, hit: bool):
+        if self.stats is not None:
+            self.stats.increment("weather_cache_requests_total", cache=cache,
+                                 result="hit" if hit else "miss")
+
+    def count_error(self, operation: str, error: Exception):
+        if self.stats is not None:
+            name = next((error_class.__name__ for error_class in ERROR_CLASSES
+                         if isinstance(error, error_class)), "Exception")
+            self.stats.increment("weather_errors_total", operation=operation,
+                                 error=name)
+
+    # ---------------------------------------------------------------
+    # Returns (lat, lon) for a city/state/country, or None if not found
+    # ---------------------------------------------------------------
+    def fetch_lat_lon_city(self, city: str):
+        geocoding_city_params = {'q': city, 'appid': self.api_key}
+        geocoding_city_response = self.transport.get(GEOCODING_CITY_URL,
+                                                     geocoding_city_params,
+                                                     "geocoding_city")
+        geocoding_city_response.raise_for_status()
+        geocoding_city_data = decode_json(geocoding_city_response.content)
+
+        if not geocoding_city_data:
+            # Lat/Lon not found for that city
+            return None
+
+        return geocoding_city_data[0]['lat'], geocoding_city_data[0]['lon']
+
+    # ---------------------------------------------------------------
+    # Returns (lat, lon) for a zip code/country, or None if not found
+    # ---------------------------------------------------------------
+    def fetch_lat_lon_zip(self, zip_code: str):
+        geocoding_zip_params = {'zip': zip_code, 'appid': self.api_key}
+        geocoding_zip_response = self.transport.get(GEOCODING_ZIP_URL,
+                                                    geocoding_zip_params,
+                                                    "geocoding_zip")
+
+        if geocoding_zip_response.status_code == 404:
+            # Lat/Lon not found for the given zip code
+            return None
+
+        geocoding_zip_response.raise_for_status()
+        geocoding_zip_data = decode_json(geocoding_zip_response.content)
+        return geocoding_zip_data['lat'], geocoding_zip_data['lon']
+
+    # ---------------------------------------------------------------
+    # Returns the Observation for the coordinates, in the canonical
+    # unit. The response bytes are decoded in a single pass and only
+    # the fields we use are kept.
+    # ---------------------------------------------------------------
+    def fetch_current_weather(self, lat: float, lon: float):
+        current_weather_params = {
+            'lat': lat,
+            'lon': lon,
+            'appid': self.api_key,
+            'units': CANONICAL_UNIT
+        }
+
+        current_weather_response = self.transport.get(CURRENT_WEATHER_URL,
+                                                      current_weather_params,
+                                                      "current_weather")
+        current_weather_response.raise_for_status()
+        return Observation.from_response(
+            decode_json(current_weather_response.content))
+
+    # ---------------------------------------------------------------
+    # Returns the Location of a "city" or "zip" place, or None if it
+    # was not found. The offline gazetteer is used first, then the
+    # geocoding cache, and the web service only if both miss.
+    # ---------------------------------------------------------------
+    def geocode(self, kind: str, place: str):
+        coords = MISS
+        source = "gazetteer"
+
+        if self.gazetteer is not None:
+            # A place missing from the gazetteer may still be known by
+            # the web service, so None is treated as a miss here
+            coords = self.gazetteer.lookup(kind, place) or MISS
+            self.count_cache("gazetteer", coords is not MISS)
+
+        if coords is MISS and self.geocode_cache is not None:
+            coords = self.geocode_cache.get(kind, place)
+            source = "cache"
+            self.count_cache("geocode", coords is not MISS)
+
+        if coords is MISS:
+            source = "web service"
+            try:
+                if kind == "zip":
+                    coords = self.fetch_lat_lon_zip(place)
+                else:
+                    coords = self.fetch_lat_lon_city(place)
+            except Exception as error:
+                self.count_error("geocode", error)
+                raise
+            if self.geocode_cache is not None:
+                self.geocode_cache.put(kind, place, coords)
+
+        if coords is None:
+            return None
+
+        name = f"zip code: {place}" if kind == "zip" else place
+        return Location(kind, place, name, coords[0], coords[1], source)
+
+    # ---------------------------------------------------------------
+    # Returns (weather, cached, distance_km) for the coordinates, in
+    # the canonical unit. Fresh observations come from the weather
+    # cache, possibly from a nearby place (distance_km tells how far);
+    # concurrent misses for the same place share a single request to
+    # the web service. max_age limits how old a cached observation
+    # can be (default: the cache TTL).
+    # ---------------------------------------------------------------
+    def current_weather(self, lat: float, lon: float,
+                        max_age: float = None):
+        try:
+            if self.weather_cache is None:
+                return self.fetch_current_weather(lat, lon), False, 0.0
+
+            weather, cached, distance = self.weather_cache.get_or_fetch(
+                lat, lon, self.fetch_current_weather, max_age)
+        except Exception as error:
+            self.count_error("weather", error)
+            raise
+
+        self.count_cache("weather", cached)
+        return weather, cached, distance
+
+    # ---------------------------------------------------------------
+    # Geocodes a place and gets its weather. Returns a WeatherReport,
+    # or None if the place was not found.
+    # ---------------------------------------------------------------
+    def lookup(self, kind: str, place: str):
+        location = self.geocode(kind, place)
+        if location is None:
+            return None
+
+        observation, cached, distance = self.current_weather(location.lat,
+                                                             location.lon)
+        return WeatherReport(location, observation, cached, distance)
+
+    def close(self):
+        self.transport.close()
+        if self.geocode_cache is not None:
+            self.geocode_cache.close()
+        if self.weather_cache is not None:
+            self.weather_cache.close()
+        if self.gazetteer is not None:
+            self.gazetteer.close()
 
-# Global variables:
-weather_unit = "imperial"
-weather_info = {}
-location = ""
+
+# ---------------------------------------------------------------
+# Converts a temperature in Kelvin to the given unit
+# ---------------------------------------------------------------
+def convert_temperature(kelvin: float, unit: str):
+    match unit:
+        case "imperial":
+            value = (kelvin - KELVIN_OFFSET) * 9 / 5 + 32
+        case "metric":
+            value = kelvin - KELVIN_OFFSET
+        case _:
+            value = kelvin
+
+    # The web service reports two decimals
+    return round(value, 2)
 
 
 # --------------------------------------------
-# This function returns latitude and longitude
-# of a given location (city/state/country)
+# This function returns the Location
+# of a given city/state/country
 # --------------------------------------------
-def get_lat_lon_city(city: str):
+def get_lat_lon_city(client: WeatherClient, city: str):
     try:
         print(HORIZONTAL_LINE)
-        print(f"Contacting Web Service to get coordinates for {city}...")
-        geocoding_city_params = {'q': city, 'appid': API_KEY}
-        geocoding_city_response = requests.get(GEOCODING_CITY_URL,
-                                               geocoding_city_params)
-        geocoding_city_data = geocoding_city_response.json()
-
-        if geocoding_city_response.status_code == 200:
-            print("Connection to web service successful.")
+        print(f"Getting coordinates for {city}...")
+        location = client.geocode("city", city)
 
-        if geocoding_city_response.text == "[]":
+        if location is None:
             # If Lat/Lon was not found for that city:
             return None
 
+        elif location.source == "web service":
+            print("Connection to web service successful.")
         else:
-            # Lat/Lon found
-            global location
-            location = city
-            return (geocoding_city_data[0]['lat'],
-                    geocoding_city_data[0]['lon'])
+            print(f"Coordinates found in the local {location.source}.")
+
+        return location
 
     except HTTPError as http_error:
         # e.g., 404 Not Found
@@ -83,34 +451,26 @@ def get_lat_lon_city(city: str):
         print(f"\nAn unexpected error occurred: \n\n{other_error}")
 
 
-# -------------------------------------------------------------------------
-# This function returns latitude and longitude of a given zip code/country
-# -------------------------------------------------------------------------
-def get_lat_lon_zip(zip_code: str):
+# -------------------------------------------------------------
+# This function returns the Location of a given zip code/country
+# -------------------------------------------------------------
+def get_lat_lon_zip(client: WeatherClient, zip_code: str):
     try:
         print(HORIZONTAL_LINE)
-        print(f"Contacting Web Service to get coordinates for "
-              f"zip code {zip_code}...")
-        geocoding_zip_params = {'zip': zip_code, 'appid': API_KEY}
-        geocoding_zip_response = requests.get(GEOCODING_ZIP_URL,
-                                              geocoding_zip_params)
+        print(f"Getting coordinates for zip code {zip_code}...")
+        location = client.geocode("zip", zip_code)
 
-        if geocoding_zip_response.status_code != 200:
+        if location is None:
             # Lat/Lon not found for the given zip code
-
-            if geocoding_zip_response.status_code == 404:
-                print(f"Connection to web service successful, "
-                      f"but no data found.")
-
+            print("No data found for the given zip code.")
             return None
 
-        else:
-            # Lat/Lon found
+        elif location.source == "web service":
             print("Connection to web service successful.")
-            geocoding_zip_data = geocoding_zip_response.json()
-            global location
-            location = f"zip code: {zip_code}"
-            return geocoding_zip_data['lat'], geocoding_zip_data['lon']
+        else:
+            print(f"Coordinates found in the local {location.source}.")
+
+        return location
 
     except HTTPError as http_error:
         # e.g., 404 Not Found
@@ -138,7 +498,7 @@ def get_lat_lon_zip(zip_code: str):
 # Main menu. Ask the user if they want to look up
 # a city/state/country, a zip code, or quit
 # ------------------------------------------------
-def get_user_input():
+def get_user_input(weather_unit: str):
     print("┌───────────────────────────────────────────────────────────┐")
     print("│                          MENU                             │")
     print("├───────────────────────────────────────────────────────────┤")
@@ -187,10 +547,10 @@ def usage_examples():
 
 
 # --------------------------------------------
-# Change the units used to display the weather
+# Change the units used to display the weather.
+# Returns the new units.
 # --------------------------------------------
-def set_weather_units():
-    global weather_unit
+def set_weather_units(weather_unit: str):
     while True:
 
         print("┌──────────────────────────────┐")
@@ -217,28 +577,14 @@ def set_weather_units():
             print("\n ----> Invalid input. Please enter 1, 2, or 3.")
 
     print(f"\n ----> Weather units changed to {weather_unit}")
+    return weather_unit
 
 
-# ------------------------------------
-# Prints rows with weather information
-# ------------------------------------
-def print_table_row(str_param1: str, value_param1: str, str_param2: str,
-                    value_param2: str, half_length_table: int):
-    print(f"║ {str_param1:<{len(str_param1)}}", end="")
-    print(" " * (half_length_table - len(str_param1)
-                 - len(value_param1) - 2), end="")
-    print(f"{value_param1} ║", end="")
-
-    print(f" {str_param2:<{len(str_param2)}}", end="")
-    print(" " * (half_length_table - len(str_param2)
-                 - len(value_param2) - 2), end="")
-    print(f"{value_param2} ║")
-
-
-# -------------------------------------------------------------------
-# Displays a table with the weather information for the given location
-# -------------------------------------------------------------------
-def print_weather_info(weather_info_dict: dict, unit: str):
+# -------------------------------------------------
+# Returns the temperature symbol and the wind speed
+# label of the given units
+# -------------------------------------------------
+def unit_labels(unit: str):
     match unit:
         case "imperial":
             weather_symbol = "°F"
@@ -253,7 +599,32 @@ def print_weather_info(weather_info_dict: dict, unit: str):
             weather_symbol = "°F"
             wind_speed = "miles/hour"
 
-    # Defining strings to be used with dynamic print statements
+    return weather_symbol, wind_speed
+
+
+# ------------------------------------
+# Returns a row with weather information
+# ------------------------------------
+def format_table_row(str_param1: str, value_param1: str, str_param2: str,
+                     value_param2: str, half_length_table: int):
+    padding1 = " " * (half_length_table - len(str_param1)
+                      - len(value_param1) - 2)
+    padding2 = " " * (half_length_table - len(str_param2)
+                      - len(value_param2) - 2)
+
+    return (f"║ {str_param1}{padding1}{value_param1} ║"
+            f" {str_param2}{padding2}{value_param2} ║")
+
+
+# -------------------------------------------------------------------
+# Returns the weather table of a location as a single string, so it
+# can be written with one call. `values` has the BATCH_FIELDS names
+# (see Observation.as_dict).
+# -------------------------------------------------------------------
+def format_weather_table(values: dict, unit: str, location: str):
+    weather_symbol, wind_speed = unit_labels(unit)
+
+    # Defining strings to be used in the table
     title = f"Displaying weather information for {location}"
     str_temperature = "Temperature"
     str_conditions = "Conditions"
@@ -266,15 +637,14 @@ def print_weather_info(weather_info_dict: dict, unit: str):
     str_wind_speed = "Wind speed:"
     str_pressure = "Pressure:"
 
-    value_current = f"{weather_info_dict['main']['temp']}{weather_symbol}"
-    value_feels_like = (f"{weather_info_dict['main']['feels_like']}"
-                        f"{weather_symbol}")
-    value_min = f"{weather_info_dict['main']['temp_min']}{weather_symbol}"
-    value_max = f"{weather_info_dict['main']['temp_max']}{weather_symbol}"
-    value_pressure = f"{weather_info_dict['main']['pressure']} hPa"
-    value_description = f"{weather_info_dict['weather'][0]['description']}"
-    value_humidity = f"{weather_info_dict['main']['humidity']}%"
-    value_wind_speed = f"{weather_info_dict['wind']['speed']} {wind_speed}"
+    value_current = f"{values['temp']}{weather_symbol}"
+    value_feels_like = f"{values['feels_like']}{weather_symbol}"
+    value_min = f"{values['temp_min']}{weather_symbol}"
+    value_max = f"{values['temp_max']}{weather_symbol}"
+    value_pressure = f"{values['pressure']} hPa"
+    value_description = f"{values['description']}"
+    value_humidity = f"{values['humidity']}%"
+    value_wind_speed = f"{values['wind_speed']} {wind_speed}"
 
     length_table = len(title) + 25
 
@@ -286,83 +656,152 @@ def print_weather_info(weather_info_dict: dict, unit: str):
         length_table += 1
 
     half_length_table = math.floor(length_table / 2)
-
-    print(HORIZONTAL_LINE)
+    half_line = "═" * half_length_table
 
     # --------------------------------------------------
     # Start of the weather table. This table is dynamic,
     # it changes with the width of the text
     # ---------------------------------------------------
+    lines = [
+        # Row - Table header / Location information
+        f"╔{'═' * length_table}╗",
+        f"║{title:^{length_table}}║",
+        f"╠{half_line}╦{half_line}╣",
+
+        # Row - Temperature / Conditions
+        f"║{str_temperature:^{half_length_table}}║"
+        f"{str_conditions:^{half_length_table}}║",
+        f"╠{half_line}╬{half_line}╣",
+
+        # Row - Current / Description
+        format_table_row(str_current, value_current, str_description,
+                         value_description, half_length_table),
+
+        # Row - Feels Like / Humidity
+        format_table_row(str_feels_like, value_feels_like, str_humidity,
+                         value_humidity, half_length_table),
+
+        # Row - Min / Wind Speed
+        format_table_row(str_min, value_min, str_wind_speed,
+                         value_wind_speed, half_length_table),
+
+        # Row - Max / Pressure
+        format_table_row(str_max, value_max, str_pressure,
+                         value_pressure, half_length_table),
 
-    # Row - Table header / Location information
-    print("╔", end="")
-    print("═" * length_table, end="")
-    print("╗")
-    print(f"║{title:^{length_table}}║")
-
-    print("╠", end="")
-    print("═" * half_length_table, end="")
-    print("╦", end="")
-    print("═" * half_length_table, end="")
-    print("╣")
-
-    # Row - Temperature / Conditions
-    print(f"║{str_temperature:^{half_length_table}}║"
-          f"{str_conditions:^{half_length_table}}║")
-    print("╠", end="")
-    print("═" * half_length_table, end="")
-    print("╬", end="")
-    print("═" * half_length_table, end="")
-    print("╣")
-
-    # Row - Current / Description
-    print_table_row(str_current, value_current, str_description,
-                    value_description, half_length_table)
-
-    # Row - Feels Like / Humidity
-    print_table_row(str_feels_like, value_feels_like, str_humidity,
-                    value_humidity, half_length_table)
-
-    # Row - Min / Wind Speed
-    print_table_row(str_min, value_min, str_wind_speed,
-                    value_wind_speed, half_length_table)
-
-    # Row - Max / Pressure
-    print_table_row(str_max, value_max, str_pressure,
-                    value_pressure, half_length_table)
-
-    # End of table:
-    print("╚", end="")
-    print("═" * half_length_table, end="")
-    print("╩", end="")
-    print("═" * half_length_table, end="")
-    print("╝")
+        # End of table
+        f"╚{half_line}╩{half_line}╝",
+    ]
+
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------------------------
+# Displays a table with the weather information for the given location
+# -------------------------------------------------------------------
+def print_weather_info(observation: Observation, unit: str, location: str):
+    table = format_weather_table(observation.as_dict(), unit, location)
+    sys.stdout.write(f"{HORIZONTAL_LINE}\n{table}")
+
+
+# -------------------------------------------------------------------
+# Returns one line with the weather of a batch record, e.g.
+# "Paris,FR: 20.0°C (feels like 19.0°C), clear sky, humidity 50%,
+#  wind 3.0 meters/second, 1013 hPa"
+# -------------------------------------------------------------------
+def format_compact_line(record: dict):
+    location = record["location"] or record["query"]
+    if record["error"]:
+        return f"{location}: ERROR {record['error']}\n"
+
+    weather_symbol, wind_speed = unit_labels(record["units"])
+    return (f"{location}: {record['temp']}{weather_symbol} "
+            f"(feels like {record['feels_like']}{weather_symbol}), "
+            f"{record['description']}, humidity {record['humidity']}%, "
+            f"wind {record['wind_speed']} {wind_speed}, "
+            f"{record['pressure']} hPa\n")
+
+
+# -------------------------------------------------------------------
+# Returns one table comparing the weather of several batch records,
+# one row per location, with the same box-drawing style as the
+# weather table. Column widths adapt to the longest value.
+# -------------------------------------------------------------------
+def format_comparison_table(records: list, unit: str):
+    weather_symbol, wind_speed = unit_labels(unit)
+    headers = ["Location", "Current", "Feels like", "Min", "Max",
+               "Description", "Humidity", "Wind speed", "Pressure"]
+    # Text columns are left aligned, numbers right aligned
+    left_aligned = {0, 5}
+
+    rows = []
+    for record in records:
+        location = record["location"] or record["query"]
+        if record["error"]:
+            rows.append([location, "", "", "", "",
+                         f"ERROR {record['error']}", "", "", ""])
+            continue
+
+        rows.append([
+            location,
+            f"{record['temp']}{weather_symbol}",
+            f"{record['feels_like']}{weather_symbol}",
+            f"{record['temp_min']}{weather_symbol}",
+            f"{record['temp_max']}{weather_symbol}",
+            f"{record['description']}",
+            f"{record['humidity']}%",
+            f"{record['wind_speed']} {wind_speed}",
+            f"{record['pressure']} hPa",
+        ])
+
+    widths = [max(len(row[column]) for row in [headers] + rows)
+              for column in range(len(headers))]
+
+    def border(left: str, middle: str, right: str):
+        return (left + middle.join("═" * (width + 2) for width in widths)
+                + right)
+
+    def row_line(row: list, header: bool = False):
+        cells = []
+        for column, (value, width) in enumerate(zip(row, widths)):
+            if header:
+                cells.append(f" {value:^{width}} ")
+            elif column in left_aligned:
+                cells.append(f" {value:<{width}} ")
+            else:
+                cells.append(f" {value:>{width}} ")
+        return "║" + "║".join(cells) + "║"
+
+    lines = [border("╔", "╦", "╗"), row_line(headers, header=True),
+             border("╠", "╬", "╣")]
+    lines.extend(row_line(row) for row in rows)
+    lines.append(border("╚", "╩", "╝"))
+
+    return "\n".join(lines) + "\n"
 
 
 # -------------------------------------------------------------
-# This function returns the weather based on the given location
+# This function displays the weather of the given location
 # -------------------------------------------------------------
-def get_current_weather(lat: float, lon: float, unit: str):
+def get_current_weather(client: WeatherClient, location: Location,
+                        unit: str):
     try:
         print(HORIZONTAL_LINE)
-        print(f"Contacting Web Service to get weather for {lat}, {lon}...")
+        print(f"Getting weather for {location.lat}, {location.lon}...")
 
-        current_weather_params = {
-            'lat': lat,
-            'lon': lon,
-            'appid': API_KEY,
-            'units': unit
-        }
-
-        current_weather_response = requests.get(CURRENT_WEATHER_URL,
-                                                current_weather_params)
-
-        global weather_info
-        weather_info = json.loads(current_weather_response.text)
+        weather_info, cached, distance = client.current_weather(
+            location.lat, location.lon)
 
         if weather_info:
-            print("Connection to web service successful.")
-            print_weather_info(weather_info, unit)
+            if cached and distance >= 1:
+                print(f"Recent weather of a place {distance:.1f} km away "
+                      f"found in the local cache.")
+            elif cached:
+                print("Recent weather found in the local cache.")
+            else:
+                print("Connection to web service successful.")
+            print_weather_info(weather_info.in_units(unit), unit,
+                               location.name)
 
     except HTTPError as http_error:
         # e.g., 404 Not Found
@@ -386,6 +825,31 @@ def get_current_weather(lat: float, lon: float, unit: str):
         print(f"\nAn unexpected error occurred: \n\n{other_error}")
 
 
+# ---------------------------------------------------------
+# Builds the normalized "City,State,CC" place string. State
+# is optional; two letter states are upper cased.
+# ---------------------------------------------------------
+def format_city_place(city: str, state: str, country: str):
+    # Capitalize City, State and Country
+    if state:
+        if len(state) == 2:
+            state = state.upper()
+        else:
+            state = state.title()
+        place = ",".join([city.title(), state, country.upper()])
+    else:
+        place = ",".join([city.title(), country.upper()])
+
+    return place
+
+
+# --------------------------------------------
+# Builds the normalized "ZIP,CC" place string
+# --------------------------------------------
+def format_zip_place(zip_code: str, country: str):
+    return ",".join([zip_code, country.upper()])
+
+
 # ------------------------------------
 # Get city/state/county from the user
 # ------------------------------------
@@ -435,17 +899,7 @@ def get_city():
             print(" ----> ERROR: Please enter a valid country code only.")
             continue
 
-    # Capitalize City, State and Country
-    if state:
-        if len(state) == 2:
-            state = state.upper()
-        else:
-            state = state.title()
-        place = ",".join([city.title(), state, country.upper()])
-    else:
-        place = ",".join([city.title(), country.upper()])
-
-    return place
+    return format_city_place(city, state, country)
 
 
 # ----------------------------------
@@ -472,30 +926,29 @@ def get_zip_code():
             print(" ----> ERROR: Please enter a valid country code only.")
             continue
 
-    place = ",".join([zip_code, country.upper()])
-
-    return place
+    return format_zip_place(zip_code, country)
 
 
 # ------------------------------------
 # Main function
 # ------------------------------------
-def main():
+def main(client: WeatherClient):
+    weather_unit = DEFAULT_UNIT
+
     while True:
-        user_input = get_user_input()
+        user_input = get_user_input(weather_unit)
 
         # 1 - Change weather units
         if user_input == "1":
-            set_weather_units()
+            weather_unit = set_weather_units(weather_unit)
 
         # 2 - Lookup by City/State/County
         elif user_input == "2":
             city = get_city()
             if city:
-                coords = get_lat_lon_city(city)
-                if coords is not None:
-                    param_lat, param_lon = coords
-                    get_current_weather(param_lat, param_lon, weather_unit)
+                location = get_lat_lon_city(client, city)
+                if location is not None:
+                    get_current_weather(client, location, weather_unit)
 
                 else:
                     print(f"{HORIZONTAL_LINE}")
@@ -510,11 +963,9 @@ def main():
         elif user_input == "3":
             zip_code = get_zip_code()
             if zip_code:
-                coords = get_lat_lon_zip(zip_code)
-                if coords is not None:
-                    param_lat, param_lon = coords
-
-                    get_current_weather(param_lat, param_lon, weather_unit)
+                location = get_lat_lon_zip(client, zip_code)
+                if location is not None:
+                    get_current_weather(client, location, weather_unit)
 
                 else:
                     print(f"{HORIZONTAL_LINE}")
@@ -540,8 +991,559 @@ def main():
                   "Please enter 1, 2, 3, 4 or 5")
 
 
+# ----------------------------------------------------------------
+# Parses one line of a batch file. Accepted formats are the same
+# ones used by the menus: "City,CC", "City,State,CC" and "ZIP,CC".
+# Entries whose first field contains a digit are treated as zip
+# codes, since city names can only contain letters and spaces.
+# Returns (kind, place) or raises ValueError for invalid lines.
+# ----------------------------------------------------------------
+def parse_batch_line(line: str):
+    fields = [field.strip() for field in line.split(",")]
+
+    if len(fields) not in (2, 3) or not all(fields[:1] + fields[-1:]):
+        raise ValueError("expected City,CC, City,State,CC or ZIP,CC")
+
+    country = fields[-1]
+    if not (country.isalpha() and len(country) == 2):
+        raise ValueError(f"invalid country code '{country}'")
+
+    if any(char.isdigit() for char in fields[0]):
+        if len(fields) != 2 or not fields[0].isalnum():
+            raise ValueError(f"invalid zip code '{fields[0]}'")
+        return "zip", format_zip_place(fields[0], country)
+
+    city = fields[0]
+    state = fields[1] if len(fields) == 3 else ""
+    if not re.fullmatch(r"[a-zA-Z ]+", city):
+        raise ValueError(f"invalid city name '{city}'")
+    if state and not re.fullmatch(r"[a-zA-Z ]+", state):
+        raise ValueError(f"invalid state '{state}'")
+
+    return "city", format_city_place(city, state, country)
+
+
+# ----------------------------------------------------------------
+# Copies the fields of a WeatherReport into a batch record, with
+# the temperatures and wind speed in the given unit
+# ----------------------------------------------------------------
+def fill_weather_record(record: dict, report: WeatherReport, unit: str):
+    record["lat"] = report.location.lat
+    record["lon"] = report.location.lon
+    record["reuse_km"] = round(report.distance_km, 2)
+    record.update(report.in_units(unit).as_dict())
+
+
+# ----------------------------------------------------------------
+# Looks up one batch entry and returns a flat record with the
+# BATCH_FIELDS columns. Errors are reported in the "error" column
+# instead of stopping the whole batch.
+# ----------------------------------------------------------------
+def lookup_batch_entry(client: WeatherClient, line: str, unit: str):
+    record = dict.fromkeys(BATCH_FIELDS)
+    record["query"] = line
+    record["units"] = unit
+
+    try:
+        kind, place = parse_batch_line(line)
+        record["location"] = place
+
+        report = client.lookup(kind, place)
+
+        if report is None:
+            record["error"] = "Location not found"
+            return record
+
+        fill_weather_record(record, report, unit)
+
+    except Exception as error:
+        # Same exception classes as the interactive functions
+        # (HTTPError, ConnectionError, Timeout, ...), reported by name
+        record["error"] = f"{type(error).__name__}: {error}"
+
+    return record
+
+
+# ----------------------------------------------------------------
+# Runs the batch lookups on a bounded pool of worker threads.
+# Records are written in input order as soon as the oldest pending
+# lookup is done; at most `workers * 4` lookups are queued at a time
+# so huge inputs are streamed instead of loaded into memory.
+# ----------------------------------------------------------------
+def run_batch(client: WeatherClient, lines, unit: str, workers: int,
+              output_format: str, output):
+    # The comparison table needs every row to size its columns, so
+    # its records are collected and written at the end
+    comparison_records = []
+
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=BATCH_FIELDS)
+        writer.writeheader()
+        write_record = writer.writerow
+    elif output_format == "table":
+        def write_record(record: dict):
+            if record["error"]:
+                output.write(f"{HORIZONTAL_LINE}\n{record['query']}: "
+                             f"ERROR {record['error']}\n")
+            else:
+                output.write(f"{HORIZONTAL_LINE}\n" + format_weather_table(
+                    record, unit, record["location"]))
+    elif output_format == "compact":
+        def write_record(record: dict):
+            output.write(format_compact_line(record))
+    elif output_format == "comparison":
+        write_record = comparison_records.append
+    else:
+        def write_record(record: dict):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    max_pending = workers * 4
+    pending = deque()
+    total = 0
+    errors = 0
+
+    def flush_ready(block: bool):
+        nonlocal errors
+        while pending and (block or pending[0].done()):
+            record = pending.popleft().result()
+            if record["error"]:
+                errors += 1
+            write_record(record)
+            output.flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in lines:
+            line = line.strip()
+
+            # Skip blank lines and comments
+            if not line or line.startswith("#"):
+                continue
+
+            pending.append(pool.submit(lookup_batch_entry, client, line,
+                                       unit))
+            total += 1
+
+            if len(pending) >= max_pending:
+                # Wait for the oldest lookup before reading more input
+                pending[0].result()
+            flush_ready(block=False)
+
+        flush_ready(block=True)
+
+    if output_format == "comparison":
+        output.write(format_comparison_table(comparison_records, unit))
+
+    return total, errors
+
+
+# ------------------------------------------------------
+# Entry point for the non-interactive batch mode
+# ------------------------------------------------------
+def batch_main(client: WeatherClient, args: argparse.Namespace):
+    if args.batch == "-":
+        input_file = sys.stdin
+    else:
+        input_file = open(args.batch, encoding="utf-8")
+
+    if args.output == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(args.output, "w", encoding="utf-8", newline="")
+
+    try:
+        total, errors = run_batch(client, input_file, args.units,
+                                  args.workers, args.format, output_file)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    print(f"Batch finished: {total} locations, {errors} errors.",
+          file=sys.stderr)
+    if args.stats:
+        print(client.stats.summary(), end="", file=sys.stderr)
+
+
+# ----------------------------------------------------------------
+# Returns the names of the fields that changed between two watch
+# records. The temperature only counts as changed when it moved
+# more than temp_threshold degrees.
+# ----------------------------------------------------------------
+def changed_fields(previous: dict, current: dict, temp_threshold: float):
+    if previous is None:
+        return ["initial"]
+
+    if current["error"] or previous["error"]:
+        return [] if current["error"] == previous["error"] else ["error"]
+
+    changes = []
+    if abs(current["temp"] - previous["temp"]) > temp_threshold:
+        changes.append("temp")
+    if current["description"] != previous["description"]:
+        changes.append("description")
+
+    return changes
+
+
+# ----------------------------------------------------------------
+# Long-running watch mode.
+#
+# Every location is geocoded once, then its weather is refreshed
+# every `interval` seconds. The refreshes are spread evenly over the
+# interval (staggered) instead of all firing at the same time. Only
+# changes are written, as JSONL records with the BATCH_FIELDS plus
+# "time" and "changes": the first observation of every location,
+# temperature changes over temp_threshold, description changes and
+# new errors. Unchanged observations are skipped.
+#
+# Runs until interrupted, or for `cycles` refreshes per location.
+# ----------------------------------------------------------------
+def run_watch(client: WeatherClient, lines, unit: str, interval: float,
+              temp_threshold: float, workers: int, output, cycles: int = 0):
+    output_lock = threading.Lock()
+    last_records = {}
+    running = set()         # Locations with a refresh in progress
+
+    def emit(record: dict, changes: list):
+        record["time"] = datetime.now(timezone.utc).isoformat(
+            timespec="seconds")
+        record["changes"] = changes
+        with output_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    # Geocode every location once
+    locations = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        record = dict.fromkeys(BATCH_FIELDS)
+        record["query"] = line
+        record["units"] = unit
+        try:
+            kind, place = parse_batch_line(line)
+            record["location"] = place
+            location = client.geocode(kind, place)
+            if location is None:
+                record["error"] = "Location not found"
+            else:
+                locations.append((line, location))
+                continue
+        except Exception as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+        emit(record, ["error"])
+
+    def refresh(index: int):
+        line, location = locations[index]
+        record = dict.fromkeys(BATCH_FIELDS)
+        record["query"] = line
+        record["location"] = location.place
+        record["units"] = unit
+
+        try:
+            # Observations cached by the previous refresh of this
+            # location are too old; those shared with other (nearby)
+            # locations in this cycle can be reused
+            observation, cached, distance = client.current_weather(
+                location.lat, location.lon, max_age=interval / 2)
+            report = WeatherReport(location, observation, cached, distance)
+            fill_weather_record(record, report, unit)
+        except Exception as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+
+        changes = changed_fields(last_records.get(index), record,
+                                 temp_threshold)
+        last_records[index] = record
+        if changes:
+            emit(dict(record), changes)
+
+        with output_lock:
+            running.discard(index)
+
+    if not locations:
+        return
+
+    # (due time, refreshes done, location index)
+    start = time.monotonic()
+    step = interval / len(locations)
+    schedule = [(start + step * index, 0, index)
+                for index in range(len(locations))]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while schedule:
+            due, done, index = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            # If the previous refresh of this location is still running
+            # (e.g. held back by the rate limiter), skip this one
+            # instead of piling up requests
+            with output_lock:
+                skip = index in running
+                running.add(index)
+            if not skip:
+                pool.submit(refresh, index)
+
+            if not cycles or done + 1 < cycles:
+                heapq.heappush(schedule, (due + interval, done + 1, index))
+
+
+# ------------------------------------------------------
+# Entry point for the watch mode
+# ------------------------------------------------------
+def watch_main(client: WeatherClient, args: argparse.Namespace):
+    if args.watch == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.watch, encoding="utf-8") as input_file:
+            lines = input_file.readlines()
+
+    if args.output == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(args.output, "a", encoding="utf-8")
+
+    try:
+        run_watch(client, lines, args.units, args.interval,
+                  args.temp_threshold, args.workers, output_file,
+                  args.cycles)
+    except KeyboardInterrupt:
+        print("Watch stopped.", file=sys.stderr)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+# ----------------------------------------------------------------
+# Answers one request of the daemon mode. The parameters are
+# either q (a location in the --batch format) or lat and lon, plus
+# optional units. Returns (HTTP status, record).
+# ----------------------------------------------------------------
+def lookup_query(client: WeatherClient, params: dict, default_unit: str):
+    unit = params.get("units", default_unit)
+    if unit not in WEATHER_UNITS:
+        return 400, {"error": f"units must be one of {WEATHER_UNITS}"}
+
+    if "q" in params:
+        record = lookup_batch_entry(client, params["q"], unit)
+
+        if record["error"] is None:
+            return 200, record
+        elif record["error"] == "Location not found":
+            return 404, record
+        elif record["error"].startswith("ValueError"):
+            return 400, record
+        else:
+            # The web service failed
+            return 502, record
+
+    record = dict.fromkeys(BATCH_FIELDS)
+    record["units"] = unit
+    try:
+        lat, lon = float(params["lat"]), float(params["lon"])
+    except (KeyError, ValueError):
+        record["error"] = "Expected q=<location> or lat=<lat>&lon=<lon>"
+        return 400, record
+
+    record["query"] = record["location"] = f"{lat},{lon}"
+    location = Location("coordinates", record["query"], record["query"],
+                        lat, lon, "request")
+    try:
+        observation, cached, distance = client.current_weather(lat, lon)
+        report = WeatherReport(location, observation, cached, distance)
+        fill_weather_record(record, report, unit)
+    except Exception as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+        return 502, record
+
+    return 200, record
+
+
+# ------------------------------------------------------
+# Entry point for the daemon mode
+# ------------------------------------------------------
+def serve_main(client: WeatherClient, args: argparse.Namespace):
+    def lookup(params: dict):
+        return lookup_query(client, params, args.units)
+
+    serve(args.serve, lookup, quiet=args.quiet, stats=client.stats)
+
+
+# ------------------------------------
+# Command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Get the weather of a given city/zip code. Without "
+                    "arguments, an interactive menu is shown.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="non-interactive mode: read one location per "
+                             "line (City,State,CC or ZIP,CC) from FILE, "
+                             "or from stdin if FILE is '-'")
+    parser.add_argument("--watch", metavar="FILE",
+                        help="long-running mode: refresh the locations in "
+                             "FILE (same format as --batch) every "
+                             "--interval seconds and write only the "
+                             "changes, as JSONL")
+    parser.add_argument("--interval", type=float, metavar="SECONDS",
+                        default=WEATHER_TTL,
+                        help=f"watch mode refresh interval per location "
+                             f"(default: {WEATHER_TTL})")
+    parser.add_argument("--temp-threshold", type=float, metavar="DEGREES",
+                        default=0.5,
+                        help="watch mode: report temperature changes "
+                             "larger than DEGREES (default: 0.5)")
+    parser.add_argument("--cycles", type=int, default=0,
+                        help="watch mode: stop after this many refreshes "
+                             "per location, 0 to run until interrupted")
+    parser.add_argument("--serve", metavar="ADDRESS", nargs="?",
+                        const=DEFAULT_ADDRESS,
+                        help=f"daemon mode: serve lookups over HTTP on "
+                             f"HOST:PORT (default: {DEFAULT_ADDRESS}) or on a "
+                             f"Unix socket (unix:/path/to/socket). Use "
+                             f"WeatherLookup.py as a client.")
+    parser.add_argument("--quiet", action="store_true",
+                        help="daemon mode: don't log every request")
+    parser.add_argument("--format", choices=["jsonl", "csv", "table",
+                                             "compact", "comparison"],
+                        default="jsonl",
+                        help="batch output format: jsonl, csv, a weather "
+                             "table per location, one line per location "
+                             "(compact) or a single table comparing all "
+                             "the locations (default: jsonl)")
+    parser.add_argument("--output", metavar="FILE", default="-",
+                        help="batch output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="number of concurrent lookups in batch mode "
+                             "(default: 8)")
+    parser.add_argument("--geo-cache", metavar="FILE",
+                        default=GEOCODE_CACHE_PATH,
+                        help=f"SQLite file used to cache geocoding results "
+                             f"(default: {GEOCODE_CACHE_PATH})")
+    parser.add_argument("--no-geo-cache", action="store_true",
+                        help="always ask the web service for coordinates")
+    parser.add_argument("--gazetteer", metavar="FILE",
+                        default=GAZETTEER_PATH,
+                        help="offline gazetteer index built with "
+                             "Gazetteer.py, used before the web service")
+    parser.add_argument("--weather-ttl", type=float, metavar="SECONDS",
+                        default=WEATHER_TTL,
+                        help=f"reuse weather fetched less than SECONDS ago "
+                             f"for the same place, 0 to disable "
+                             f"(default: {WEATHER_TTL})")
+    parser.add_argument("--weather-cache", metavar="FILE",
+                        help="also keep the weather cache in this SQLite "
+                             "file, so it survives between runs")
+    parser.add_argument("--reuse-radius", type=float, metavar="KM",
+                        default=0,
+                        help="answer a lookup with recent weather of a "
+                             "place less than KM away, 0 to disable "
+                             "(default: 0)")
+    parser.add_argument("--reuse-age", type=float, metavar="SECONDS",
+                        help="only reuse weather of nearby places fetched "
+                             "less than SECONDS ago (default: --weather-ttl)")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        default=10,
+                        help="give up on a request after SECONDS without "
+                             "an answer (default: 10)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"retries on connection errors, timeouts, 429 "
+                             f"and 5xx responses (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--rate-limit", type=float, metavar="CALLS",
+                        default=DEFAULT_CALLS_PER_MINUTE,
+                        help=f"maximum calls per minute to the web service, "
+                             f"shared by all workers, 0 for no limit "
+                             f"(default: {DEFAULT_CALLS_PER_MINUTE})")
+    parser.add_argument("--stats", action="store_true",
+                        help="print request latencies, retries, errors and "
+                             "cache hit rates to stderr when a batch ends")
+    parser.add_argument("--stats-file", metavar="FILE",
+                        help="write the stats to FILE on exit, as JSON if "
+                             "FILE ends with .json, otherwise in the "
+                             "Prometheus text format")
+    parser.add_argument("--units", choices=WEATHER_UNITS,
+                        default=DEFAULT_UNIT,
+                        help=f"weather units for batch mode "
+                             f"(default: {DEFAULT_UNIT})")
+
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if sum(bool(mode) for mode in (args.batch, args.watch, args.serve)) > 1:
+        parser.error("--batch, --watch and --serve can't be used together")
+    if args.interval <= 0:
+        parser.error("--interval must be greater than 0")
+
+    return args
+
+
+# ------------------------------------------------------
+# Creates the WeatherClient from the command line options
+# ------------------------------------------------------
+def create_client(args: argparse.Namespace):
+    stats = WeatherStats()
+    transport = WeatherTransport(timeout=(3.05, args.timeout),
+                                 retries=args.retries,
+                                 pool_size=args.workers,
+                                 calls_per_minute=args.rate_limit,
+                                 stats=stats)
+
+    geocode_cache = None
+    if not args.no_geo_cache:
+        geocode_cache = GeocodeCache(args.geo_cache)
+
+    weather_cache = None
+    if args.weather_ttl > 0:
+        weather_cache = WeatherCache(ttl=args.weather_ttl,
+                                     path=args.weather_cache,
+                                     encode=Observation.to_json,
+                                     decode=Observation.from_json,
+                                     reuse_radius_km=args.reuse_radius,
+                                     reuse_max_age=args.reuse_age)
+
+    gazetteer = None
+    if args.gazetteer:
+        gazetteer = Gazetteer(args.gazetteer)
+
+    return WeatherClient(transport=transport, geocode_cache=geocode_cache,
+                         weather_cache=weather_cache, gazetteer=gazetteer,
+                         stats=stats)
+
+
+# ------------------------------------------------------
+# Writes the stats to --stats-file, if it was given
+# ------------------------------------------------------
+def write_stats_file(stats: WeatherStats, path: str):
+    if path.endswith(".json"):
+        data = stats.to_json() + "\n"
+    else:
+        data = stats.to_prometheus()
+
+    with open(path, "w", encoding="utf-8") as stats_file:
+        stats_file.write(data)
+
+
 # ---------
 # Main body
 # ---------
 if __name__ == "__main__":
-    main()
+    arguments = parse_arguments()
+    weather_client = create_client(arguments)
+
+    try:
+        if arguments.batch:
+            batch_main(weather_client, arguments)
+        elif arguments.watch:
+            watch_main(weather_client, arguments)
+        elif arguments.serve:
+            serve_main(weather_client, arguments)
+        else:
+            main(weather_client)
+    finally:
+        weather_client.close()
+        if arguments.stats_file:
+            write_stats_file(weather_client.stats, arguments.stats_file)
@@ -0,0 +1,486 @@
+# WeatherBenchmark.py
+# Purpose: Offline benchmark of the GetWeather.py lookups against a
+#          local stand-in for the OpenWeatherMap endpoints
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+#
+# The stub answers the three endpoints used by GetWeather.py (direct
+# and zip geocoding, current weather) with a configurable latency,
+# error rate and share of 429 responses. Nothing leaves the machine
+# and no API key is needed.
+#
+# The same synthetic locations are looked up in several
+# configurations:
+#   serial          one lookup at a time, no caches
+#   batch           --workers concurrent lookups, no caches
+#   cached-cold     batch with empty geocoding and weather caches
+#   cached-warm     the same locations again, with the caches filled
+#
+# Examples:
+#   python WeatherBenchmark.py --locations 200 --latency 50
+#   python WeatherBenchmark.py --error-rate 0.02 --throttle-rate 0.05
+#   python WeatherBenchmark.py --json results.json
+#   python WeatherBenchmark.py --baseline results.json --tolerance 0.25
+#
+# With --baseline the exit status is 1 if any configuration got slower
+# (throughput or p99) by more than the tolerance, or sent more
+# requests to the web service than in the baseline.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Constants:
+STUB_ENDPOINTS = {
+    "/geo/1.0/direct": "geocoding_city",
+    "/geo/1.0/zip": "geocoding_zip",
+    "/data/2.5/weather": "current_weather",
+}
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+STATES = ["NE", "IA", "KS", "MO", "CO", "SD"]
+
+# Differences smaller than these are timing noise, not regressions
+# (the warm cache runs take a few milliseconds in total)
+NOISE_SECONDS = 0.05
+NOISE_MS = 5.0
+
+
+# ------------------------------------------------------------------
+# Stable pseudo-random coordinates for a place, so every run of the
+# benchmark sees the same world
+# ------------------------------------------------------------------
+def place_coords(place: str):
+    digest = zlib.crc32(place.encode("utf-8"))
+    lat = (digest % 120_000) / 1000 - 60
+    lon = (digest // 120_000 % 360_000) / 1000 - 180
+    return round(lat, 4), round(lon, 4)
+
+
+# ------------------------------------------------------------------
+# A current weather response with every field the real service
+# sends, so decoding costs the same as in production
+# ------------------------------------------------------------------
+def weather_response(lat: float, lon: float, rng: random.Random):
+    temp = round(rng.uniform(250, 310), 2)
+    return {
+        "coord": {"lon": lon, "lat": lat},
+        "weather": [{"id": 803, "main": "Clouds",
+                     "description": "broken clouds", "icon": "04d"}],
+        "base": "stations",
+        "main": {"temp": temp, "feels_like": round(temp - 1.5, 2),
+                 "temp_min": round(temp - 2, 2),
+                 "temp_max": round(temp + 2, 2), "pressure": 1015,
+                 "humidity": rng.randint(20, 100), "sea_level": 1015,
+                 "grnd_level": 985},
+        "visibility": 10000,
+        "wind": {"speed": round(rng.uniform(0, 15), 2), "deg": 200,
+                 "gust": 8.1},
+        "clouds": {"all": 75},
+        "dt": int(time.time()),
+        "sys": {"type": 2, "id": 2004688, "country": "US",
+                "sunrise": 1760700000, "sunset": 1760740000},
+        "timezone": -18000,
+        "id": 5063805,
+        "name": "Stub",
+        "cod": 200,
+    }
+
+
+# -------------------------------------------------------------------
+# Request handler of the stub. The behaviour is read from the
+# StubServer settings; calls are counted per endpoint and status.
+# -------------------------------------------------------------------
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent in separate writes; without this the
+    # client's delayed ACK adds ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values
+                  in parse_qs(url.query).items()}
+        endpoint = STUB_ENDPOINTS.get(url.path)
+
+        if endpoint is None:
+            self.send_json(404, {"cod": "404", "message": "unknown path"})
+            return
+
+        server = self.server
+        rng = server.rng()
+        time.sleep(max(0.0, rng.gauss(server.latency, server.latency / 4)))
+
+        roll = rng.random()
+        if roll < server.throttle_rate:
+            self.send_json(429, {"cod": 429, "message": "rate limited"},
+                           {"Retry-After": str(server.retry_after)},
+                           endpoint)
+        elif roll < server.throttle_rate + server.error_rate:
+            self.send_json(500, {"cod": 500, "message": "stub error"},
+                           endpoint=endpoint)
+        elif endpoint == "geocoding_city":
+            lat, lon = place_coords(params.get("q", ""))
+            self.send_json(200, [{"name": params.get("q", "").split(",")[0],
+                                  "lat": lat, "lon": lon,
+                                  "country": "US"}], endpoint=endpoint)
+        elif endpoint == "geocoding_zip":
+            lat, lon = place_coords(params.get("zip", ""))
+            self.send_json(200, {"zip": params.get("zip", ""),
+                                 "name": "Stub", "lat": lat, "lon": lon,
+                                 "country": "US"}, endpoint=endpoint)
+        else:
+            lat = float(params.get("lat", 0))
+            lon = float(params.get("lon", 0))
+            self.send_json(200, weather_response(lat, lon, rng),
+                           endpoint=endpoint)
+
+    def send_json(self, status: int, body, headers: dict = None,
+                  endpoint: str = None):
+        if endpoint is not None:
+            self.server.count(endpoint, status)
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# -------------------------------------------------------------------
+# Local stand-in for the OpenWeatherMap endpoints, running on a
+# background thread. latency is in seconds.
+# -------------------------------------------------------------------
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # The default backlog of 5 drops connections when many workers
+    # connect at once, and each drop costs a 1 second SYN retry
+    request_queue_size = 128
+
+    def __init__(self, latency: float = 0.02, error_rate: float = 0,
+                 throttle_rate: float = 0, retry_after: int = 0,
+                 seed: int = 0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._seed = seed
+        self._requests = 0
+        self._lock = threading.Lock()
+        self.calls = {}         # (endpoint, status) -> count
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ------------------------------------------------------------
+    # One generator per request, seeded from the request number,
+    # so runs are repeatable without sharing a generator between
+    # threads
+    # ------------------------------------------------------------
+    def rng(self):
+        with self._lock:
+            self._requests += 1
+            return random.Random(self._seed * 1_000_003 + self._requests)
+
+    def count(self, endpoint: str, status: int):
+        with self._lock:
+            key = (endpoint, status)
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    # ------------------------------------------------------------
+    # Returns the calls counted so far and starts counting again
+    # ------------------------------------------------------------
+    def take_calls(self):
+        with self._lock:
+            calls, self.calls = self.calls, {}
+        return calls
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+# ------------------------------------------------------------------
+# Synthetic batch lines: a mix of "City,CC", "City,State,CC" and
+# "ZIP,CC" places, always the same for a given count
+# ------------------------------------------------------------------
+def make_locations(count: int):
+    lines = []
+    for index in range(count):
+        name = ""
+        number = index
+        while True:
+            name += LETTERS[number % 26]
+            number //= 26
+            if not number:
+                break
+
+        match index % 3:
+            case 0:
+                lines.append(f"Town {name},US")
+            case 1:
+                lines.append(f"Town {name},{STATES[index % len(STATES)]},US")
+            case _:
+                lines.append(f"{10000 + index},US")
+    return lines
+
+
+# ------------------------------------------------------------------
+# Nearest-rank percentile of a sorted list
+# ------------------------------------------------------------------
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+# ------------------------------------------------------------------
+# Looks up every line with the given client and returns the results
+# of the run. Lookups go through lookup_batch_entry(), the function
+# used by the batch mode, with `workers` threads.
+# ------------------------------------------------------------------
+def run_lookups(weather, client, lines: list, workers: int, unit: str):
+    def timed_lookup(line: str):
+        start = time.perf_counter()
+        record = weather.lookup_batch_entry(client, line, unit)
+        return time.perf_counter() - start, record
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [timed_lookup(line) for line in lines]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(timed_lookup, lines))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "lookups": len(lines),
+        "errors": sum(1 for _, record in results if record["error"]),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(lines) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+# ------------------------------------------------------------------
+# Adds the upstream calls counted by the stub to a result
+# ------------------------------------------------------------------
+def add_upstream_calls(result: dict, calls: dict, stats):
+    result["upstream_calls"] = sum(calls.values())
+    result["upstream_by_endpoint"] = {
+        endpoint: sum(count for (name, _), count in calls.items()
+                      if name == endpoint)
+        for endpoint in STUB_ENDPOINTS.values()}
+    result["throttled"] = sum(count for (_, status), count in calls.items()
+                              if status == 429)
+    result["retries"] = stats.total("weather_retries_total")
+    return result
+
+
+# ------------------------------------------------------------------
+# Runs every configuration against the stub and returns the results
+# ------------------------------------------------------------------
+def run_benchmark(args: argparse.Namespace, stub: StubServer):
+    # GetWeather reads OPENMAP_BASE_URL when it is imported, so it's
+    # imported once the stub is listening
+    os.environ["OPENMAP_BASE_URL"] = stub.base_url
+    import GetWeather as weather
+
+    lines = make_locations(args.locations)
+    results = {}
+
+    def new_client(workers: int, cache_dir: str = None):
+        stats = weather.WeatherStats()
+        transport = weather.WeatherTransport(
+            retries=args.retries, pool_size=workers,
+            calls_per_minute=args.rate_limit, stats=stats)
+        geocode_cache = None
+        weather_cache = None
+        if cache_dir is not None:
+            geocode_cache = weather.GeocodeCache(
+                os.path.join(cache_dir, "geocode_cache.sqlite3"))
+            weather_cache = weather.WeatherCache()
+        return weather.WeatherClient(api_key="benchmark",
+                                     transport=transport,
+                                     geocode_cache=geocode_cache,
+                                     weather_cache=weather_cache,
+                                     stats=stats)
+
+    for name, workers in (("serial", 1), ("batch", args.workers)):
+        client = new_client(workers)
+        stub.take_calls()
+        result = run_lookups(weather, client, lines, workers, args.units)
+        results[name] = add_upstream_calls(result, stub.take_calls(),
+                                           client.stats)
+        client.close()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = new_client(args.workers, cache_dir)
+        for name in ("cached-cold", "cached-warm"):
+            # Stats are cumulative, count the retries of this pass only
+            retries = client.stats.total("weather_retries_total")
+            stub.take_calls()
+            result = run_lookups(weather, client, lines, args.workers,
+                                 args.units)
+            results[name] = add_upstream_calls(result, stub.take_calls(),
+                                               client.stats)
+            results[name]["retries"] -= retries
+        client.close()
+
+    return results
+
+
+# ------------------------------------
+# Results as a table
+# ------------------------------------
+def format_results(results: dict):
+    lines = [f"{'Configuration':<14}{'Lookups':>9}{'Errors':>8}"
+             f"{'Lookups/s':>11}{'p50 ms':>9}{'p99 ms':>9}"
+             f"{'Upstream':>10}{'429s':>6}{'Retries':>9}"]
+    for name, result in results.items():
+        lines.append(f"{name:<14}{result['lookups']:>9}{result['errors']:>8}"
+                     f"{result['throughput']:>11.1f}{result['p50_ms']:>9.1f}"
+                     f"{result['p99_ms']:>9.1f}"
+                     f"{result['upstream_calls']:>10}"
+                     f"{result['throttled']:>6}{result['retries']:>9g}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------------------
+# Returns the regressions found against a baseline, as messages
+# ------------------------------------------------------------------
+def compare_results(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base["lookups"] != result["lookups"]:
+            continue
+
+        if (result["throughput"] < base["throughput"] * (1 - tolerance)
+                and result["seconds"] - base["seconds"] > NOISE_SECONDS):
+            regressions.append(f"{name}: throughput {result['throughput']} "
+                               f"lookups/s, baseline {base['throughput']}")
+        if (result["p99_ms"] > base["p99_ms"] * (1 + tolerance)
+                and result["p99_ms"] - base["p99_ms"] > NOISE_MS):
+            regressions.append(f"{name}: p99 {result['p99_ms']} ms, "
+                               f"baseline {base['p99_ms']}")
+        if result["upstream_calls"] > base["upstream_calls"]:
+            regressions.append(f"{name}: {result['upstream_calls']} upstream "
+                               f"calls, baseline {base['upstream_calls']}")
+    return regressions
+
+
+# ------------------------------------
+# Command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the GetWeather.py lookups against a local "
+                    "stub of the OpenWeatherMap endpoints.")
+    parser.add_argument("--locations", type=int, default=100,
+                        help="number of synthetic locations (default: 100)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="concurrent lookups in the batch and cached "
+                             "configurations (default: 8)")
+    parser.add_argument("--latency", type=float, metavar="MS", default=20,
+                        help="mean stub latency per request, in "
+                             "milliseconds (default: 20)")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="share of requests answered with a 500 "
+                             "(default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+                        help="share of requests answered with a 429 "
+                             "(default: 0)")
+    parser.add_argument("--retry-after", type=int, metavar="SECONDS",
+                        default=0,
+                        help="Retry-After sent with the 429 responses "
+                             "(default: 0)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="client retries (default: 3)")
+    parser.add_argument("--rate-limit", type=float, metavar="CALLS",
+                        default=0,
+                        help="client rate limit in calls per minute, 0 for "
+                             "no limit (default: 0)")
+    parser.add_argument("--units", default="imperial",
+                        choices=["imperial", "metric", "standard"])
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the stub's latency and errors")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="results of a previous run (--json) to "
+                             "compare with; exit with status 1 on a "
+                             "regression")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline "
+                             "(default: 0.25, i.e. 25%%)")
+
+    args = parser.parse_args()
+    if args.locations < 1 or args.workers < 1:
+        parser.error("--locations and --workers must be at least 1")
+    if args.error_rate + args.throttle_rate > 1:
+        parser.error("--error-rate + --throttle-rate can't be over 1")
+
+    return args
+
+
+# ---------
+# Main body
+# ---------
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    stub_server = StubServer(latency=arguments.latency / 1000,
+                             error_rate=arguments.error_rate,
+                             throttle_rate=arguments.throttle_rate,
+                             retry_after=arguments.retry_after,
+                             seed=arguments.seed).start()
+
+    try:
+        benchmark_results = run_benchmark(arguments, stub_server)
+    finally:
+        stub_server.shutdown()
+        stub_server.server_close()
+
+    print(format_results(benchmark_results), end="")
+
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as json_file:
+            json.dump({"settings": vars(arguments),
+                       "results": benchmark_results}, json_file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as baseline_file:
+            baseline_results = json.load(baseline_file)["results"]
+
+        found = compare_results(benchmark_results, baseline_results,
+                                arguments.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -0,0 +1,451 @@
+# WeatherCache.py
+# Purpose: Local caches used by GetWeather.py
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version: persistent geocoding cache
+# 10/18/2026 - Added TTL weather cache with single-flight requests
+# 10/18/2026 - Weather cache is unit independent
+# 10/18/2026 - Reuse of recent observations from nearby coordinates
+# 10/18/2026 - Pluggable serialization for the persistent weather cache
+# 10/18/2026 - Reuse distance only for nearby observations; max_age=0
+#              means no cached observation
+
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Constants:
+GEOCODE_TTL = 30 * 24 * 60 * 60           # 30 days, coordinates rarely move
+GEOCODE_NEGATIVE_TTL = 24 * 60 * 60       # 1 day for "not found" results
+GEOCODE_MAX_ENTRIES = 100_000
+LAST_USED_RESOLUTION = 60                 # Seconds between LRU updates
+WEATHER_TTL = 10 * 60                     # OpenWeatherMap updates ~10 min
+WEATHER_PRECISION = 2                     # Decimals kept, ~1 km
+WEATHER_MAX_ENTRIES = 10_000
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32                    # Along a meridian
+
+# Returned by the caches when a key is not cached (None is a valid,
+# cached "not found" result)
+MISS = object()
+
+
+# ------------------------------------------------------------
+# Opens a SQLite database shared by several threads. Autocommit
+# mode, WAL journal so other processes can read while we write.
+# ------------------------------------------------------------
+def open_database(path: str):
+    connection = sqlite3.connect(path, check_same_thread=False,
+                                 isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+# -------------------------------------------------------------------
+# Persistent geocoding cache backed by SQLite.
+#
+# Keys are the normalized place strings built by get_city() and
+# get_zip_code() ("Bellevue,NE,US", "68005,US"), prefixed with the
+# kind of lookup. Places that were not found are cached too (negative
+# caching) with a shorter TTL. When the cache grows over max_entries,
+# the least recently used entries are evicted.
+#
+# The cache can be shared by several threads.
+# -------------------------------------------------------------------
+class GeocodeCache:
+
+    def __init__(self, path: str, ttl: float = GEOCODE_TTL,
+                 negative_ttl: float = GEOCODE_NEGATIVE_TTL,
+                 max_entries: int = GEOCODE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self._connection = open_database(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "  key TEXT PRIMARY KEY,"
+            "  lat REAL,"
+            "  lon REAL,"
+            "  found INTEGER NOT NULL,"
+            "  created REAL NOT NULL,"
+            "  last_used REAL NOT NULL)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS geocode_last_used "
+            "ON geocode (last_used)")
+
+        self._count = self._connection.execute(
+            "SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+    # ------------------------------------------------------------
+    # Returns (lat, lon), None for a cached "not found", or MISS
+    # ------------------------------------------------------------
+    def get(self, kind: str, place: str):
+        key = f"{kind}:{place}"
+        now = time.time()
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT lat, lon, found, created, last_used FROM geocode "
+                "WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                return MISS
+
+            lat, lon, found, created, last_used = row
+            ttl = self.ttl if found else self.negative_ttl
+
+            if now - created > ttl:
+                # Expired entry
+                self._connection.execute(
+                    "DELETE FROM geocode WHERE key = ?", (key,))
+                self._count -= 1
+                return MISS
+
+            # Refresh the LRU position. To avoid a write on every hit,
+            # this is only done once per LAST_USED_RESOLUTION seconds.
+            if now - last_used > LAST_USED_RESOLUTION:
+                self._connection.execute(
+                    "UPDATE geocode SET last_used = ? WHERE key = ?",
+                    (now, key))
+
+        if not found:
+            return None
+
+        return lat, lon
+
+    # ------------------------------------------------------------
+    # Stores the coordinates for a place (None means "not found")
+    # ------------------------------------------------------------
+    def put(self, kind: str, place: str, coords):
+        key = f"{kind}:{place}"
+        now = time.time()
+
+        if coords is None:
+            lat, lon, found = None, None, 0
+        else:
+            (lat, lon), found = coords, 1
+
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO geocode "
+                "(key, lat, lon, found, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, lat, lon, found, now, now))
+
+            if cursor.rowcount:
+                self._count += 1
+            else:
+                self._connection.execute(
+                    "UPDATE geocode SET lat = ?, lon = ?, found = ?, "
+                    "created = ?, last_used = ? WHERE key = ?",
+                    (lat, lon, found, now, now, key))
+
+            if self._count > self.max_entries:
+                self._evict()
+
+    # ------------------------------------------------------------
+    # Removes the least recently used entries. Evicts 10% extra so
+    # this doesn't run again on the next insert.
+    # ------------------------------------------------------------
+    def _evict(self):
+        excess = self._count - self.max_entries + self.max_entries // 10
+        self._connection.execute(
+            "DELETE FROM geocode WHERE key IN ("
+            "  SELECT key FROM geocode ORDER BY last_used LIMIT ?)",
+            (excess,))
+        self._count = self._connection.execute(
+            "SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# ------------------------------------------------------------
+# Great-circle distance between two coordinates, in kilometers
+# ------------------------------------------------------------
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (math.sin(d_phi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# -------------------------------------------------------------------
+# Grid index over coordinates, used to find the nearest cached
+# observation. The world is split in square cells of `cell_km` along
+# the meridians; a search only looks at the cells that can contain a
+# point within the radius. Not thread-safe, WeatherCache locks it.
+# -------------------------------------------------------------------
+class SpatialIndex:
+
+    def __init__(self, cell_km: float):
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self._cells = {}        # (row, column) -> set of keys
+        self._points = {}       # key -> (lat, lon)
+
+    def _cell(self, lat: float, lon: float):
+        return (math.floor(lat / self.cell_degrees),
+                math.floor(lon / self.cell_degrees))
+
+    def add(self, key: str, lat: float, lon: float):
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(key)
+
+    def remove(self, key: str):
+        point = self._points.pop(key, None)
+        if point is not None:
+            cell = self._cell(*point)
+            self._cells[cell].discard(key)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    # ------------------------------------------------------------
+    # Returns (key, distance) of the nearest point within radius_km
+    # for which accept(key) is true, or None
+    # ------------------------------------------------------------
+    def nearest(self, lat: float, lon: float, radius_km: float, accept):
+        row, column = self._cell(lat, lon)
+        rows = math.ceil(radius_km / KM_PER_DEGREE / self.cell_degrees)
+
+        # A degree of longitude gets shorter towards the poles, so
+        # more columns are needed to cover the same distance
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        columns = math.ceil(rows / cos_lat)
+
+        best = None
+        for cell_row in range(row - rows, row + rows + 1):
+            for cell_column in range(column - columns, column + columns + 1):
+                for key in self._cells.get((cell_row, cell_column), ()):
+                    distance = distance_km(lat, lon, *self._points[key])
+                    if (distance <= radius_km
+                            and (best is None or distance < best[1])
+                            and accept(key)):
+                        best = (key, distance)
+
+        return best
+
+
+# -------------------------------------------------------------------
+# A lookup that is in progress. Threads asking for the same key wait
+# on it instead of sending their own request.
+# -------------------------------------------------------------------
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# -------------------------------------------------------------------
+# Weather cache with a freshness TTL.
+#
+# Observations are kept in memory (LRU, max_entries) and, if a path
+# is given, in a SQLite file so they survive between runs (stored
+# with encode() and read back with decode(), JSON by default). Keys are
+# the coordinates rounded to `precision` decimals. Observations are
+# stored in the canonical unit, so one entry serves every unit.
+#
+# get_or_fetch() collapses concurrent requests for the same key into
+# a single call to the web service (single-flight): the first thread
+# fetches, the others wait for its result.
+#
+# With reuse_radius_km > 0, a miss is first answered with the nearest
+# observation within that radius that is at most reuse_max_age
+# seconds old (defaults to the TTL). Weather doesn't change much over
+# a few kilometers, so nearby zip codes can share one request.
+# -------------------------------------------------------------------
+class WeatherCache:
+
+    def __init__(self, ttl: float = WEATHER_TTL,
+                 precision: int = WEATHER_PRECISION,
+                 max_entries: int = WEATHER_MAX_ENTRIES,
+                 path: str = None, reuse_radius_km: float = 0,
+                 reuse_max_age: float = None, encode=json.dumps,
+                 decode=json.loads):
+        self.ttl = ttl
+        self.precision = precision
+        self.max_entries = max_entries
+        self.reuse_radius_km = reuse_radius_km
+        self.reuse_max_age = (ttl if reuse_max_age is None
+                              else min(reuse_max_age, ttl))
+        self.encode = encode
+        self.decode = decode
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # key -> (stored_at, weather)
+        self._flights = {}                  # key -> _Flight
+        self._connection = None
+        self._spatial = None
+
+        if reuse_radius_km > 0:
+            self._spatial = SpatialIndex(reuse_radius_km)
+
+        if path:
+            self._connection = open_database(path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS weather ("
+                "  key TEXT PRIMARY KEY,"
+                "  data TEXT NOT NULL,"
+                "  stored_at REAL NOT NULL)")
+            # Stale observations are never served, drop them
+            self._connection.execute(
+                "DELETE FROM weather WHERE stored_at < ?",
+                (time.time() - ttl,))
+
+    def make_key(self, lat: float, lon: float):
+        return f"{round(lat, self.precision)},{round(lon, self.precision)}"
+
+    @staticmethod
+    def key_coords(key: str):
+        lat, lon = key.split(",")
+        return float(lat), float(lon)
+
+    # ------------------------------------------------------------
+    # Returns a fresh cached observation, or MISS
+    # ------------------------------------------------------------
+    def get(self, lat: float, lon: float):
+        key = self.make_key(lat, lon)
+        with self._lock:
+            return self._get_locked(key, time.time())
+
+    def _get_locked(self, key: str, now: float, max_age: float = None):
+        entry = self._entries.get(key)
+
+        if entry is None and self._connection is not None:
+            row = self._connection.execute(
+                "SELECT stored_at, data FROM weather WHERE key = ?",
+                (key,)).fetchone()
+            if row is not None:
+                entry = (row[0], self.decode(row[1]))
+                self._store_in_memory(key, entry)
+
+        if entry is None:
+            return MISS
+
+        if now - entry[0] > (self.ttl if max_age is None
+                             else min(self.ttl, max_age)):
+            # Stale observation. It's replaced on the next fetch.
+            return MISS
+
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, lat: float, lon: float, weather: dict):
+        key = self.make_key(lat, lon)
+        with self._lock:
+            self._put_locked(key, weather, time.time())
+
+    def _put_locked(self, key: str, weather: dict, now: float):
+        self._store_in_memory(key, (now, weather))
+
+        if self._connection is not None:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO weather (key, data, stored_at) "
+                "VALUES (?, ?, ?)", (key, self.encode(weather), now))
+
+    def _store_in_memory(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if self._spatial is not None:
+            self._spatial.add(key, *self.key_coords(key))
+
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._spatial is not None:
+                self._spatial.remove(evicted)
+
+    # ------------------------------------------------------------
+    # Returns (weather, distance) for the nearest observation that
+    # can be reused, or MISS
+    # ------------------------------------------------------------
+    def _get_nearby_locked(self, lat: float, lon: float, now: float,
+                           max_age: float = None):
+        if self._spatial is None:
+            return MISS
+
+        max_age = (self.reuse_max_age if max_age is None
+                   else min(self.reuse_max_age, max_age))
+
+        def is_recent(key: str):
+            return now - self._entries[key][0] <= max_age
+
+        nearest = self._spatial.nearest(lat, lon, self.reuse_radius_km,
+                                        is_recent)
+        if nearest is None:
+            return MISS
+
+        key, distance = nearest
+        self._entries.move_to_end(key)
+        return self._entries[key][1], distance
+
+    # ------------------------------------------------------------
+    # Returns (weather, cached, distance_km), where distance_km is
+    # how far a reused nearby observation is from the requested
+    # coordinates, and 0.0 for the observation of the same key.
+    # On a miss, fetch(lat, lon) is called once per key, even if
+    # several threads ask for it at the same time. Exceptions raised
+    # by fetch are re-raised in every waiting thread and nothing is
+    # cached. max_age, when given, makes cached observations older
+    # than that many seconds count as a miss.
+    # ------------------------------------------------------------
+    def get_or_fetch(self, lat: float, lon: float, fetch,
+                     max_age: float = None):
+        key = self.make_key(lat, lon)
+
+        with self._lock:
+            now = time.time()
+            weather = self._get_locked(key, now, max_age)
+            if weather is not MISS:
+                return weather, True, 0.0
+
+            nearby = self._get_nearby_locked(lat, lon, now, max_age)
+            if nearby is not MISS:
+                return nearby[0], True, nearby[1]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True, 0.0
+
+        try:
+            flight.result = fetch(lat, lon)
+            with self._lock:
+                self._put_locked(key, flight.result, time.time())
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result, False, 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
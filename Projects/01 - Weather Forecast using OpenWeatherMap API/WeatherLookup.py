@@ -0,0 +1,109 @@
+# WeatherLookup.py
+# Purpose: Thin client for the GetWeather.py daemon mode (--serve)
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+#
+# Only uses the standard library, so it starts fast. All the lookups
+# of one invocation share a single keep-alive connection.
+#
+# Examples:
+#   python WeatherLookup.py "Bellevue,NE,US" "68005,US"
+#   python WeatherLookup.py --units metric --server unix:/tmp/weather.sock Paris,FR
+#   python WeatherLookup.py --coordinates 41.14 -95.89
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from urllib.parse import urlencode
+
+# Constants:
+DEFAULT_SERVER = os.getenv("WEATHER_SERVER", "127.0.0.1:8765")
+UNIX_PREFIX = "unix:"
+TIMEOUT = 60
+
+
+# ------------------------------------------------------
+# HTTP connection over a Unix socket
+# ------------------------------------------------------
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str, timeout: float = TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connect(server: str):
+    if server.startswith(UNIX_PREFIX):
+        return UnixHTTPConnection(server[len(UNIX_PREFIX):])
+    host, _, port = server.rpartition(":")
+    return http.client.HTTPConnection(host or "127.0.0.1", int(port),
+                                      timeout=TIMEOUT)
+
+
+# ------------------------------------------------------
+# Sends one lookup, returns (HTTP status, record)
+# ------------------------------------------------------
+def lookup(connection, params: dict):
+    connection.request("GET", "/weather?" + urlencode(params))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Look up the weather through a running "
+                    "'GetWeather.py --serve'. Prints one JSON record "
+                    "per location.")
+    parser.add_argument("locations", nargs="*",
+                        help="City,State,CC or ZIP,CC. Read from stdin if "
+                             "none is given.")
+    parser.add_argument("--coordinates", nargs=2, type=float,
+                        metavar=("LAT", "LON"),
+                        help="look up coordinates instead of locations")
+    parser.add_argument("--units", choices=["imperial", "metric",
+                                            "standard"],
+                        help="units (default: the server's)")
+    parser.add_argument("--server", default=DEFAULT_SERVER,
+                        help=f"HOST:PORT or unix:/path/to/socket "
+                             f"(default: {DEFAULT_SERVER}, or the "
+                             f"WEATHER_SERVER environment variable)")
+    args = parser.parse_args()
+
+    extra = {"units": args.units} if args.units else {}
+    if args.coordinates:
+        queries = [{"lat": args.coordinates[0],
+                    "lon": args.coordinates[1], **extra}]
+    else:
+        locations = args.locations or (line.strip() for line in sys.stdin)
+        queries = [{"q": location, **extra}
+                   for location in locations if location]
+
+    connection = connect(args.server)
+    failed = False
+
+    try:
+        for query in queries:
+            status, record = lookup(connection, query)
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+            failed = failed or status != 200
+    except (ConnectionError, OSError) as connection_error:
+        print(f"Could not reach the weather server at {args.server}: "
+              f"{connection_error}", file=sys.stderr)
+        sys.exit(2)
+    finally:
+        connection.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
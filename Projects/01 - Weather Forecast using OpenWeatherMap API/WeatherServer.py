@@ -0,0 +1,124 @@
+# WeatherServer.py
+# Purpose: Local HTTP server used by the GetWeather.py daemon mode
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Added /metrics (Prometheus text, or JSON with
+#              ?format=json)
+#
+# The server only deals with HTTP. The lookups are done by the
+# handler function given by GetWeather.py, so every request shares
+# the same WeatherClient (caches, connection pool, rate limiter).
+
+import json
+import os
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlsplit
+
+# Constants:
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+UNIX_PREFIX = "unix:"
+
+
+# -------------------------------------------------------------------
+# Request handler. GET /weather?<query> calls the lookup function
+# with the query parameters, which returns (status, record); the
+# record is sent back as JSON. GET /health is a liveness check and
+# GET /metrics returns the client's WeatherStats.
+# -------------------------------------------------------------------
+class WeatherRequestHandler(BaseHTTPRequestHandler):
+
+    # Keep-alive, so a client can send several lookups on one connection
+    protocol_version = "HTTP/1.1"
+    server_version = "GetWeather"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+
+        if url.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif url.path == "/metrics" and self.server.stats is not None:
+            if parse_qs(url.query).get("format") == ["json"]:
+                self.send_json(200, self.server.stats.snapshot())
+            else:
+                self.send_text(200, self.server.stats.to_prometheus(),
+                               "text/plain; version=0.0.4")
+        elif url.path == "/weather":
+            # Only the first value of each parameter is used
+            params = {name: values[0] for name, values
+                      in parse_qs(url.query).items()}
+            status, record = self.server.lookup(params)
+            self.send_json(status, record)
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def send_json(self, status: int, body: dict):
+        self.send_text(status, json.dumps(body, ensure_ascii=False),
+                       "application/json")
+
+    def send_text(self, status: int, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Unix socket clients don't have an address
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    # Called by BaseHTTPRequestHandler, not set by UnixStreamServer
+    server_name = "localhost"
+    server_port = 0
+
+
+# ------------------------------------------------------------------
+# Creates the server for "host:port" or "unix:/path/to/socket".
+# A stale socket file left by a previous run is removed.
+# ------------------------------------------------------------------
+def create_server(address: str, lookup, quiet: bool = False, stats=None):
+    if address.startswith(UNIX_PREFIX):
+        path = address[len(UNIX_PREFIX):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = ThreadingUnixHTTPServer(path, WeatherRequestHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)),
+                                     WeatherRequestHandler)
+        server.daemon_threads = True
+
+    server.lookup = lookup
+    server.quiet = quiet
+    server.stats = stats
+    return server
+
+
+# ------------------------------------------------------------------
+# Runs the server until it's interrupted
+# ------------------------------------------------------------------
+def serve(address: str, lookup, quiet: bool = False, stats=None):
+    server = create_server(address, lookup, quiet, stats)
+    print(f"Serving weather lookups on {address} (Ctrl+C to stop)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+    finally:
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            os.remove(server.server_address)
@@ -0,0 +1,231 @@
+# WeatherStats.py
+# Purpose: Latency histograms and counters for the weather client
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+#
+# WeatherTransport records the time of every request to the web
+# service, retries and rate limiter waits; WeatherClient records cache
+# hits/misses and errors. The numbers can be exported as Prometheus
+# text (GetWeather.py --serve exposes them on /metrics), as a JSON
+# snapshot, or printed as a short summary (--stats).
+
+import json
+import threading
+from bisect import bisect_left
+
+# Constants:
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LATENCY_METRIC = "weather_request_duration_seconds"
+LATENCY_HELP = "Time of each HTTP request to the web service"
+
+# Counters: name -> help text
+COUNTERS = {
+    "weather_retries_total":
+        "Requests retried, by endpoint and reason (status code or "
+        "exception class)",
+    "weather_errors_total":
+        "Lookups that failed, by operation and exception class",
+    "weather_cache_requests_total":
+        "Cache lookups, by cache and result (hit or miss)",
+    "weather_ratelimit_waits_total":
+        "Requests delayed by the client-side rate limiter",
+    "weather_ratelimit_wait_seconds_total":
+        "Time spent waiting for the client-side rate limiter",
+}
+
+
+# -------------------------------------------------------------------
+# Latency histogram with fixed buckets, like a Prometheus histogram.
+# Not thread-safe, WeatherStats locks it.
+# -------------------------------------------------------------------
+class Histogram:
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # ------------------------------------------------------------
+    # Estimates the q quantile (0 to 1) by linear interpolation
+    # inside the bucket that contains it, the same way Prometheus'
+    # histogram_quantile() does. Values over the last bucket are
+    # reported as the last bound.
+    # ------------------------------------------------------------
+    def quantile(self, q: float):
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+
+        return self.buckets[-1]
+
+    # Cumulative counts, as exported to Prometheus
+    def cumulative(self):
+        total = 0
+        result = []
+        for bucket_count in self.counts:
+            total += bucket_count
+            result.append(total)
+        return result
+
+
+# ------------------------------------------------------------------
+# Formats labels as {name="value",...} for the Prometheus text format
+# ------------------------------------------------------------------
+def format_labels(labels: dict):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = (str(value).replace("\\", "\\\\").replace('"', '\\"')
+                 .replace("\n", "\\n"))
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# -------------------------------------------------------------------
+# Thread-safe collection of latency histograms (one per endpoint) and
+# labeled counters (see COUNTERS).
+# -------------------------------------------------------------------
+class WeatherStats:
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}          # endpoint -> Histogram
+        self._counters = {}         # (name, labels tuple) -> value
+
+    def observe(self, endpoint: str, seconds: float):
+        with self._lock:
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    # ------------------------------------------------------------
+    # Returns the value of a counter, summed over the labels that
+    # are not given
+    # ------------------------------------------------------------
+    def total(self, name: str, **labels):
+        with self._lock:
+            return sum(value for (counter, key), value
+                       in self._counters.items()
+                       if counter == name
+                       and labels.items() <= dict(key).items())
+
+    # ------------------------------------------------------------
+    # JSON-serializable copy of every histogram and counter
+    # ------------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            latency = {}
+            for endpoint, histogram in sorted(self._latency.items()):
+                bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+                latency[endpoint] = {
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "p50": round(histogram.quantile(0.5), 6),
+                    "p99": round(histogram.quantile(0.99), 6),
+                    "buckets": dict(zip(bounds, histogram.cumulative())),
+                }
+
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value})
+
+        return {"latency_seconds": latency, "counters": counters}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # ------------------------------------------------------------
+    # Prometheus text exposition format
+    # ------------------------------------------------------------
+    def to_prometheus(self):
+        lines = [f"# HELP {LATENCY_METRIC} {LATENCY_HELP}",
+                 f"# TYPE {LATENCY_METRIC} histogram"]
+
+        with self._lock:
+            for endpoint, histogram in sorted(self._latency.items()):
+                bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.cumulative()):
+                    labels = format_labels({"endpoint": endpoint,
+                                            "le": bound})
+                    lines.append(f"{LATENCY_METRIC}_bucket{labels} {count}")
+                labels = format_labels({"endpoint": endpoint})
+                lines.append(f"{LATENCY_METRIC}_sum{labels} {histogram.sum}")
+                lines.append(f"{LATENCY_METRIC}_count{labels} "
+                             f"{histogram.count}")
+
+            for name, help_text in COUNTERS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(
+                        self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{name}{format_labels(dict(labels))} "
+                                     f"{value}")
+
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------
+    # Short human readable summary, printed by --stats
+    # ------------------------------------------------------------
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"{'Endpoint':<20}{'Requests':>10}{'Mean ms':>10}"
+                 f"{'p50 ms':>10}{'p99 ms':>10}"]
+
+        for endpoint, latency in snapshot["latency_seconds"].items():
+            mean = latency["sum"] / latency["count"] * 1000
+            lines.append(f"{endpoint:<20}{latency['count']:>10}"
+                         f"{mean:>10.1f}{latency['p50'] * 1000:>10.1f}"
+                         f"{latency['p99'] * 1000:>10.1f}")
+
+        def breakdown(name: str, label: str):
+            parts = [f"{entry['labels'][label]} {entry['value']:g}"
+                     for entry in snapshot["counters"].get(name, [])]
+            return f" ({', '.join(parts)})" if parts else ""
+
+        lines.append(f"Retries: {self.total('weather_retries_total'):g}"
+                     f"{breakdown('weather_retries_total', 'reason')}")
+        lines.append(f"Errors: {self.total('weather_errors_total'):g}"
+                     f"{breakdown('weather_errors_total', 'error')}")
+
+        for cache in ("gazetteer", "geocode", "weather"):
+            hits = self.total("weather_cache_requests_total", cache=cache,
+                              result="hit")
+            misses = self.total("weather_cache_requests_total", cache=cache,
+                                result="miss")
+            if hits or misses:
+                lines.append(f"{cache.title()} cache: {hits:g} hits, "
+                             f"{misses:g} misses "
+                             f"({hits / (hits + misses):.0%} hit rate)")
+
+        waits = self.total("weather_ratelimit_waits_total")
+        wait_time = self.total("weather_ratelimit_wait_seconds_total")
+        lines.append(f"Rate limiter: {waits:g} waits, {wait_time:.1f} s "
+                     f"waiting")
+
+        return "\n".join(lines) + "\n"
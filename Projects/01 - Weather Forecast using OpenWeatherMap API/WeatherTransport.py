@@ -0,0 +1,171 @@
+# WeatherTransport.py
+# Purpose: Shared HTTP transport used by GetWeather.py
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version: pooled session, timeouts, retries and
+#              client-side rate limiter
+# 10/18/2026 - Request latency, retries and rate limiter waits are
+#              recorded in an optional WeatherStats
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+# Constants:
+DEFAULT_TIMEOUT = (3.05, 10)              # (connect, read) seconds
+DEFAULT_RETRIES = 3
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CALLS_PER_MINUTE = 60             # OpenWeatherMap free plan
+BACKOFF_BASE = 0.5                        # Seconds, doubled on each retry
+BACKOFF_MAX = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# -------------------------------------------------------------------
+# Token bucket rate limiter shared by every thread using a transport.
+#
+# Tokens are added at calls_per_minute / 60 per second, up to `burst`
+# tokens. Each request takes one token; when the bucket is empty the
+# caller sleeps until the next token is due.
+# -------------------------------------------------------------------
+class TokenBucket:
+
+    def __init__(self, calls_per_minute: float, burst: int = None):
+        self.rate = calls_per_minute / 60
+        # A small burst keeps the first minute close to the quota too
+        self.capacity = burst or max(1, int(calls_per_minute // 10))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # Takes one token, waiting if needed. Returns the seconds spent
+    # waiting.
+    # ------------------------------------------------------------
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens
+                               + (now - self._updated) * self.rate)
+            self._updated = now
+
+            # Reserve the token now, even if it's not available yet,
+            # so that waiting threads are served in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+
+# -------------------------------------------------------------------
+# HTTP transport for the OpenWeatherMap endpoints.
+#
+# - One requests.Session with a keep-alive connection pool, so
+#   consecutive requests reuse the same TCP/TLS connection
+# - A timeout on every request, so a stalled server can't hang the
+#   program
+# - Retries with exponential backoff (and jitter) on connection
+#   errors, timeouts, 429 and 5xx responses. Retry-After is honored.
+# - An optional TokenBucket holding every thread to the API quota
+# - An optional WeatherStats recording the time of every request,
+#   the retries and the rate limiter waits, per endpoint
+#
+# get() returns the last response once the retries are exhausted, so
+# the caller still decides what to do with an error status.
+# -------------------------------------------------------------------
+class WeatherTransport:
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 calls_per_minute: float = DEFAULT_CALLS_PER_MINUTE,
+                 stats=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.stats = stats
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if calls_per_minute:
+            self.limiter = TokenBucket(calls_per_minute)
+        else:
+            self.limiter = None
+
+    # ------------------------------------------------------------
+    # Seconds to wait before retry number `attempt` (0 based)
+    # ------------------------------------------------------------
+    @staticmethod
+    def backoff(attempt: int, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(int(retry_after), BACKOFF_MAX)
+
+        delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1)
+
+    # ------------------------------------------------------------
+    # Sends a GET request. `endpoint` names the endpoint in the
+    # stats (default: the URL path).
+    # ------------------------------------------------------------
+    def get(self, url: str, params: dict, endpoint: str = None):
+        endpoint = endpoint or urlsplit(url).path
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                wait = self.limiter.acquire()
+                if wait > 0 and self.stats is not None:
+                    self.stats.increment("weather_ratelimit_waits_total")
+                    self.stats.increment(
+                        "weather_ratelimit_wait_seconds_total", wait)
+
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params,
+                                            timeout=self.timeout)
+            except (ConnectionError, Timeout) as error:
+                self.record(endpoint, start, attempt, type(error).__name__)
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if (response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= self.retries):
+                self.record(endpoint, start)
+                return response
+
+            self.record(endpoint, start, attempt,
+                        str(response.status_code))
+            time.sleep(self.backoff(attempt, response))
+            attempt += 1
+
+    # ------------------------------------------------------------
+    # Records the time of a request and, when `retry_reason` is
+    # given and there are retries left, a retry
+    # ------------------------------------------------------------
+    def record(self, endpoint: str, start: float, attempt: int = 0,
+               retry_reason: str = None):
+        if self.stats is None:
+            return
+
+        self.stats.observe(endpoint, time.perf_counter() - start)
+        if retry_reason is not None and attempt < self.retries:
+            self.stats.increment("weather_retries_total", endpoint=endpoint,
+                                 reason=retry_reason)
+
+    def close(self):
+        self.session.close()
@@ -1,13 +1,25 @@
 import streamlit as st
-from langchain.document_loaders import WikipediaLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 import os
+import threading
+import time
+
+from RAGIndex import manifest_version, open_store
+from RAGIngest import (CHECKPOINT_FILE, Checkpoint, IngestPipeline,
+                       record_run, wikipedia_sources)
+from RAGEmbeddings import CachedEmbeddings, EmbeddingCache
+from RAGVectorIndex import VectorIndex
+from RAGHybrid import BM25Index, HybridRetriever
+from RAGAnswerCache import AnswerCache
+from RAGStream import StreamingQA
+from RAGContext import ContextRetriever
+from RAGTimings import (RAGTimings, TimedEmbeddings, TimingCallbackHandler,
+                        write_timings_file)
 
 load_dotenv()
 
@@ -21,49 +33,162 @@ st.set_page_config(
 # Model to be used
 GPT_MODEL = "gpt-5"
 
+# Vector store and chunking settings
+COLLECTION_NAME = "DayoftheDead-Embeddings"
+PERSIST_DIRECTORY = "Wiki_DDM"
+CHUNK_SIZE = 100
+CHUNK_OVERLAP = 20
+
+# Wikipedia articles indexed by the app, separated by ";". The store can
+# hold other documents too, indexed with RAGIngest.py; with RAG_WIKIPEDIA
+# empty, the app answers from those only
+WIKIPEDIA_QUERIES = [
+    query.strip()
+    for query in os.getenv("RAG_WIKIPEDIA", "Day of the Dead").split(";")
+    if query.strip()
+]
+
+# Embeddings are cached on disk, so re-indexing and repeated questions
+# don't call the embeddings API again
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE", "embedding_cache.sqlite3")
+
+# Retriever backend: "chroma", or "numpy" for the in-process index
+# exported from the Chroma store. RAG_VECTOR_DTYPE: float16 (default),
+# float32, or int8 / pq to keep only compressed codes in memory
+RETRIEVER_BACKEND = os.getenv("RAG_RETRIEVER", "chroma")
+VECTOR_INDEX_DIRECTORY = os.path.join(PERSIST_DIRECTORY, "numpy_index")
+VECTOR_INDEX_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float16")
+
+# Retrieval: "hybrid" (BM25 keywords + vectors), "vector" or "lexical"
+# (keywords only, no embeddings call per question)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL", "hybrid")
+
+# Answers are shared by all users and matched by the normalized text of
+# the question. Opt-in: questions also reuse the answer of a cached
+# question whose embedding is at least this similar (e.g. 0.98). Different
+# questions can be close with ada-002, so 0 (text only) is the default
+ANSWER_SIMILARITY = float(os.getenv("RAG_ANSWER_SIMILARITY", "0"))
+
+# Retrieved chunks are merged (consecutive chunks of a source become one
+# passage without the repeated overlap) and cut to this many tokens
+# (0 sends the chunks as they are)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "1000"))
+
+# Show the answer as it is generated (0 waits for the full answer)
+STREAM_ANSWERS = os.getenv("RAG_STREAMING", "1") != "0"
+
+# Stage timings are shown in the sidebar; with RAG_TIMINGS_FILE they are
+# also written after every answer (JSON if it ends in .json, otherwise
+# Prometheus text for a node_exporter textfile collector)
+TIMINGS_FILE = os.getenv("RAG_TIMINGS_FILE")
+
+# Answered in the background at startup, so their buttons are instant
+EXAMPLE_QUESTIONS = [
+    "What is the origin of the Day of the Dead?",
+    "How is Day of the Dead celebrated?",
+    "What are the traditional symbols of Day of the Dead?",
+    "When is Day of the Dead observed?"
+]
+
 # Initialize session state for storing the vector store
 if 'vector_store_ready' not in st.session_state:
     st.session_state.vector_store_ready = False
 
 @st.cache_resource
-def load_and_process_documents(search_term):
+def load_timings():
 
-    with st.spinner('Loading Wikipedia article...'):
-        docs = WikipediaLoader(query=search_term, load_max_docs=1).load()
-    
-    with st.spinner('Splitting text into chunks...'):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=100,
-            chunk_overlap=20,
-            length_function=len,
-            is_separator_regex=False,
-        )
-        data = text_splitter.split_documents(docs)
-    
-    with st.spinner('Creating embeddings and vector store...'):
-        embeddings = OpenAIEmbeddings()
-        store = Chroma.from_documents(
-            data, 
-            embeddings, 
-            ids=[f"{item.metadata['source']}-{index}" for index, item in enumerate(data)],
-            collection_name="DayoftheDead-Embeddings", 
-            persist_directory='Wiki_DDM',
-        )
+    return RAGTimings()
+
+def export_timings(timings):
+
+    if TIMINGS_FILE:
+        write_timings_file(timings, TIMINGS_FILE)
+
+@st.cache_resource
+def load_and_process_documents(queries):
+
+    timings = load_timings()
+    embeddings = TimedEmbeddings(
+        CachedEmbeddings(OpenAIEmbeddings(),
+                         EmbeddingCache(EMBEDDING_CACHE_PATH)),
+        timings)
+    with timings.span("open_store"):
+        store = open_store(COLLECTION_NAME, PERSIST_DIRECTORY, embeddings)
+
+    # The articles go through RAGIngest's pipeline, with its checkpoint:
+    # an article is only downloaded again once its checkpoint is older
+    # than RAG_REFRESH_INTERVAL or the chunk settings changed, only the
+    # chunks that changed are embedded, and the documents RAGIngest.py
+    # added to the store are left as they are
+    settings = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    messages = []
+    pipeline = IngestPipeline(
+        store, text_splitter,
+        Checkpoint(os.path.join(PERSIST_DIRECTORY, CHECKPOINT_FILE),
+                   settings),
+        progress=messages.append, timings=timings)
+
+    with st.spinner('Indexing Wikipedia articles...'):
+        totals = pipeline.run(wikipedia_sources(list(queries)))
+        record_run(store, PERSIST_DIRECTORY, COLLECTION_NAME, settings,
+                   totals)
+    export_timings(timings)
+
+    if store._collection.count() == 0:
+        raise RuntimeError("The vector store is empty. "
+                           + " ".join(messages))
+    if totals.get("failed"):
+        # The articles indexed before are still in the store
+        st.warning(" ".join(messages))
     
     return store
 
 @st.cache_resource
-def create_qa_chain(_store):
+def load_vector_index(_store):
+
+    with st.spinner('Loading vector index...'):
+        index = VectorIndex.open_or_build(_store, VECTOR_INDEX_DIRECTORY,
+                                          VECTOR_INDEX_DTYPE)
 
-    template = """You are a bot that answers questions about Day of the Dead, using only the context provided.
+    return index
+
+@st.cache_resource
+def load_retriever(_store):
+
+    if RETRIEVAL_MODE == "vector":
+        retriever = _store.as_retriever()
+    else:
+        with st.spinner('Building keyword index...'):
+            lexical = BM25Index.from_store(_store)
+        retriever = HybridRetriever.from_store(
+            _store, lexical, lexical_only=RETRIEVAL_MODE == "lexical",
+            timings=load_timings())
+
+    if CONTEXT_TOKEN_BUDGET > 0:
+        retriever = ContextRetriever(retriever=retriever,
+                                     token_budget=CONTEXT_TOKEN_BUDGET,
+                                     model=GPT_MODEL)
+
+    return retriever
+
+QA_TEMPLATE = """You are a bot that answers questions about Day of the Dead, using only the context provided.
 If you don't know the answer, simply state that you don't know.
 
 {context}
 
 Question: {question}"""
-    
+
+@st.cache_resource
+def create_qa_chain(_retriever):
+
     PROMPT = PromptTemplate(
-        template=template, input_variables=["context", "question"]
+        template=QA_TEMPLATE, input_variables=["context", "question"]
     )
     
     llm = ChatOpenAI(temperature=0, model=GPT_MODEL)
@@ -71,13 +196,99 @@ Question: {question}"""
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=_store.as_retriever(),
+        retriever=_retriever,
         chain_type_kwargs={"prompt": PROMPT},
         return_source_documents=False,
     )
     
     return qa_chain
 
+@st.cache_resource
+def create_streaming_qa(_retriever):
+
+    PROMPT = PromptTemplate(
+        template=QA_TEMPLATE, input_variables=["context", "question"]
+    )
+
+    llm = ChatOpenAI(temperature=0, model=GPT_MODEL)
+
+    return StreamingQA(_retriever, llm, PROMPT)
+
+@st.cache_resource
+def load_answer_cache(_store):
+
+    # Embedding the question is only worth it when retrieval embeds it
+    # too (the embedding is cached and reused by the retriever). Timed
+    # apart, or the retriever's cached embedding would count as a second
+    # query_embedding of every question
+    embed = None
+    if ANSWER_SIMILARITY > 0 and RETRIEVAL_MODE != "lexical":
+        embed = TimedEmbeddings(_store.embeddings.embeddings, load_timings(),
+                                "answer_cache_embedding").embed_query
+
+    # The manifest is rewritten whenever the store changes, so the cache
+    # doesn't have to read the whole store to notice it
+    return AnswerCache(fingerprint=lambda: manifest_version(
+                           PERSIST_DIRECTORY, COLLECTION_NAME),
+                       embed=embed, threshold=ANSWER_SIMILARITY)
+
+@st.cache_resource
+def warm_answer_cache(_answer_cache, _qa_chain):
+
+    handler = TimingCallbackHandler(load_timings(), GPT_MODEL)
+    thread = threading.Thread(
+        target=_answer_cache.warm,
+        args=(EXAMPLE_QUESTIONS,
+              lambda question: _qa_chain.invoke(
+                  {"query": question},
+                  config={"callbacks": [handler]})['result']),
+        daemon=True)
+    thread.start()
+    return thread
+
+# Retrieves the context, shows the sources and then the answer as it
+# is generated. Returns the full answer.
+def stream_answer(question):
+
+    with st.spinner("Searching..."):
+        stream = streaming_qa.ask(question, callbacks=[timing_handler])
+
+    with st.expander(f"Sources ({len(stream.documents)})"):
+        for document in stream.documents:
+            st.caption(document.metadata.get("source", ""))
+            st.write(document.page_content)
+
+    st.markdown("### Answer:")
+    answer = st.write_stream(stream)
+    st.caption(stream.summary())
+
+    return answer
+
+def get_answer(question):
+
+    start = time.perf_counter()
+    if STREAM_ANSWERS:
+        answer, cached = answer_cache.get_or_answer(question, stream_answer)
+    else:
+        with st.spinner("Thinking..."):
+            answer, cached = answer_cache.get_or_answer(
+                question,
+                lambda question: qa_chain.invoke(
+                    {"query": question},
+                    config={"callbacks": [timing_handler]})['result'])
+
+    timings.observe("cached_answer" if cached else "answer",
+                    time.perf_counter() - start)
+    timings.increment("rag_answers_total", cache="hit" if cached else "miss")
+    export_timings(timings)
+
+    # Streamed answers are already on the page
+    if cached or not STREAM_ANSWERS:
+        st.markdown("### Answer:")
+        st.write(answer)
+    if cached:
+        st.caption("Cached answer")
+
 # Title and description
 st.title("💀 Day of the Dead Q&A")
 st.markdown("Ask questions about the Day of the Dead tradition and get answers based on Wikipedia content.")
@@ -97,12 +308,19 @@ with st.sidebar:
     st.info("Made by Javier Corpus")
 
 # Initialize the system
-search_term = "Day of the Dead"
+timings = load_timings()
+timing_handler = TimingCallbackHandler(timings, GPT_MODEL)
 
 try:
-    store = load_and_process_documents(search_term)
+    store = load_and_process_documents(tuple(WIKIPEDIA_QUERIES))
+    if RETRIEVER_BACKEND == "numpy":
+        store = load_vector_index(store)
     
-    qa_chain = create_qa_chain(store)
+    retriever = load_retriever(store)
+    qa_chain = create_qa_chain(retriever)
+    streaming_qa = create_streaming_qa(retriever)
+    answer_cache = load_answer_cache(store)
+    warm_answer_cache(answer_cache, qa_chain)
     
     st.success("✅ System initialized and ready!")
     
@@ -116,32 +334,30 @@ try:
     # Submit button
     if st.button("Get Answer", type="primary") or question:
         if question:
-            with st.spinner("Thinking..."):
-                response = qa_chain.invoke({"query": question})
-            
-            # Display answer
-            st.markdown("### Answer:")
-            st.write(response['result'])
+            get_answer(question)
         else:
             st.warning("Please enter a question first.")
     
     # Example questions
     st.markdown("---")
     st.markdown("**Example questions:**")
-    example_questions = [
-        "What is the origin of the Day of the Dead?",
-        "How is Day of the Dead celebrated?",
-        "What are the traditional symbols of Day of the Dead?",
-        "When is Day of the Dead observed?"
-    ]
-    
-    for i, eq in enumerate(example_questions):
+    for i, eq in enumerate(EXAMPLE_QUESTIONS):
         if st.button(eq, key=f"example_{i}"):
-            with st.spinner("Thinking..."):
-                response = qa_chain.invoke({"query": eq})
-            st.markdown("### Answer:")
-            st.write(response['result'])
+            get_answer(eq)
 
 except Exception as e:
     st.error(f"An error occurred: {str(e)}")
-    st.info("Please make sure you have set your OpenAI API key in your environment variables.")
\ No newline at end of file
+    st.info("Please make sure you have set your OpenAI API key in your environment variables.")
+
+# Rolling percentiles of every stage, over the last answers
+with st.sidebar:
+    if st.checkbox("Show timings"):
+        if timings.gauge("rag_retrieval_degraded"):
+            st.warning("Vector search is failing, questions are answered "
+                       "with keyword search only for now")
+        st.dataframe(timings.rows(), hide_index=True)
+        st.download_button("Download JSON", timings.to_json(),
+                           file_name="rag_timings.json",
+                           mime="application/json")
+        st.download_button("Download Prometheus", timings.to_prometheus(),
+                           file_name="rag_timings.prom", mime="text/plain")
@@ -0,0 +1,260 @@
+# RAGAnswerCache.py
+# Purpose: Shared cache of answers in front of the QA chain
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Waiting threads answer the question themselves when the
+#              thread answering it is interrupted
+# 10/18/2026 - Stricter default similarity threshold
+# 10/18/2026 - Store fingerprint computed outside the lock
+#
+# Answers are cached by the normalized text of the question (lowercase,
+# no accents or punctuation), so "What is Day of the Dead?" and "what
+# is day of the dead" share an answer. With an embed function (opt-in),
+# a question that isn't cached can also reuse the answer of a cached
+# question whose embedding is at least `threshold` similar (cosine).
+# ada-002 cosines of different questions are often above 0.9, so the
+# threshold has to be strict or other questions get the wrong answer.
+#
+# The cache is shared by all the users of the app process. Answers
+# expire after `ttl` seconds, the least recently used are evicted over
+# max_entries, and everything is dropped when the fingerprint of the
+# store changes (checked every FINGERPRINT_INTERVAL seconds). The same
+# question asked by several users at the same time is answered once.
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from RAGVectorIndex import VectorIndex, normalize, store_fingerprint
+
+# Constants:
+ANSWER_TTL = 24 * 60 * 60                 # 1 day
+ANSWER_MAX_ENTRIES = 1_000
+SIMILARITY_THRESHOLD = 0.98               # Cosine, for near duplicates
+FINGERPRINT_INTERVAL = 60                 # Seconds between store checks
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Returned by the cache when a question is not cached
+MISS = object()
+
+
+# ------------------------------------------------------------------
+# Lowercase words without accents or punctuation
+# ------------------------------------------------------------------
+def normalize_question(question: str):
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(WORD_PATTERN.findall(text))
+
+
+# ------------------------------------------------------------------
+# Content fingerprint of a Chroma store, or of the store a
+# VectorIndex was exported from
+# ------------------------------------------------------------------
+def content_fingerprint(store):
+    if isinstance(store, VectorIndex):
+        return store.meta.get("fingerprint")
+    return store_fingerprint(store)
+
+
+# ------------------------------------------------------------
+# An answer being computed, waited on by other threads asking
+# the same question
+# ------------------------------------------------------------
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# -------------------------------------------------------------------
+# In-memory answer cache.
+#
+# `fingerprint` is a function returning a value that changes with the
+# store (RAGIndex.manifest_version() or content_fingerprint()), `embed`
+# a function returning the embedding of a question; both are optional. `hits`,
+# `similar_hits` and `misses` count the lookups.
+# -------------------------------------------------------------------
+class AnswerCache:
+
+    def __init__(self, fingerprint=None, embed=None,
+                 threshold: float = SIMILARITY_THRESHOLD,
+                 ttl: float = ANSWER_TTL,
+                 max_entries: int = ANSWER_MAX_ENTRIES,
+                 check_interval: float = FINGERPRINT_INTERVAL):
+        self.fingerprint = fingerprint
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (stored_at, answer, vector)
+        self._flights = {}              # key -> _Flight
+        self._matrix = None             # (keys, vectors) of the entries
+        self._content = fingerprint() if fingerprint else None
+        self._checked_at = time.time()
+
+    # ------------------------------------------------------------
+    # Drops every entry if the store changed since the last check.
+    # The fingerprint is computed without the lock (it may read the
+    # whole store), by the one thread whose lookup is due for a check.
+    # ------------------------------------------------------------
+    def _check_fingerprint(self):
+        with self._lock:
+            now = time.time()
+            if (self.fingerprint is None
+                    or now - self._checked_at < self.check_interval):
+                return
+            self._checked_at = now
+
+        content = self.fingerprint()
+        with self._lock:
+            if content != self._content:
+                self._content = content
+                self._entries.clear()
+                self._matrix = None
+
+    def _get_locked(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISS
+
+        if now - entry[0] > self.ttl:
+            del self._entries[key]
+            self._matrix = None
+            return MISS
+
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    # ------------------------------------------------------------
+    # Answer of the most similar cached question, if it is at least
+    # `threshold` similar, or MISS
+    # ------------------------------------------------------------
+    def _get_similar_locked(self, vector, now: float):
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items()
+                    if entry[2] is not None]
+            vectors = [self._entries[key][2] for key in keys]
+            self._matrix = (keys, np.array(vectors, dtype=np.float32))
+
+        keys, vectors = self._matrix
+        if not keys:
+            return MISS
+
+        scores = vectors @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return MISS
+        return self._get_locked(keys[best], now)
+
+    def _put_locked(self, key: str, answer, vector, now: float):
+        self._entries[key] = (now, answer, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    # ------------------------------------------------------------
+    # Returns (answer, cached). A question that is not cached is
+    # answered with answer(question) and its answer cached, unless
+    # the store changed in the meantime.
+    # ------------------------------------------------------------
+    def get_or_answer(self, question: str, answer):
+        while True:
+            result = self._get_or_answer(question, answer)
+            if result is not MISS:
+                return result
+
+    # ------------------------------------------------------------
+    # One attempt of get_or_answer(). Returns MISS when the thread
+    # answering the same question was interrupted without an answer
+    # (e.g. Streamlit stopped its script), so the caller tries again.
+    # ------------------------------------------------------------
+    def _get_or_answer(self, question: str, answer):
+        key = normalize_question(question)
+        self._check_fingerprint()
+
+        with self._lock:
+            now = time.time()
+            result = self._get_locked(key, now)
+            if result is not MISS:
+                self.hits += 1
+                return result, True
+            empty = not self._entries
+
+        # Embedded without the lock, it may call the embeddings API
+        vector = None
+        if self.embed is not None:
+            vector = normalize(self.embed(question))
+
+        with self._lock:
+            if vector is not None and not empty:
+                result = self._get_similar_locked(vector, time.time())
+                if result is not MISS:
+                    self.similar_hits += 1
+                    return result, True
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.misses += 1
+            content = self._content
+
+        if not leader:
+            flight.done.wait()
+            if isinstance(flight.error, Exception):
+                raise flight.error
+            if flight.error is not None:
+                return MISS
+            return flight.result, True
+
+        try:
+            flight.result = answer(question)
+            with self._lock:
+                if self._content == content:
+                    self._put_locked(key, flight.result, vector, time.time())
+        except BaseException as error:
+            # Also StopException / RerunException, which Streamlit
+            # raises in the script thread and aren't an Exception
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result, False
+
+    # ------------------------------------------------------------
+    # Answers the questions that are not cached yet. Errors are
+    # ignored, the question is answered again when it is asked.
+    # ------------------------------------------------------------
+    def warm(self, questions: list, answer):
+        for question in questions:
+            try:
+                self.get_or_answer(question, answer)
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,413 @@
+# RAGChunkBenchmark.py
+# Purpose: Offline benchmark of chunking settings: index cost,
+#          retrieval latency, prompt size and recall@k
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Recall by the passage holding a short answer span; disk
+#              and keyword index sizes reported apart
+# 10/18/2026 - Memory of the vectors and keyword index per setting
+#
+# For every chunk size and overlap, the corpus is split and indexed in
+# a temporary Chroma store with the app's code (RAGIndex, RAGHybrid,
+# RAGContext, RAGStream), and every question of a labelled set is
+# asked. It reports:
+#
+#   chunks         number of chunks (= embeddings) in the store
+#   embed tokens   tokens sent to the embeddings API (overlap included)
+#   build          time to split, embed and index the corpus
+#   disk           size of the Chroma files on disk
+#   memory         memory of the search indexes the retrieval uses: the
+#                  embeddings as a float32 VectorIndex matrix (HASH_DIM
+#                  dimensions; 1536 for OpenAI's is 3 times as much)
+#                  and the BM25 keyword index arrays
+#   p50 / p99      retrieval latency, up to the finished prompt
+#   prompt         average prompt tokens per question
+#   recall@k       questions whose answers are each held by a retrieved
+#                  passage (ANSWER_OVERLAP of the answer's words in
+#                  the same passage; consecutive chunks are merged)
+#   words          average share of the answer's words in the context
+#
+# Nothing goes over the network: the embeddings are HashEmbeddings
+# (hashed words and word pairs) and the LLM is a stub. The absolute
+# recall is lower than with OpenAI embeddings, but the settings can be
+# compared with each other.
+#
+# The corpus is the persisted store (the chunks of every source are
+# joined back into the document) or the files given. A question set
+# is a JSONL file with one {"question": ..., "answers": [...]} per
+# line, where each answer is a short text (a few words) that should be
+# retrieved. Without one, questions are made from random sentences of
+# the corpus (half of their words, in order) and the answer is a span
+# of ANSWER_WORDS words of the sentence. Whole sentences as answers
+# would only fit in the large chunks, and favour them by construction.
+#
+# Examples:
+#   python RAGChunkBenchmark.py
+#   python RAGChunkBenchmark.py notes/ --configs 100:20 300:50 1000:100
+#   python RAGChunkBenchmark.py --questions questions.jsonl --retrieval vector
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+
+from RAGContext import (
+    ContextRetriever,
+    assemble_context,
+    merge_text,
+    token_counter
+)
+from RAGHybrid import BM25Index, HybridRetriever, tokenize
+from RAGIndex import INDEX_KEY, open_store, sync_store
+from RAGIngest import file_sources
+from RAGStream import StreamingQA
+from RAGVectorIndex import VectorIndex
+
+# Constants:
+DEFAULT_CONFIGS = ["100:20", "200:40", "400:80", "800:160", "1500:200"]
+HASH_DIM = 512            # Dimensions of the hash embeddings
+QUESTION_COUNT = 50       # Questions made when no set is given
+MIN_QUESTION_WORDS = 6    # Shortest sentence used for a question
+ANSWER_WORDS = 5          # Words of the answer span of made questions
+ANSWER_OVERLAP = 0.8      # Share of the answer's words in one passage
+EXPORT_BATCH = 5_000      # Chroma rows read at a time
+STUB_ANSWER = "This is a stub answer."
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Same defaults and prompt as the Streamlit app
+COLLECTION_NAME = "DayoftheDead-Embeddings"
+PERSIST_DIRECTORY = "Wiki_DDM"
+CONTEXT_TOKEN_BUDGET = 1_000
+GPT_MODEL = "gpt-5"
+QA_TEMPLATE = """You are a bot that answers questions about Day of the Dead, using only the context provided.
+If you don't know the answer, simply state that you don't know.
+
+{context}
+
+Question: {question}"""
+
+
+# -------------------------------------------------------------------
+# Deterministic local embeddings: every word and pair of consecutive
+# words adds +1 or -1 to one of `dim` dimensions, chosen by a hash.
+# Texts that share words get similar vectors.
+# -------------------------------------------------------------------
+class HashEmbeddings(Embeddings):
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = tokenize(text)
+        features = words + [f"{first} {second}"
+                            for first, second in zip(words, words[1:])]
+        for feature in features:
+            value = zlib.crc32(feature.encode("utf-8"))
+            vector[value % self.dim] += 1.0 if value & (1 << 31) else -1.0
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str):
+        return self._embed(text)
+
+
+# ------------------------------------------------------------------
+# Joins the chunks of every source of a store back into documents
+# ------------------------------------------------------------------
+def documents_from_store(store):
+    by_source = {}
+    total = store._collection.count()
+    for offset in range(0, total, EXPORT_BATCH):
+        batch = store.get(limit=EXPORT_BATCH, offset=offset,
+                          include=["documents", "metadatas"])
+        for text, metadata in zip(batch["documents"], batch["metadatas"]):
+            metadata = metadata or {}
+            by_source.setdefault(metadata.get("source"), []).append(
+                (metadata.get(INDEX_KEY, 0), text))
+
+    documents = []
+    for source, chunks in by_source.items():
+        chunks.sort()
+        text = chunks[0][1]
+        for _, chunk in chunks[1:]:
+            text = merge_text(text, chunk)
+        documents.append(Document(page_content=text,
+                                  metadata={"source": source}))
+    return documents
+
+
+# ------------------------------------------------------------------
+# Reads a question set: {"question": ..., "answers": [...]} (or
+# "answer": ...) per line
+# ------------------------------------------------------------------
+def load_questions(path: str):
+    questions = []
+    with open(path, encoding="utf-8") as questions_file:
+        for line in questions_file:
+            if line.strip():
+                record = json.loads(line)
+                answers = record.get("answers") or [record["answer"]]
+                questions.append({"question": record["question"],
+                                  "answers": answers})
+    return questions
+
+
+# ------------------------------------------------------------------
+# Makes questions from random sentences of the documents
+# ------------------------------------------------------------------
+def make_questions(documents: list, count: int, seed: int = 0):
+    sentences = sorted({sentence.strip() for document in documents
+                        for sentence in SENTENCE_PATTERN.split(
+                            document.page_content)
+                        if len(tokenize(sentence)) >= MIN_QUESTION_WORDS})
+
+    rng = random.Random(seed)
+    questions = []
+    for sentence in rng.sample(sentences, min(count, len(sentences))):
+        words = tokenize(sentence)
+        kept = sorted(rng.sample(range(len(words)), len(words) // 2))
+        start = rng.randrange(len(words) - ANSWER_WORDS + 1)
+        questions.append({"question": " ".join(words[i] for i in kept),
+                          "answers": [" ".join(
+                              words[start:start + ANSWER_WORDS])]})
+    return questions
+
+
+# ------------------------------------------------------------------
+# True if one of the passages holds at least ANSWER_OVERLAP of the
+# answer's words
+# ------------------------------------------------------------------
+def is_retrieved(answer: str, passages: list):
+    answer_words = set(tokenize(answer))
+    if not answer_words:
+        return True
+    return any(len(answer_words & passage) / len(answer_words)
+               >= ANSWER_OVERLAP for passage in passages)
+
+
+def directory_size(path: str):
+    return sum(os.path.getsize(os.path.join(folder, name))
+               for folder, _, names in os.walk(path) for name in names)
+
+
+# ------------------------------------------------------------------
+# Indexes the documents with one chunking setting and asks every
+# question. Returns a dictionary with the measurements.
+# ------------------------------------------------------------------
+def run_config(documents: list, questions: list, chunk_size: int,
+               chunk_overlap: int, directory: str, embeddings,
+               retrieval: str, k: int, budget: int):
+    count_tokens = token_counter(GPT_MODEL)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    persist_directory = os.path.join(directory,
+                                     f"{chunk_size}-{chunk_overlap}")
+
+    start = time.perf_counter()
+    store = open_store(f"chunks-{chunk_size}-{chunk_overlap}",
+                       persist_directory, embeddings)
+    chunk_count = 0
+    embed_tokens = 0
+    for document in documents:
+        chunks = text_splitter.split_documents([document])
+        chunk_count += len(chunks)
+        embed_tokens += sum(count_tokens(chunk.page_content)
+                            for chunk in chunks)
+        sync_store(store, chunks)
+
+    lexical = None
+    if retrieval != "vector":
+        lexical = BM25Index.from_store(store)
+    build_seconds = time.perf_counter() - start
+
+    # Exported apart, so it isn't counted in the disk size
+    vector_bytes = 0
+    if retrieval != "lexical":
+        vector_bytes = VectorIndex.from_store(
+            store, f"{persist_directory}-vectors", "float32").nbytes()
+    keyword_bytes = lexical.nbytes() if lexical else 0
+
+    if retrieval == "vector":
+        retriever = store.as_retriever(search_kwargs={"k": k})
+    else:
+        retriever = HybridRetriever.from_store(
+            store, lexical, k=k, lexical_only=retrieval == "lexical")
+    if budget > 0:
+        retriever = ContextRetriever(retriever=retriever,
+                                     token_budget=budget, model=GPT_MODEL)
+
+    qa = StreamingQA(retriever, FakeListChatModel(responses=[STUB_ANSWER]),
+                     PromptTemplate(template=QA_TEMPLATE,
+                                    input_variables=["context",
+                                                     "question"]))
+
+    latencies, prompt_tokens, hits, word_shares = [], [], 0, []
+    for question in questions:
+        stream = qa.ask(question["question"])
+        latencies.append(stream.retrieval_seconds)
+        prompt_tokens.append(count_tokens(stream.prompt))
+        for _ in stream:
+            pass
+
+        # Chunks merged, so an answer split between consecutive
+        # retrieved chunks is found
+        passages = [set(tokenize(document.page_content)) for document
+                    in assemble_context(stream.documents, 10**9)]
+        context_words = set().union(*passages)
+        hits += all(is_retrieved(answer, passages)
+                    for answer in question["answers"])
+
+        answer_words = set(tokenize(" ".join(question["answers"])))
+        word_shares.append(len(answer_words & context_words)
+                           / max(len(answer_words), 1))
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunks": chunk_count,
+        "embed_tokens": embed_tokens,
+        "build_seconds": build_seconds,
+        "disk_bytes": directory_size(persist_directory),
+        "vector_bytes": vector_bytes,
+        "keyword_index_bytes": keyword_bytes,
+        "memory_bytes": vector_bytes + keyword_bytes,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "prompt_tokens": float(np.mean(prompt_tokens)),
+        "recall": hits / len(questions),
+        "answer_words": float(np.mean(word_shares)),
+    }
+
+
+# ------------------------------------------------------------------
+# Results table
+# ------------------------------------------------------------------
+def format_results(results: list, k: int):
+    lines = [f"{'size:overlap':>12} {'chunks':>7} {'embed tok':>9} "
+             f"{'build s':>8} {'disk MB':>8} {'memory MB':>9} "
+             f"{'p50 ms':>7} {'p99 ms':>7} "
+             f"{'prompt':>7} {f'recall@{k}':>9} {'words':>6}"]
+    for result in results:
+        config = f"{result['chunk_size']}:{result['chunk_overlap']}"
+        lines.append(
+            f"{config:>12} {result['chunks']:>7} "
+            f"{result['embed_tokens']:>9} "
+            f"{result['build_seconds']:>8.2f} "
+            f"{result['disk_bytes'] / 2**20:>8.1f} "
+            f"{result['memory_bytes'] / 2**20:>9.2f} "
+            f"{result['p50_ms']:>7.1f} {result['p99_ms']:>7.1f} "
+            f"{result['prompt_tokens']:>7.0f} "
+            f"{result['recall']:>9.0%} {result['answer_words']:>6.0%}")
+    return "\n".join(lines)
+
+
+# ------------------------------------
+# Parses the command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compare chunking settings offline (hash embeddings, "
+                    "stub LLM).")
+    parser.add_argument("paths", nargs="*",
+                        help="corpus files or folders (.txt, .md, .jsonl); "
+                             "default: the documents in the persisted store")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS,
+                        metavar="SIZE:OVERLAP",
+                        help="chunk size and overlap pairs (default: "
+                             f"{' '.join(DEFAULT_CONFIGS)})")
+    parser.add_argument("--questions",
+                        help="JSONL question set; default: made from the "
+                             "corpus")
+    parser.add_argument("--question-count", type=int, default=QUESTION_COUNT,
+                        help="questions made when no set is given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--retrieval", choices=["hybrid", "vector", "lexical"],
+                        default="hybrid")
+    parser.add_argument("-k", type=int, default=4,
+                        help="chunks retrieved per question (default: 4)")
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET,
+                        help="context token budget, 0 to send the chunks "
+                             f"as they are (default: {CONTEXT_TOKEN_BUDGET})")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--persist-directory", default=PERSIST_DIRECTORY)
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results to a JSON file")
+    arguments = parser.parse_args()
+
+    try:
+        arguments.configs = [tuple(int(value) for value in config.split(":"))
+                             for config in arguments.configs]
+    except ValueError:
+        parser.error("--configs must be SIZE:OVERLAP pairs, e.g. 100:20")
+
+    return arguments
+
+
+# ---------
+# Main body
+# ---------
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    if arguments.paths:
+        corpus = [document for source in file_sources(arguments.paths)
+                  for document in source.load()]
+    else:
+        corpus = documents_from_store(
+            open_store(arguments.collection, arguments.persist_directory,
+                       None))
+    if not corpus:
+        sys.exit("No documents. Index them with the app or RAGIngest.py "
+                 "first, or pass corpus files.")
+
+    if arguments.questions:
+        question_set = load_questions(arguments.questions)
+    else:
+        question_set = make_questions(corpus, arguments.question_count,
+                                      arguments.seed)
+    if not question_set:
+        sys.exit("No questions.")
+
+    print(f"{len(corpus)} documents, "
+          f"{sum(len(document.page_content) for document in corpus)} "
+          f"characters, {len(question_set)} questions, "
+          f"{arguments.retrieval} retrieval", file=sys.stderr)
+
+    all_results = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        for size, overlap in arguments.configs:
+            all_results.append(run_config(
+                corpus, question_set, size, overlap, work_directory,
+                HashEmbeddings(), arguments.retrieval, arguments.k,
+                arguments.budget))
+            print(f"{size}:{overlap} done", file=sys.stderr, flush=True)
+
+    print(format_results(all_results, arguments.k))
+
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as json_file:
+            json.dump(all_results, json_file, indent=2)
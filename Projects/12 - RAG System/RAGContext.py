@@ -0,0 +1,322 @@
+# RAGContext.py
+# Purpose: Assembles the retrieved chunks into the prompt context,
+#          within a token budget
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Callbacks passed to the wrapped retriever
+# 10/18/2026 - Chunks without repeated text joined by a line break
+#
+# The retrieved chunks are short (100 characters) and consecutive
+# chunks repeat up to 20 characters of each other, often cut in the
+# middle of a sentence. Before they go into the prompt:
+#
+#   1. Consecutive chunks of the same source (by chunk_index, see
+#      RAGIndex) are merged into one passage, without the repeated
+#      text.
+#   2. Passages contained in a more relevant passage are dropped.
+#   3. Passages are added, most relevant first, while the context fits
+#      in the token budget. Only the start of the passage that doesn't
+#      fit is added.
+#
+# ContextRetriever wraps any retriever with these steps, so the chains
+# don't change. Tokens are counted with tiktoken when it is installed
+# (and its encoding is available), or estimated from the length.
+#
+# Before/after report for the app's example questions:
+#   python RAGContext.py --lexical
+#   python RAGContext.py "Who drew La Catrina?" --budget 200
+
+import argparse
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_openai import OpenAIEmbeddings
+
+from RAGEmbeddings import CachedEmbeddings, EmbeddingCache
+from RAGHybrid import HybridRetriever
+from RAGIndex import INDEX_KEY, open_store
+
+# tiktoken is optional. Without it, tokens are estimated as
+# CHARS_PER_TOKEN characters each.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Constants:
+CONTEXT_TOKEN_BUDGET = 1_000
+DOCUMENT_SEPARATOR = "\n\n"               # Same as the "stuff" chain
+CHARS_PER_TOKEN = 4
+MIN_PASSAGE_TOKENS = 20                   # Smallest truncated passage
+DEFAULT_MODEL = "gpt-5"
+WORD_PATTERN = re.compile(r"\w+")
+
+# Same defaults as the Streamlit app
+COLLECTION_NAME = "DayoftheDead-Embeddings"
+PERSIST_DIRECTORY = "Wiki_DDM"
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE",
+                                 "embedding_cache.sqlite3")
+EXAMPLE_QUESTIONS = [
+    "What is the origin of the Day of the Dead?",
+    "How is Day of the Dead celebrated?",
+    "What are the traditional symbols of Day of the Dead?",
+    "When is Day of the Dead observed?"
+]
+
+
+# ------------------------------------------------------------------
+# Returns a function counting the tokens of a text for the model
+# ------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def token_counter(model: str = DEFAULT_MODEL):
+    if tiktoken is not None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: len(encoding.encode(text))
+        except Exception:
+            # The encoding files are downloaded on first use
+            pass
+
+    return lambda text: -(-len(text) // CHARS_PER_TOKEN)
+
+
+# ------------------------------------------------------------------
+# Joins two consecutive chunks. The end of the first chunk that is
+# repeated at the start of the second (whole words only) is kept once.
+# Without repeated text, the splitter cut at a separator it removed
+# (usually a paragraph or line break), so they are joined by a line
+# break to keep the passage's lines apart.
+# ------------------------------------------------------------------
+def merge_text(first: str, second: str):
+    for length in range(min(len(first), len(second)), 0, -1):
+        starts_word = length == len(first) or first[-length - 1].isspace()
+        ends_word = length == len(second) or second[length].isspace()
+        if starts_word and ends_word and first.endswith(second[:length]):
+            return first + second[length:]
+    return f"{first}\n{second}"
+
+
+# -------------------------------------------------------------------
+# Consecutive chunks of a source merged into one passage. `rank` is
+# the best position of its chunks in the retrieved list.
+# -------------------------------------------------------------------
+@dataclass
+class Passage:
+    text: str
+    rank: int
+    metadata: dict
+    chunks: list = field(default_factory=list)
+
+
+# ------------------------------------------------------------------
+# Merges the consecutive chunks of every source. Returns the
+# passages, most relevant first.
+# ------------------------------------------------------------------
+def merge_chunks(documents: list):
+    passages = []
+    by_source = {}
+    for rank, document in enumerate(documents):
+        metadata = document.metadata
+        if INDEX_KEY in metadata:
+            by_source.setdefault(metadata.get("source"), []).append(
+                (metadata[INDEX_KEY], rank, document))
+        else:
+            passages.append(Passage(document.page_content, rank,
+                                    dict(metadata)))
+
+    for chunks in by_source.values():
+        passage = None
+        for index, rank, document in sorted(chunks, key=lambda c: c[:2]):
+            if passage is not None and index == passage.chunks[-1]:
+                # Same chunk retrieved twice (e.g. by both retrievers)
+                passage.rank = min(passage.rank, rank)
+            elif passage is not None and index == passage.chunks[-1] + 1:
+                passage.text = merge_text(passage.text,
+                                          document.page_content)
+                passage.rank = min(passage.rank, rank)
+                passage.chunks.append(index)
+            else:
+                passage = Passage(document.page_content, rank,
+                                  dict(document.metadata), [index])
+                passages.append(passage)
+
+    return sorted(passages, key=lambda passage: passage.rank)
+
+
+# ------------------------------------------------------------------
+# Drops the passages whose text is contained in a more relevant one
+# ------------------------------------------------------------------
+def deduplicate(passages: list):
+    kept = []
+    for passage in passages:
+        text = " ".join(passage.text.split())
+        if not any(text in " ".join(other.text.split()) for other in kept):
+            kept.append(passage)
+    return kept
+
+
+# ------------------------------------------------------------------
+# Longest start of the text (whole words) within the budget
+# ------------------------------------------------------------------
+def truncate(text: str, budget: int, count_tokens):
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+# ------------------------------------------------------------------
+# Adds passages, most relevant first, while the context fits in the
+# budget. The first passage that doesn't fit is cut to the tokens
+# left, unless that leaves less than MIN_PASSAGE_TOKENS of it.
+# ------------------------------------------------------------------
+def pack(passages: list, budget: int, count_tokens):
+    kept = []
+    for passage in passages:
+        texts = [kept_passage.text for kept_passage in kept]
+        context = DOCUMENT_SEPARATOR.join(texts + [passage.text])
+        if count_tokens(context) <= budget:
+            kept.append(passage)
+            continue
+
+        used = count_tokens(DOCUMENT_SEPARATOR.join(texts + [""]))
+        text = truncate(passage.text, budget - used, count_tokens)
+        if text and (not kept
+                     or count_tokens(text) >= MIN_PASSAGE_TOKENS):
+            kept.append(Passage(text, passage.rank, passage.metadata,
+                                passage.chunks))
+        break
+
+    return kept
+
+
+# ------------------------------------------------------------------
+# Retrieved chunks -> documents for the prompt
+# ------------------------------------------------------------------
+def assemble_context(documents: list, budget: int = CONTEXT_TOKEN_BUDGET,
+                     model: str = DEFAULT_MODEL):
+    passages = pack(deduplicate(merge_chunks(documents)), budget,
+                    token_counter(model))
+
+    assembled = []
+    for passage in passages:
+        metadata = dict(passage.metadata)
+        if passage.chunks:
+            metadata[INDEX_KEY] = passage.chunks[0]
+            metadata["chunks"] = len(passage.chunks)
+        assembled.append(Document(page_content=passage.text,
+                                  metadata=metadata))
+    return assembled
+
+
+# -------------------------------------------------------------------
+# LangChain retriever that assembles the results of another one
+# -------------------------------------------------------------------
+class ContextRetriever(BaseRetriever):
+
+    retriever: Any
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    model: str = DEFAULT_MODEL
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        documents = self.retriever.invoke(query,
+                                          config={"callbacks": callbacks})
+        return assemble_context(documents, self.token_budget, self.model)
+
+
+# ------------------------------------------------------------------
+# Fraction of the distinct words of the chunks kept in the context
+# ------------------------------------------------------------------
+def coverage(documents: list, assembled: list):
+    before = set(WORD_PATTERN.findall(
+        " ".join(document.page_content for document in documents).lower()))
+    after = set(WORD_PATTERN.findall(
+        " ".join(document.page_content for document in assembled).lower()))
+    return len(before & after) / max(len(before), 1)
+
+
+# ------------------------------------------------------------------
+# Prints the context size before and after assembly, per question
+# ------------------------------------------------------------------
+def report(retriever, questions: list, budget: int, model: str):
+    count_tokens = token_counter(model)
+    totals = [0, 0]
+
+    print(f"{'chunks':>6} {'passages':>8} {'tokens':>7} {'after':>6} "
+          f"{'saved':>6} {'words kept':>10}  question")
+    for question in questions:
+        documents = retriever.invoke(question)
+        assembled = assemble_context(documents, budget, model)
+
+        before = count_tokens(DOCUMENT_SEPARATOR.join(
+            document.page_content for document in documents))
+        after = count_tokens(DOCUMENT_SEPARATOR.join(
+            document.page_content for document in assembled))
+        totals[0] += before
+        totals[1] += after
+
+        print(f"{len(documents):>6} {len(assembled):>8} {before:>7} "
+              f"{after:>6} {1 - after / max(before, 1):>6.0%} "
+              f"{coverage(documents, assembled):>10.0%}  {question}")
+
+    print(f"Total context tokens: {totals[0]} before, {totals[1]} after "
+          f"({1 - totals[1] / max(totals[0], 1):.0%} fewer)")
+
+
+# ------------------------------------
+# Parses the command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Context size before and after merging the retrieved "
+                    "chunks, for the persisted store.")
+    parser.add_argument("questions", nargs="*", default=EXAMPLE_QUESTIONS,
+                        help="questions (default: the app's examples)")
+    parser.add_argument("-k", type=int, default=4,
+                        help="chunks retrieved per question (default: 4)")
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET,
+                        help="context token budget "
+                             f"(default: {CONTEXT_TOKEN_BUDGET})")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help="model used to count tokens")
+    parser.add_argument("--lexical", action="store_true",
+                        help="keyword retrieval only, no embeddings calls")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--persist-directory", default=PERSIST_DIRECTORY)
+    return parser.parse_args()
+
+
+# ---------
+# Main body
+# ---------
+if __name__ == "__main__":
+    load_dotenv()
+    arguments = parse_arguments()
+
+    embeddings = None
+    if not arguments.lexical:
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(),
+                                      EmbeddingCache(EMBEDDING_CACHE_PATH))
+    vector_store = open_store(arguments.collection,
+                              arguments.persist_directory, embeddings)
+    hybrid_retriever = HybridRetriever.from_store(
+        vector_store, k=arguments.k, lexical_only=arguments.lexical)
+
+    report(hybrid_retriever, arguments.questions, arguments.budget,
+           arguments.model)
@@ -0,0 +1,215 @@
+# RAGEmbeddings.py
+# Purpose: Persistent embedding cache in front of the embeddings backend
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Failed inserts are rolled back
+#
+# CachedEmbeddings wraps any LangChain Embeddings (OpenAIEmbeddings in
+# the app). Vectors are cached in a SQLite file keyed by the model name
+# and a hash of the text, so re-indexing the same or overlapping
+# documents and asking the same questions again costs no API calls.
+# The texts that are not cached are sent in large batches, a few
+# batches at a time.
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+# Constants:
+EMBEDDING_MAX_ENTRIES = 50_000            # ~300 MB of 1536-d vectors
+LAST_USED_RESOLUTION = 60                 # Seconds between LRU updates
+DEFAULT_BATCH_SIZE = 256                  # Texts per embeddings call
+DEFAULT_MAX_WORKERS = 4                   # Concurrent embeddings calls
+QUERY_SUFFIX = "#query"                   # Query vectors are kept apart
+
+
+def text_hash(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -------------------------------------------------------------------
+# SQLite cache of embedding vectors, stored as float32 blobs.
+#
+# When the cache grows over max_entries, the least recently used
+# vectors are evicted. The cache can be shared by several threads.
+# -------------------------------------------------------------------
+class EmbeddingCache:
+
+    def __init__(self, path: str, max_entries: int = EMBEDDING_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "  model TEXT NOT NULL,"
+            "  text_hash TEXT NOT NULL,"
+            "  vector BLOB NOT NULL,"
+            "  last_used REAL NOT NULL,"
+            "  PRIMARY KEY (model, text_hash))")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+            "ON embeddings (last_used)")
+
+        self._count = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # ------------------------------------------------------------
+    # Returns {text_hash: vector} for the hashes that are cached
+    # ------------------------------------------------------------
+    def get_many(self, model: str, hashes: list):
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            # SQLite limits the number of parameters of a query
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector, last_used FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]).fetchall()
+
+                stale = []
+                for hash_value, blob, last_used in rows:
+                    found[hash_value] = array("f", blob).tolist()
+                    if now - last_used > LAST_USED_RESOLUTION:
+                        stale.append(hash_value)
+
+                # Refresh the LRU position, at most once per
+                # LAST_USED_RESOLUTION seconds per vector
+                if stale:
+                    self._connection.executemany(
+                        "UPDATE embeddings SET last_used = ? "
+                        "WHERE model = ? AND text_hash = ?",
+                        [(now, model, hash_value) for hash_value in stale])
+
+        return found
+
+    def put_many(self, model: str, vectors: dict):
+        now = time.time()
+        rows = [(model, hash_value, array("f", vector).tobytes(), now)
+                for hash_value, vector in vectors.items()]
+
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO embeddings "
+                    "(model, text_hash, vector, last_used) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                # Otherwise the shared connection stays in the
+                # transaction and later writes end up in it
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                raise
+            self._count += self._connection.total_changes - before
+
+            if self._count > self.max_entries:
+                self._evict()
+
+    # ------------------------------------------------------------
+    # Removes the least recently used vectors. Evicts 10% extra so
+    # this doesn't run again on the next insert.
+    # ------------------------------------------------------------
+    def _evict(self):
+        excess = self._count - self.max_entries + self.max_entries // 10
+        self._connection.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            "  SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,))
+        self._count = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# -------------------------------------------------------------------
+# Embeddings with a persistent cache in front of them.
+#
+# embed_documents() only sends the texts that are not cached (each
+# distinct text once), split in batches of batch_size, with at most
+# max_workers batches in flight. `calls` and `embedded` count the
+# backend calls and texts sent, for the stats.
+# -------------------------------------------------------------------
+class CachedEmbeddings(Embeddings):
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache,
+                 model: str = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = (model or getattr(embeddings, "model", None)
+                      or type(embeddings).__name__)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.calls = 0
+        self.embedded = 0
+        self._lock = threading.Lock()
+
+    def _embed_batch(self, texts: list):
+        with self._lock:
+            self.calls += 1
+            self.embedded += len(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_documents(self, texts: list):
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, sorted(set(hashes)))
+
+        missing = {}
+        for hash_value, text in zip(hashes, texts):
+            if hash_value not in vectors:
+                missing.setdefault(hash_value, text)
+
+        if missing:
+            missing_hashes = list(missing)
+            batches = [missing_hashes[start:start + self.batch_size]
+                       for start in range(0, len(missing_hashes),
+                                          self.batch_size)]
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = pool.map(
+                    lambda batch: self._embed_batch(
+                        [missing[hash_value] for hash_value in batch]),
+                    batches)
+
+                for batch, batch_vectors in zip(batches, results):
+                    computed = dict(zip(batch, batch_vectors))
+                    self.cache.put_many(self.model, computed)
+                    vectors.update(computed)
+
+        return [vectors[hash_value] for hash_value in hashes]
+
+    def embed_query(self, text: str):
+        model = self.model + QUERY_SUFFIX
+        hash_value = text_hash(text)
+
+        vector = self.cache.get_many(model, [hash_value]).get(hash_value)
+        if vector is None:
+            with self._lock:
+                self.calls += 1
+                self.embedded += 1
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(model, {hash_value: vector})
+
+        return vector
@@ -0,0 +1,339 @@
+# RAGHybrid.py
+# Purpose: Hybrid retrieval, BM25 keyword search combined with the
+#          vector store
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Callbacks passed to the vector retriever
+# 10/18/2026 - Keyword-only after DEGRADE_AFTER failures in a row,
+#              reported in the timings and on stderr
+# 10/18/2026 - Failure state guarded by a lock, executor created with
+#              the retriever
+# 10/18/2026 - Keyword-only state logged with `logging` instead of
+#              printed to stderr
+#
+# Embedding search over short chunks often misses exact terms (dates,
+# place names, "Calavera"). BM25Index is a compact inverted index of
+# the chunks in the store, and HybridRetriever merges its results with
+# the vector store's using reciprocal-rank fusion (RRF): every chunk
+# scores 1 / (RRF_K + rank) in each list it appears in.
+#
+# The keyword search needs no API call. If the vector search fails or
+# takes longer than vector_timeout seconds, the keyword results are
+# returned alone. After DEGRADE_AFTER such failures in a row, the
+# vector search is skipped for DEGRADED_SECONDS, so a slow embeddings
+# backend doesn't slow down every question; one slow call doesn't.
+# With `timings` (RAGTimings), the failures and the keyword-only state
+# are recorded for the app's timings panel; the state changes are also
+# logged to the "RAGHybrid" logger. lexical_only=True always skips
+# the vector search.
+#
+# Keyword search in the persisted store, without an API key:
+#   python RAGHybrid.py "Calavera Catrina" -k 5
+
+import argparse
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_core.retrievers import BaseRetriever
+
+from RAGIndex import open_store
+from RAGVectorIndex import VectorIndex, top_k
+
+# Constants:
+BM25_K1 = 1.2             # Term frequency saturation
+BM25_B = 0.75             # Document length normalization
+RRF_K = 60                # Reciprocal-rank fusion constant
+CANDIDATES = 20           # Results taken from each list before fusion
+VECTOR_TIMEOUT = 2.0      # Seconds to wait for the vector search
+DEGRADE_AFTER = 3         # Slow/failed searches in a row to degrade
+DEGRADED_SECONDS = 60     # Keyword-only time once degraded
+DEGRADED_GAUGE = "rag_retrieval_degraded"
+FAILURES_COUNTER = "rag_vector_search_failures_total"
+EXPORT_BATCH = 5_000      # Chroma rows read at a time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be by de del for from has in is it its la las los of on
+or that the their this to was were which with y
+""".split())
+
+
+# ------------------------------------------------------------------
+# Lowercase words without accents, so "Día" matches "dia"
+# ------------------------------------------------------------------
+def tokenize(text: str):
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(text)
+            if token not in STOPWORDS]
+
+
+# -------------------------------------------------------------------
+# BM25 inverted index, stored as three arrays: for every term (in the
+# order of `vocabulary`), offsets[term]:offsets[term + 1] is its slice
+# of `rows` (the chunks that contain it) and `weights` (the BM25
+# weight of the term in each chunk, computed when the index is built).
+# A query adds up the slices of its terms.
+# -------------------------------------------------------------------
+class BM25Index:
+
+    def __init__(self, texts: list, metadatas: list):
+        self.texts = texts
+        self.metadatas = metadatas
+        self.count = len(texts)
+        self.vocabulary = {}
+
+        terms, rows, frequencies = [], [], []
+        lengths = np.zeros(self.count, dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token, frequency in Counter(tokens).items():
+                terms.append(self.vocabulary.setdefault(
+                    token, len(self.vocabulary)))
+                rows.append(row)
+                frequencies.append(frequency)
+
+        terms = np.asarray(terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        self.rows = np.asarray(rows, dtype=np.int32)[order]
+        frequencies = np.asarray(frequencies, dtype=np.float32)[order]
+
+        document_frequency = np.bincount(terms,
+                                         minlength=len(self.vocabulary))
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=self.offsets[1:])
+
+        idf = np.log(1 + (self.count - document_frequency + 0.5)
+                     / (document_frequency + 0.5)).astype(np.float32)
+        average_length = max(float(lengths.mean()) if self.count else 0, 1.0)
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        self.weights = (idf[terms[order]] * frequencies * (BM25_K1 + 1)
+                        / (frequencies + norms[self.rows]))
+
+    # ------------------------------------------------------------
+    # Indexes the chunks of a Chroma store or a VectorIndex
+    # ------------------------------------------------------------
+    @staticmethod
+    def from_store(store):
+        if isinstance(store, VectorIndex):
+            return BM25Index(store.texts, store.metadatas)
+
+        texts, metadatas = [], []
+        total = store._collection.count()
+        for offset in range(0, total, EXPORT_BATCH):
+            batch = store.get(limit=EXPORT_BATCH, offset=offset,
+                              include=["documents", "metadatas"])
+            texts.extend(batch["documents"])
+            metadatas.extend(metadata or {}
+                             for metadata in batch["metadatas"])
+        return BM25Index(texts, metadatas)
+
+    # ------------------------------------------------------------
+    # Returns [(row, score)] of the k best chunks for the query.
+    # Chunks without any of its terms are not returned.
+    # ------------------------------------------------------------
+    def search(self, query: str, k: int = 4):
+        scores = np.zeros(self.count, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.vocabulary.get(token)
+            if term is not None:
+                start, end = self.offsets[term], self.offsets[term + 1]
+                scores[self.rows[start:end]] += self.weights[start:end]
+
+        return [(int(row), float(scores[row])) for row in top_k(scores, k)
+                if scores[row] > 0]
+
+    def document(self, row: int):
+        return Document(page_content=self.texts[row],
+                        metadata=dict(self.metadatas[row]))
+
+    def nbytes(self):
+        return self.rows.nbytes + self.weights.nbytes + self.offsets.nbytes
+
+
+# ------------------------------------------------------------------
+# Identifies a chunk in both result lists: its position in its source
+# (see RAGIndex), or its text for chunks indexed some other way
+# ------------------------------------------------------------------
+def document_key(document: Document):
+    metadata = document.metadata
+    if "chunk_index" in metadata:
+        return metadata.get("source"), metadata["chunk_index"]
+    return document.page_content
+
+
+# ------------------------------------------------------------------
+# Merges ranked lists of documents with reciprocal-rank fusion
+# ------------------------------------------------------------------
+def reciprocal_rank_fusion(result_lists: list, k: int, rrf_k: int = RRF_K):
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results, start=1):
+            key = document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank)
+            documents.setdefault(key, document)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+# -------------------------------------------------------------------
+# LangChain retriever combining BM25 and a vector retriever, a
+# drop-in replacement for store.as_retriever(). Use from_store() to
+# create it. `vector_failures` counts the searches that failed or
+# timed out. The retriever is shared by the app's sessions, so the
+# failure state is only changed while holding `_lock`.
+# -------------------------------------------------------------------
+class HybridRetriever(BaseRetriever):
+
+    lexical: Any
+    vector_retriever: Any = None
+    k: int = 4
+    candidates: int = CANDIDATES
+    vector_timeout: float = VECTOR_TIMEOUT
+    lexical_only: bool = False
+    degraded_until: float = 0.0
+    vector_failures: int = 0
+    consecutive_failures: int = 0
+    last_failure: float = 0.0
+    timings: Any = None
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _executor: Any = PrivateAttr(default_factory=lambda: ThreadPoolExecutor(
+        max_workers=4, thread_name_prefix="vector-search"))
+
+    # ------------------------------------------------------------
+    # Creates the retriever for a Chroma store or a VectorIndex
+    # ------------------------------------------------------------
+    @staticmethod
+    def from_store(store, lexical: BM25Index = None, k: int = 4,
+                   lexical_only: bool = False, timings=None):
+        lexical = lexical or BM25Index.from_store(store)
+        if isinstance(store, VectorIndex):
+            vector_retriever = store.as_retriever(k=CANDIDATES)
+        else:
+            vector_retriever = store.as_retriever(
+                search_kwargs={"k": CANDIDATES})
+        if timings is not None:
+            timings.set(DEGRADED_GAUGE, 0)
+        return HybridRetriever(lexical=lexical,
+                               vector_retriever=vector_retriever, k=k,
+                               lexical_only=lexical_only, timings=timings)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        lexical_results = [self.lexical.document(row) for row, _ in
+                           self.lexical.search(query, self.candidates)]
+
+        callbacks = run_manager.get_child() if run_manager else None
+        vector_results = self._vector_search(query, callbacks)
+        if vector_results is None:
+            return lexical_results[:self.k]
+
+        return reciprocal_rank_fusion([vector_results, lexical_results],
+                                      self.k)
+
+    # ------------------------------------------------------------
+    # Vector search results, or None when it is skipped, fails or
+    # times out. A search that times out keeps running in the
+    # background, so its query embedding still gets cached.
+    # ------------------------------------------------------------
+    def _vector_search(self, query: str, callbacks=None):
+        if self.lexical_only or self.vector_retriever is None:
+            return None
+        with self._lock:
+            if self.degraded_until:
+                if time.monotonic() < self.degraded_until:
+                    return None
+                self.degraded_until = 0.0
+                self._set_degraded(False)
+
+        started = time.monotonic()
+        future = self._executor.submit(self.vector_retriever.invoke, query,
+                                       {"callbacks": callbacks})
+        try:
+            results = future.result(timeout=self.vector_timeout)
+        except Exception as error:            # Timeout or backend error
+            self._record_failure(error)
+            return None
+
+        # A search that started before the last failure doesn't end
+        # the streak of another session
+        with self._lock:
+            if started > self.last_failure:
+                self.consecutive_failures = 0
+        return results
+
+    def _record_failure(self, error: Exception):
+        if self.timings is not None:
+            self.timings.increment(
+                FAILURES_COUNTER,
+                reason=("timeout" if isinstance(error, FutureTimeoutError)
+                        else "error"))
+
+        with self._lock:
+            self.vector_failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+            if (self.consecutive_failures >= DEGRADE_AFTER
+                    and not self.degraded_until):
+                self.consecutive_failures = 0
+                self.degraded_until = time.monotonic() + DEGRADED_SECONDS
+                self._set_degraded(True)
+
+    def _set_degraded(self, degraded: bool):
+        if self.timings is not None:
+            self.timings.set(DEGRADED_GAUGE, int(degraded))
+        if degraded:
+            logger.warning("Vector search failed %d times in a row, "
+                           "keyword search only for %d s",
+                           DEGRADE_AFTER, DEGRADED_SECONDS)
+        else:
+            logger.info("Vector search resumed")
+
+
+# ------------------------------------
+# Parses the command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Keyword (BM25) search in the persisted Chroma store.")
+    parser.add_argument("query", help="text to search")
+    parser.add_argument("-k", type=int, default=4,
+                        help="number of chunks to return (default: 4)")
+    parser.add_argument("--collection", default="DayoftheDead-Embeddings")
+    parser.add_argument("--persist-directory", default="Wiki_DDM")
+    return parser.parse_args()
+
+
+# ---------
+# Main body
+# ---------
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    vector_store = open_store(arguments.collection,
+                              arguments.persist_directory, None)
+    start = time.perf_counter()
+    index = BM25Index.from_store(vector_store)
+    build_time = time.perf_counter() - start
+
+    print(f"{index.count} chunks, {len(index.vocabulary)} terms, "
+          f"{index.nbytes() / 2**10:.0f} KB, built in {build_time:.2f} s")
+    for row, score in index.search(arguments.query, arguments.k):
+        print(f"{score:6.2f}  {index.texts[row]!r}")
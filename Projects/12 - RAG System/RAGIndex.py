@@ -0,0 +1,241 @@
+# RAGIndex.py
+# Purpose: Incremental indexing of document chunks in the Chroma store
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Split sync_store() in plan, embed and apply steps for the
+#              ingestion pipeline
+# 10/18/2026 - Optional timings of the sync_store() steps
+# 10/18/2026 - plan_sync() also deletes the chunks of sources that no
+#              longer have any
+# 10/18/2026 - Removed is_up_to_date(): a collection can hold the
+#              documents of several writers (see RAGIngest)
+# 10/18/2026 - manifest_version(), a cheap check of whether a
+#              collection changed
+#
+# Every chunk is stored with a hash of its text. When the documents
+# are indexed again, only the chunks that are new or whose text or
+# metadata changed are written, and only text that is not in the store
+# yet is embedded: a chunk that moved (same text under a new ID, e.g.
+# after a paragraph was added above it) reuses the stored embedding.
+# Chunks that are gone are deleted.
+#
+# A small manifest next to the Chroma files records when each
+# collection last changed and how many chunks it has.
+
+import hashlib
+import json
+import os
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from langchain.vectorstores import Chroma
+
+# Constants:
+MANIFEST_FILE = "manifest.json"
+HASH_KEY = "content_hash"
+INDEX_KEY = "chunk_index"
+
+# The article is downloaded again after this many seconds, to pick up
+# edits. Unchanged chunks are not embedded again.
+REFRESH_INTERVAL = int(os.getenv("RAG_REFRESH_INTERVAL", 7 * 24 * 60 * 60))
+
+
+# ------------------------------------------------------------------
+# Opens (or creates) a persisted Chroma collection
+# ------------------------------------------------------------------
+def open_store(collection_name: str, persist_directory: str, embeddings):
+    return Chroma(collection_name=collection_name,
+                  embedding_function=embeddings,
+                  persist_directory=persist_directory)
+
+
+# ------------------------------------------------------------------
+# Hash of a chunk's text, the only thing its embedding depends on
+# ------------------------------------------------------------------
+def chunk_hash(chunk):
+    return hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------------------------
+# Adds the position and hash of every chunk to its metadata and
+# returns the chunk IDs. IDs are "source-index", numbered per source.
+# ------------------------------------------------------------------
+def prepare_chunks(chunks: list):
+    ids = []
+    counters = {}
+
+    for chunk in chunks:
+        source = chunk.metadata["source"]
+        index = counters.get(source, 0)
+        counters[source] = index + 1
+
+        chunk.metadata[INDEX_KEY] = index
+        chunk.metadata[HASH_KEY] = chunk_hash(chunk)
+        ids.append(f"{source}-{index}")
+
+    return ids
+
+
+# -------------------------------------------------------------------
+# Changes needed to bring the chunks of some sources up to date, as
+# returned by plan_sync()
+# -------------------------------------------------------------------
+@dataclass
+class SyncPlan:
+    pending: list       # (chunk_id, chunk) to write
+    deleted: list       # IDs to delete
+    stored: dict        # chunk_id -> metadata already in the store
+    changes: dict       # Counters, see sync_store()
+
+
+# ------------------------------------------------------------------
+# Brings the chunks of the given sources in the store up to date.
+#
+# Returns a dictionary with the number of chunks added, updated,
+# deleted and unchanged, and how many embeddings were computed or
+# reused from the store. With `timings` (RAGTimings), the time of
+# each step is recorded.
+# ------------------------------------------------------------------
+def sync_store(store: Chroma, chunks: list, timings=None):
+    def span(stage: str):
+        return timings.span(stage) if timings is not None else nullcontext()
+
+    with span("plan_sync"):
+        plan = plan_sync(store, chunks)
+    with span("embed_chunks"):
+        embeddings = embed_chunks(store,
+                                  [chunk for _, chunk in plan.pending],
+                                  plan.stored, plan.changes)
+    with span("upsert"):
+        apply_sync(store, plan, embeddings)
+    return plan.changes
+
+
+# ------------------------------------------------------------------
+# Compares the chunks with what the store has for their sources and
+# for `sources`, sources indexed before that may have no chunks now
+# (they are all deleted then). Only reads the store.
+# ------------------------------------------------------------------
+def plan_sync(store: Chroma, chunks: list, sources=()):
+    ids = prepare_chunks(chunks)
+    changes = dict.fromkeys(["added", "updated", "deleted", "unchanged",
+                             "embedded", "reused"], 0)
+
+    # Metadata already in the store, for the sources being indexed. It
+    # includes the text hash and the position of each chunk.
+    stored = {}
+    for source in sorted({chunk.metadata["source"] for chunk in chunks}
+                         | set(sources)):
+        existing = store.get(where={"source": source}, include=["metadatas"])
+        for chunk_id, metadata in zip(existing["ids"],
+                                      existing["metadatas"]):
+            stored[chunk_id] = metadata or {}
+
+    pending = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks)
+               if stored.get(chunk_id) != chunk.metadata]
+    deleted = sorted(set(stored) - set(ids))
+
+    for chunk_id, _ in pending:
+        changes["added" if chunk_id not in stored else "updated"] += 1
+    changes["unchanged"] = len(ids) - len(pending)
+    changes["deleted"] = len(deleted)
+
+    return SyncPlan(pending, deleted, stored, changes)
+
+
+# ------------------------------------------------------------------
+# Writes the pending chunks of a plan, with their embeddings (in the
+# same order), and deletes the chunks that are gone
+# ------------------------------------------------------------------
+def apply_sync(store: Chroma, plan: SyncPlan, embeddings: list):
+    if plan.pending:
+        store._collection.upsert(
+            ids=[chunk_id for chunk_id, _ in plan.pending],
+            embeddings=embeddings,
+            metadatas=[chunk.metadata for _, chunk in plan.pending],
+            documents=[chunk.page_content for _, chunk in plan.pending])
+
+    # Deleted last: their embeddings may have been reused
+    if plan.deleted:
+        store.delete(ids=plan.deleted)
+
+
+# ------------------------------------------------------------------
+# Returns the embeddings of the chunks, reusing the ones stored under
+# another ID with the same hash and embedding the rest in one call
+# ------------------------------------------------------------------
+def embed_chunks(store: Chroma, chunks: list, stored: dict, changes: dict):
+    if not chunks:
+        return []
+
+    ids_by_hash = {metadata[HASH_KEY]: chunk_id
+                   for chunk_id, metadata in stored.items()
+                   if HASH_KEY in metadata}
+
+    reusable_ids = sorted({ids_by_hash[chunk.metadata[HASH_KEY]]
+                           for chunk in chunks
+                           if chunk.metadata[HASH_KEY] in ids_by_hash})
+    reused = {}
+    if reusable_ids:
+        existing = store.get(ids=reusable_ids, include=["embeddings"])
+        for chunk_id, embedding in zip(existing["ids"],
+                                       existing["embeddings"]):
+            reused[stored[chunk_id][HASH_KEY]] = list(embedding)
+
+    missing = [chunk for chunk in chunks
+               if chunk.metadata[HASH_KEY] not in reused]
+    computed = {}
+    if missing:
+        vectors = store.embeddings.embed_documents(
+            [chunk.page_content for chunk in missing])
+        for chunk, vector in zip(missing, vectors):
+            computed[chunk.metadata[HASH_KEY]] = vector
+
+    changes["embedded"] = len(missing)
+    changes["reused"] = len(chunks) - len(missing)
+
+    return [reused.get(chunk.metadata[HASH_KEY])
+            or computed[chunk.metadata[HASH_KEY]] for chunk in chunks]
+
+
+# ------------------------------------------------------------------
+# Manifest of what was indexed in each collection
+# ------------------------------------------------------------------
+def read_manifest(persist_directory: str):
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(persist_directory: str, collection_name: str,
+                   settings: dict, changes: dict, chunk_count: int):
+    manifest = read_manifest(persist_directory)
+    manifest[collection_name] = {
+        "settings": settings,
+        "indexed_at": time.time(),
+        "chunks": chunk_count,
+        "last_changes": changes,
+    }
+
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temporary_path, path)
+
+
+# ------------------------------------------------------------------
+# When a collection last changed and its chunk count, as recorded in
+# the manifest. Changes whenever the collection does, without reading
+# the store.
+# ------------------------------------------------------------------
+def manifest_version(persist_directory: str, collection_name: str):
+    entry = read_manifest(persist_directory).get(collection_name, {})
+    return entry.get("indexed_at"), entry.get("chunks")
+
@@ -0,0 +1,557 @@
+# RAGIngest.py
+# Purpose: Streaming ingestion of many documents into the Chroma store
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Chunks of removed files and documents are deleted; JSONL
+#              documents keyed by their "id"
+# 10/18/2026 - Checkpoint entries record the splitter settings
+# 10/18/2026 - Optional stage timings; the manifest is written after a
+#              run that changed the store
+#
+# Documents go through four stages connected by bounded queues:
+#
+#   load (N threads) -> split -> embed (M threads) -> upsert
+#
+# so loading and embedding run in parallel and only a few documents
+# are in memory at a time. Sources can be local files (.txt, .md,
+# .jsonl, or folders with them), Wikipedia queries, or any LangChain
+# document loader. Chunks are written with RAGIndex, so only new or
+# changed chunks are embedded.
+#
+# A checkpoint file next to the store records every source that was
+# fully indexed, with the documents it produced. If the ingestion is
+# interrupted, running it again skips those sources (unless the file
+# changed) and resumes with the rest. When a source is indexed again,
+# the chunks of its documents that are gone (a JSONL line that was
+# removed, a file that no longer has any text) are deleted, and so are
+# the chunks of files that were removed from the folders given.
+#
+# Examples:
+#   python RAGIngest.py notes/ articles.jsonl
+#   python RAGIngest.py --wikipedia "Day of the Dead" "Calavera" "Ofrenda"
+#   python RAGIngest.py docs/ --load-workers 8 --embed-workers 4
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from langchain.document_loaders import WikipediaLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+
+from RAGEmbeddings import CachedEmbeddings, EmbeddingCache
+from RAGIndex import (
+    REFRESH_INTERVAL,
+    apply_sync,
+    embed_chunks,
+    open_store,
+    plan_sync,
+    write_manifest
+)
+
+# Constants (same defaults as the Streamlit app):
+COLLECTION_NAME = "DayoftheDead-Embeddings"
+PERSIST_DIRECTORY = "Wiki_DDM"
+CHUNK_SIZE = 100
+CHUNK_OVERLAP = 20
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE",
+                                 "embedding_cache.sqlite3")
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
+JSONL_EXTENSIONS = {".jsonl"}
+EXPORT_BATCH = 5_000      # Chroma rows read at a time
+
+
+# -------------------------------------------------------------------
+# A document source. load() returns a list of LangChain Documents.
+#
+# fingerprint changes when the source changes (size and modification
+# time for files). Sources without a fingerprint are loaded again
+# once their checkpoint is older than REFRESH_INTERVAL.
+# -------------------------------------------------------------------
+@dataclass
+class Source:
+    key: str
+    load: object
+    fingerprint: str = None
+
+
+# ------------------------------------------------------------
+# Loads a text or markdown file as one document
+# ------------------------------------------------------------
+def load_text_file(path: str):
+    with open(path, encoding="utf-8") as text_file:
+        text = text_file.read()
+    title = os.path.splitext(os.path.basename(path))[0]
+    return [Document(page_content=text,
+                     metadata={"source": path, "title": title})]
+
+
+# ------------------------------------------------------------
+# Loads a JSONL file, one document per line. The text is read
+# from "page_content" or "text"; "metadata" and the other keys
+# become the metadata. Documents without a "source" get
+# "path#id" when they have an "id", or "path#line", which
+# changes for every later line when a line is inserted.
+# ------------------------------------------------------------
+def load_jsonl_file(path: str):
+    documents = []
+    with open(path, encoding="utf-8") as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, start=1):
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            text = record.pop("page_content", None) or record.pop("text", "")
+            metadata = record.pop("metadata", {})
+            metadata.update({key: value for key, value in record.items()
+                             if isinstance(value, (str, int, float, bool))})
+            record_id = record.get("id")
+            metadata.setdefault("source", f"{path}#{line_number}"
+                                if record_id is None
+                                else f"{path}#{record_id}")
+            documents.append(Document(page_content=text, metadata=metadata))
+    return documents
+
+
+# ------------------------------------------------------------
+# Sources for files and folders (searched recursively)
+# ------------------------------------------------------------
+def file_sources(paths: list):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                files.extend(os.path.join(folder, name)
+                             for name in sorted(names))
+        elif os.path.exists(path):
+            files.append(path)
+
+    sources = []
+    for path in files:
+        extension = os.path.splitext(path)[1].lower()
+        if extension in TEXT_EXTENSIONS:
+            load = load_text_file
+        elif extension in JSONL_EXTENSIONS:
+            load = load_jsonl_file
+        else:
+            continue
+
+        status = os.stat(path)
+        sources.append(Source(f"file:{path}",
+                              lambda path=path, load=load: load(path),
+                              f"{status.st_size}:{status.st_mtime_ns}"))
+    return sources
+
+
+# ------------------------------------------------------------
+# Source for any LangChain document loader (anything with a
+# load() method returning Documents)
+# ------------------------------------------------------------
+# ------------------------------------------------------------
+# Checkpointed file sources under `paths` (files or folders) that
+# are not in `sources` anymore: the files were deleted
+# ------------------------------------------------------------
+def removed_file_keys(keys: list, paths: list, sources: list):
+    current = {source.key for source in sources}
+    roots = [os.path.normpath(path) for path in paths]
+    removed = []
+    for key in keys:
+        if not key.startswith("file:") or key in current:
+            continue
+        path = os.path.normpath(key[len("file:"):])
+        if any(path == root or path.startswith(root + os.sep)
+               for root in roots):
+            removed.append(key)
+    return removed
+
+
+def loader_source(key: str, loader):
+    return Source(key, loader.load)
+
+
+def wikipedia_sources(queries: list, max_docs: int = 1):
+    return [loader_source(f"wikipedia:{query}",
+                          WikipediaLoader(query=query,
+                                          load_max_docs=max_docs))
+            for query in queries]
+
+
+# -------------------------------------------------------------------
+# Sources that were fully indexed, saved after each one so an
+# interrupted ingestion can resume. Thread-safe.
+#
+# `settings` (chunk size and overlap) are saved with every source. A
+# source indexed with other settings is not done: its chunks would be
+# those of the old settings.
+# -------------------------------------------------------------------
+class Checkpoint:
+
+    def __init__(self, path: str, settings: dict = None):
+        self.path = path
+        self.settings = settings
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as checkpoint_file:
+                self._done = json.load(checkpoint_file)
+        except (OSError, ValueError):
+            self._done = {}
+
+    def is_done(self, source: Source):
+        entry = self._done.get(source.key)
+        if entry is None or entry.get("settings") != self.settings:
+            return False
+        if source.fingerprint is not None:
+            return entry["fingerprint"] == source.fingerprint
+        return time.time() - entry["indexed_at"] < REFRESH_INTERVAL
+
+    def keys(self):
+        with self._lock:
+            return list(self._done)
+
+    # ------------------------------------------------------------
+    # "source" metadata of the documents of a source, as of its last
+    # indexing. None for entries written before they were recorded.
+    # ------------------------------------------------------------
+    def sources(self, key: str):
+        entry = self._done.get(key)
+        return None if entry is None else entry.get("sources")
+
+    def mark_done(self, source: Source, chunks: int, sources: list):
+        with self._lock:
+            self._done[source.key] = {"fingerprint": source.fingerprint,
+                                      "indexed_at": time.time(),
+                                      "chunks": chunks,
+                                      "sources": sources,
+                                      "settings": self.settings}
+            self._save_locked()
+
+    def forget(self, key: str):
+        with self._lock:
+            if self._done.pop(key, None) is not None:
+                self._save_locked()
+
+    def _save_locked(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+            json.dump(self._done, checkpoint_file)
+        os.replace(temporary_path, self.path)
+
+
+# -------------------------------------------------------------------
+# The ingestion pipeline. run() returns the totals of the run.
+#
+# Every stage catches the errors of one source, reports them and
+# goes on with the next source; a failed source is not checkpointed,
+# so it's retried on the next run. With `timings` (RAGTimings), the
+# time of every stage is recorded per source.
+# -------------------------------------------------------------------
+class IngestPipeline:
+
+    def __init__(self, store, splitter, checkpoint: Checkpoint,
+                 load_workers: int = 4, embed_workers: int = 2,
+                 queue_size: int = 8, progress=print, timings=None):
+        self.store = store
+        self.splitter = splitter
+        self.checkpoint = checkpoint
+        self.load_workers = load_workers
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.progress = progress
+        self.timings = timings
+        self._lock = threading.Lock()
+        self._stored_sources = None
+        self.totals = {}
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.totals[name] = self.totals.get(name, 0) + value
+
+    def _span(self, stage: str):
+        if self.timings is None:
+            return nullcontext()
+        return self.timings.span(stage)
+
+    def _failed(self, source: Source, stage: str, error: Exception):
+        self._count(failed=1)
+        self.progress(f"{source.key}: {stage} failed: "
+                      f"{type(error).__name__}: {error}")
+
+    # ------------------------------------------------------------
+    # "source" metadata of the documents a source had when it was
+    # last indexed. Checkpoints written before it was recorded are
+    # matched with the sources in the store: path or path#N.
+    # ------------------------------------------------------------
+    def _previous_sources(self, key: str):
+        sources = self.checkpoint.sources(key)
+        if sources is not None:
+            return sources
+        if not key.startswith("file:"):
+            return []
+
+        with self._lock:
+            if self._stored_sources is None:
+                self._stored_sources = stored_sources(self.store)
+        path = key[len("file:"):]
+        return [source for source in self._stored_sources
+                if source == path or source.startswith(f"{path}#")]
+
+    # ------------------------------------------------------------
+    # Deletes the chunks of sources that were removed, and forgets
+    # them in the checkpoint
+    # ------------------------------------------------------------
+    def remove(self, keys: list):
+        for key in keys:
+            try:
+                plan = plan_sync(self.store, [], self._previous_sources(key))
+                apply_sync(self.store, plan, [])
+                self.checkpoint.forget(key)
+            except Exception as error:
+                self._count(failed=1)
+                self.progress(f"{key}: remove failed: "
+                              f"{type(error).__name__}: {error}")
+                continue
+
+            self._count(removed=1, deleted=plan.changes["deleted"])
+            self.progress(f"{key}: removed, {plan.changes['deleted']} "
+                          f"chunks deleted")
+
+    # ------------------------------------------------------------
+    # Stages. Each one reads from its input queue until it gets
+    # None, and writes to the next one.
+    # ------------------------------------------------------------
+    def _load(self, sources: queue.Queue, loaded: queue.Queue):
+        while (source := sources.get()) is not None:
+            if self.checkpoint.is_done(source):
+                self._count(skipped=1)
+                continue
+            try:
+                with self._span("load_documents"):
+                    documents = source.load()
+                loaded.put((source, documents))
+            except Exception as error:
+                self._failed(source, "load", error)
+
+    def _split(self, loaded: queue.Queue, planned: queue.Queue):
+        while (item := loaded.get()) is not None:
+            source, documents = item
+            try:
+                with self._span("split"):
+                    chunks = self.splitter.split_documents(documents)
+                # Documents of the last run without chunks now are
+                # planned too, so their chunks are deleted
+                with self._span("plan_sync"):
+                    plan = plan_sync(self.store, chunks,
+                                     self._previous_sources(source.key))
+                planned.put((source, chunks, plan))
+            except Exception as error:
+                self._failed(source, "split", error)
+
+    def _embed(self, planned: queue.Queue, embedded: queue.Queue):
+        while (item := planned.get()) is not None:
+            source, chunks, plan = item
+            try:
+                with self._span("embed_chunks"):
+                    vectors = embed_chunks(
+                        self.store, [chunk for _, chunk in plan.pending],
+                        plan.stored, plan.changes)
+                embedded.put((source, chunks, plan, vectors))
+            except Exception as error:
+                self._failed(source, "embed", error)
+
+    def _upsert(self, embedded: queue.Queue, total: int):
+        started = time.monotonic()
+        while (item := embedded.get()) is not None:
+            source, chunks, plan, vectors = item
+            chunk_count = len(chunks)
+            try:
+                with self._span("upsert"):
+                    apply_sync(self.store, plan, vectors)
+                self.checkpoint.mark_done(
+                    source, chunk_count,
+                    sorted({chunk.metadata["source"] for chunk in chunks}))
+            except Exception as error:
+                self._failed(source, "upsert", error)
+                continue
+
+            self._count(sources=1, chunks=chunk_count, **plan.changes)
+            done = sum(self.totals.get(name, 0)
+                       for name in ("sources", "skipped", "failed"))
+            rate = self.totals["sources"] / (time.monotonic() - started)
+            changes = plan.changes
+            self.progress(f"[{done}/{total}] {source.key}: {chunk_count} "
+                          f"chunks, {changes['added']} new, "
+                          f"{changes['updated']} changed, "
+                          f"{changes['deleted']} deleted, "
+                          f"{changes['embedded']} embedded "
+                          f"({rate:.1f} sources/s)")
+
+    def run(self, sources: list):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(4)]
+        source_queue, loaded, planned, embedded = queues
+
+        stages = [
+            [threading.Thread(target=self._load, args=(source_queue, loaded),
+                              daemon=True)
+             for _ in range(self.load_workers)],
+            [threading.Thread(target=self._split, args=(loaded, planned),
+                              daemon=True)],
+            [threading.Thread(target=self._embed, args=(planned, embedded),
+                              daemon=True)
+             for _ in range(self.embed_workers)],
+            [threading.Thread(target=self._upsert,
+                              args=(embedded, len(sources)), daemon=True)],
+        ]
+        for stage in stages:
+            for thread in stage:
+                thread.start()
+
+        for source in sources:
+            source_queue.put(source)
+
+        # Shut the stages down in order: once every thread of a stage
+        # has finished, the next stage gets its end markers
+        for stage, stage_queue in zip(stages, queues):
+            for _ in stage:
+                stage_queue.put(None)
+            for thread in stage:
+                thread.join()
+
+        return self.totals
+
+
+# ------------------------------------------------------------------
+# Records a run in the store's manifest (see RAGIndex) if it changed
+# the store
+# ------------------------------------------------------------------
+def record_run(store, persist_directory: str, collection_name: str,
+               settings: dict, totals: dict):
+    if any(totals.get(name) for name in ("added", "updated", "deleted")):
+        write_manifest(persist_directory, collection_name, settings, totals,
+                       store._collection.count())
+
+
+# ------------------------------------------------------------------
+# Every "source" value in the store
+# ------------------------------------------------------------------
+def stored_sources(store):
+    sources = set()
+    total = store._collection.count()
+    for offset in range(0, total, EXPORT_BATCH):
+        batch = store.get(limit=EXPORT_BATCH, offset=offset,
+                          include=["metadatas"])
+        sources.update((metadata or {}).get("source")
+                       for metadata in batch["metadatas"])
+    sources.discard(None)
+    return sources
+
+
+# ------------------------------------
+# Command line arguments
+# ------------------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Index local documents and Wikipedia articles in the "
+                    "RAG vector store.")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help=".txt, .md or .jsonl file, or a folder with "
+                             "them")
+    parser.add_argument("--wikipedia", nargs="+", metavar="QUERY",
+                        default=[], help="Wikipedia articles to index")
+    parser.add_argument("--max-docs", type=int, default=1,
+                        help="articles loaded per Wikipedia query "
+                             "(default: 1)")
+    parser.add_argument("--collection", default=COLLECTION_NAME,
+                        help=f"Chroma collection (default: {COLLECTION_NAME})")
+    parser.add_argument("--persist-directory", default=PERSIST_DIRECTORY,
+                        help=f"Chroma directory (default: {PERSIST_DIRECTORY})")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--load-workers", type=int, default=4,
+                        help="documents loaded at a time (default: 4)")
+    parser.add_argument("--embed-workers", type=int, default=2,
+                        help="documents embedded at a time (default: 2)")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="documents waiting between two stages "
+                             "(default: 8)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and load every source "
+                             "again")
+
+    args = parser.parse_args()
+    if not args.paths and not args.wikipedia:
+        parser.error("give at least one PATH or --wikipedia QUERY")
+    if min(args.load_workers, args.embed_workers, args.queue_size) < 1:
+        parser.error("--load-workers, --embed-workers and --queue-size "
+                     "must be at least 1")
+
+    return args
+
+
+# ---------
+# Main body
+# ---------
+if __name__ == "__main__":
+    load_dotenv()
+    arguments = parse_arguments()
+
+    all_sources = (file_sources(arguments.paths)
+                   + wikipedia_sources(arguments.wikipedia,
+                                       arguments.max_docs))
+
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(),
+                                  EmbeddingCache(EMBEDDING_CACHE_PATH))
+    vector_store = open_store(arguments.collection,
+                              arguments.persist_directory, embeddings)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=arguments.chunk_size,
+        chunk_overlap=arguments.chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+    checkpoint_path = os.path.join(arguments.persist_directory,
+                                   CHECKPOINT_FILE)
+    if arguments.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    settings = {"chunk_size": arguments.chunk_size,
+                "chunk_overlap": arguments.chunk_overlap}
+    pipeline = IngestPipeline(vector_store, text_splitter,
+                              Checkpoint(checkpoint_path, settings),
+                              load_workers=arguments.load_workers,
+                              embed_workers=arguments.embed_workers,
+                              queue_size=arguments.queue_size,
+                              progress=lambda message: print(
+                                  message, file=sys.stderr, flush=True))
+
+    start = time.monotonic()
+    try:
+        totals = pipeline.run(all_sources)
+        # Files that were deleted from the folders (or paths) given
+        pipeline.remove(removed_file_keys(pipeline.checkpoint.keys(),
+                                          arguments.paths, all_sources))
+    except KeyboardInterrupt:
+        print("\nInterrupted. Run the same command again to resume.",
+              file=sys.stderr)
+        sys.exit(130)
+    record_run(vector_store, arguments.persist_directory,
+               arguments.collection, settings, totals)
+
+    print(f"{totals.get('sources', 0)} sources indexed "
+          f"({totals.get('chunks', 0)} chunks, "
+          f"{totals.get('embedded', 0)} embedded), "
+          f"{totals.get('skipped', 0)} already indexed, "
+          f"{totals.get('removed', 0)} removed, "
+          f"{totals.get('failed', 0)} failed, in "
+          f"{time.monotonic() - start:.1f} s")
@@ -0,0 +1,101 @@
+# RAGStream.py
+# Purpose: Streaming answers, retrieval first and then the answer
+#          token by token
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - LangChain callbacks for the retriever and LLM runs
+#
+# RetrievalQA only returns when the whole answer is generated. Here
+# the question is answered in two steps: ask() retrieves the chunks
+# (so the sources can be shown right away) and returns an AnswerStream,
+# which yields the answer as the LLM generates it. The prompt is the
+# same the "stuff" chain builds: the chunks joined by blank lines.
+#
+# Every AnswerStream measures the retrieval time, the time to the
+# first token and the time to the full answer, from the call to ask().
+
+import time
+
+from langchain_core.prompts import PromptTemplate
+
+# Constants:
+DOCUMENT_SEPARATOR = "\n\n"           # Same as the "stuff" chain
+
+
+# -------------------------------------------------------------------
+# Answer being generated. Iterating over it yields the text as it
+# arrives; `text` is the answer so far.
+# -------------------------------------------------------------------
+class AnswerStream:
+
+    def __init__(self, llm, prompt: str, documents: list, start: float,
+                 callbacks: list = None):
+        self.llm = llm
+        self.prompt = prompt
+        self.documents = documents
+        self.start = start
+        self.callbacks = callbacks
+        self.retrieval_seconds = time.perf_counter() - start
+        self.first_token_seconds = None
+        self.total_seconds = None
+        self.parts = []
+
+    def __iter__(self):
+        for chunk in self.llm.stream(self.prompt,
+                                     config={"callbacks": self.callbacks}):
+            if not chunk.content:
+                continue
+            if self.first_token_seconds is None:
+                self.first_token_seconds = time.perf_counter() - self.start
+            self.parts.append(chunk.content)
+            yield chunk.content
+
+        self.total_seconds = time.perf_counter() - self.start
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def summary(self):
+        first_token = ("-" if self.first_token_seconds is None
+                       else f"{self.first_token_seconds:.2f} s")
+        total = ("-" if self.total_seconds is None
+                 else f"{self.total_seconds:.2f} s")
+        return (f"Retrieval {self.retrieval_seconds:.2f} s, "
+                f"first token {first_token}, full answer {total}")
+
+
+# -------------------------------------------------------------------
+# Question answering over a retriever with streamed answers. Can be
+# shared by several threads.
+# -------------------------------------------------------------------
+class StreamingQA:
+
+    def __init__(self, retriever, llm, prompt: PromptTemplate):
+        self.retriever = retriever
+        self.llm = llm
+        self.prompt = prompt
+
+    # ------------------------------------------------------------
+    # Retrieves the context of a question. `callbacks` (LangChain
+    # callback handlers) are passed to the retriever and the LLM.
+    # ------------------------------------------------------------
+    def ask(self, question: str, callbacks: list = None):
+        start = time.perf_counter()
+        documents = self.retriever.invoke(question,
+                                          config={"callbacks": callbacks})
+        context = DOCUMENT_SEPARATOR.join(document.page_content
+                                          for document in documents)
+        prompt = self.prompt.format(context=context, question=question)
+        return AnswerStream(self.llm, prompt, documents, start, callbacks)
+
+    # ------------------------------------------------------------
+    # Same interface as RetrievalQA.invoke(), without streaming
+    # ------------------------------------------------------------
+    def invoke(self, inputs: dict, config: dict = None):
+        stream = self.ask(inputs["query"], (config or {}).get("callbacks"))
+        for _ in stream:
+            pass
+        return {"query": inputs["query"], "result": stream.text,
+                "source_documents": stream.documents}
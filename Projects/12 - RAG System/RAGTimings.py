@@ -0,0 +1,371 @@
+# RAGTimings.py
+# Purpose: Timings of every stage of the RAG pipeline
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Retrievers called by another retriever are timed apart;
+#              TimedEmbeddings stage name
+# 10/18/2026 - Gauges (retrieval degraded to keywords only)
+#
+# RAGTimings keeps the last ROLLING_WINDOW durations of each stage
+# (loading the article, splitting, embedding, writing the store,
+# embedding the question, retrieval, generation...) and sizes (prompt
+# and completion tokens), and reports their rolling percentiles. The
+# totals are exported too, as JSON or Prometheus text (a summary per
+# stage, for a textfile collector or a scrape).
+#
+# Stages are recorded with timings.span(), by RAGIndex.sync_store(),
+# by TimedEmbeddings (question embeddings) and by
+# TimingCallbackHandler, a LangChain callback handler that times the
+# retriever and LLM runs of a chain (RetrievalQA or StreamingQA).
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from RAGContext import token_counter
+
+# Constants:
+ROLLING_WINDOW = 500                      # Samples kept per stage
+QUANTILES = (0.5, 0.9, 0.99)
+DURATION_METRIC = "rag_stage_duration_seconds"
+DURATION_HELP = "Time of each stage of the RAG pipeline"
+SIZE_HELP = {
+    "prompt_tokens": "Tokens sent to the LLM per answer",
+    "completion_tokens": "Tokens generated by the LLM per answer",
+}
+COUNTERS = {
+    "rag_answers_total": "Questions answered, by result of the answer cache",
+    "rag_vector_search_failures_total":
+        "Vector searches that failed or timed out (keywords used alone)",
+}
+GAUGES = {
+    "rag_retrieval_degraded":
+        "1 while the vector search is skipped after failures in a row",
+}
+
+
+# -------------------------------------------------------------------
+# The last `size` values of a series, with the count and sum of all
+# of them. Not thread-safe, RAGTimings locks it.
+# -------------------------------------------------------------------
+class RollingWindow:
+
+    def __init__(self, size: int = ROLLING_WINDOW):
+        self.values = deque(maxlen=size)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    # Nearest-rank quantile (0 to 1) of the values in the window
+    def quantile(self, q: float):
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def last(self):
+        return self.values[-1] if self.values else 0.0
+
+
+# ------------------------------------------------------------------
+# Formats labels as {name="value",...} for the Prometheus text format
+# ------------------------------------------------------------------
+def format_labels(labels: dict):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = (str(value).replace("\\", "\\\\").replace('"', '\\"')
+                 .replace("\n", "\\n"))
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# -------------------------------------------------------------------
+# Thread-safe collection of stage durations, sizes and counters
+# -------------------------------------------------------------------
+class RAGTimings:
+
+    def __init__(self, window: int = ROLLING_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._durations = {}        # stage -> RollingWindow
+        self._sizes = {}            # name -> RollingWindow
+        self._counters = {}         # (name, labels tuple) -> value
+        self._gauges = {}           # (name, labels tuple) -> value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            series = self._durations.get(stage)
+            if series is None:
+                series = self._durations[stage] = RollingWindow(self.window)
+            series.add(seconds)
+
+    def record(self, name: str, value: float):
+        with self._lock:
+            series = self._sizes.get(name)
+            if series is None:
+                series = self._sizes[name] = RollingWindow(self.window)
+            series.add(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def gauge(self, name: str, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            return self._gauges.get(key, 0)
+
+    # ------------------------------------------------------------
+    # Times the block:  with timings.span("split"): ...
+    # ------------------------------------------------------------
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # ------------------------------------------------------------
+    # JSON-serializable copy of every series, counter and gauge
+    # ------------------------------------------------------------
+    def snapshot(self):
+        def describe(series: RollingWindow):
+            entry = {"count": series.count, "sum": round(series.sum, 6),
+                     "last": round(series.last(), 6)}
+            for q in QUANTILES:
+                entry[f"p{round(q * 100)}"] = round(series.quantile(q), 6)
+            return entry
+
+        with self._lock:
+            durations = {stage: describe(series) for stage, series
+                         in sorted(self._durations.items())}
+            sizes = {name: describe(series) for name, series
+                     in sorted(self._sizes.items())}
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value})
+            gauges = {}
+            for (name, labels), value in sorted(self._gauges.items()):
+                gauges.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value})
+
+        return {"window": self.window, "duration_seconds": durations,
+                "sizes": sizes, "counters": counters, "gauges": gauges}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # ------------------------------------------------------------
+    # Prometheus text exposition format. The quantiles are over the
+    # rolling window, _sum and _count over every observation.
+    # ------------------------------------------------------------
+    def to_prometheus(self):
+        lines = []
+
+        def summary(metric: str, help_text: str, series: dict,
+                    label: str = None):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} summary")
+            for key, values in sorted(series.items()):
+                labels = {label: key} if label else {}
+                for q in QUANTILES:
+                    quantile_labels = format_labels({**labels,
+                                                     "quantile": str(q)})
+                    lines.append(f"{metric}{quantile_labels} "
+                                 f"{values.quantile(q)}")
+                lines.append(f"{metric}_sum{format_labels(labels)} "
+                             f"{values.sum}")
+                lines.append(f"{metric}_count{format_labels(labels)} "
+                             f"{values.count}")
+
+        with self._lock:
+            summary(DURATION_METRIC, DURATION_HELP, self._durations, "stage")
+            for name, series in sorted(self._sizes.items()):
+                summary(f"rag_{name}", SIZE_HELP.get(name, name),
+                        {name: series})
+
+            for kind, metrics, values in [
+                    ("counter", COUNTERS, self._counters),
+                    ("gauge", GAUGES, self._gauges)]:
+                for name, help_text in metrics.items():
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(
+                                f"{name}{format_labels(dict(labels))} "
+                                f"{value}")
+
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------
+    # Rows for the app's timings panel: stage, count and rolling
+    # percentiles (milliseconds, or tokens for the sizes), then the
+    # counters and gauges (value in "last")
+    # ------------------------------------------------------------
+    def rows(self):
+        snapshot = self.snapshot()
+        rows = []
+        for stage, entry in snapshot["duration_seconds"].items():
+            rows.append({"stage": stage, "count": entry["count"],
+                         **{key: round(entry[key] * 1000, 1)
+                            for key in ("last", "p50", "p90", "p99")},
+                         "unit": "ms"})
+        for name, entry in snapshot["sizes"].items():
+            rows.append({"stage": name, "count": entry["count"],
+                         **{key: entry[key]
+                            for key in ("last", "p50", "p90", "p99")},
+                         "unit": "tokens"})
+        for kind in ("counters", "gauges"):
+            for name, entries in snapshot[kind].items():
+                for entry in entries:
+                    rows.append({"stage": name
+                                 + format_labels(entry["labels"]),
+                                 "last": entry["value"], "unit": kind[:-1]})
+        return rows
+
+
+def write_timings_file(timings: RAGTimings, path: str):
+    if path.endswith(".json"):
+        data = timings.to_json() + "\n"
+    else:
+        data = timings.to_prometheus()
+
+    # Replaced at once, so a collector never reads half a file
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as timings_file:
+        timings_file.write(data)
+    os.replace(temporary_path, path)
+
+
+# -------------------------------------------------------------------
+# Embeddings that time every question embedding (as `stage`).
+# Document embeddings are timed by sync_store().
+# -------------------------------------------------------------------
+class TimedEmbeddings(Embeddings):
+
+    def __init__(self, embeddings: Embeddings, timings: RAGTimings,
+                 stage: str = "query_embedding"):
+        self.embeddings = embeddings
+        self.timings = timings
+        self.stage = stage
+
+    def embed_documents(self, texts: list):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str):
+        with self.timings.span(self.stage):
+            return self.embeddings.embed_query(text)
+
+
+# -------------------------------------------------------------------
+# LangChain callback handler recording, for every run:
+#
+#   retrieval          retriever start to end. Retrievers called by
+#                      another one (HybridRetriever's vector search)
+#                      are recorded as retrieval.<their class>
+#   first_token        LLM start to the first streamed token
+#   generation         LLM start to end
+#   prompt_tokens      tokens sent (usage reported by the API, or
+#   completion_tokens  counted with RAGContext.token_counter())
+#
+# Pass it in the callbacks of qa_chain.invoke() or StreamingQA.ask().
+# -------------------------------------------------------------------
+class TimingCallbackHandler(BaseCallbackHandler):
+
+    def __init__(self, timings: RAGTimings, model: str = "gpt-5"):
+        self.timings = timings
+        self.count_tokens = token_counter(model)
+        self._lock = threading.Lock()
+        self._runs = {}             # run_id -> start, tokens, first token
+
+    def _start(self, run_id, prompt_tokens: int = 0,
+               stage: str = None):
+        with self._lock:
+            self._runs[run_id] = {"start": time.perf_counter(),
+                                  "prompt_tokens": prompt_tokens,
+                                  "streamed": False, "stage": stage}
+
+    # Returns (seconds since the start, run) of a run
+    def _finish(self, run_id):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None, None
+        return time.perf_counter() - run["start"], run
+
+    def on_retriever_start(self, serialized, query, *, run_id,
+                           parent_run_id=None, **kwargs):
+        stage = "retrieval"
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+        if parent is not None and parent["stage"]:
+            stage = f"retrieval.{kwargs.get('name') or 'retriever'}"
+        self._start(run_id, stage=stage)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        seconds, run = self._finish(run_id)
+        if seconds is not None:
+            self.timings.observe(run["stage"], seconds)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, sum(self.count_tokens(prompt)
+                                for prompt in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id,
+                            **kwargs):
+        self._start(run_id, sum(self.count_tokens(str(message.content))
+                                for batch in messages for message in batch))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run["streamed"]:
+                return
+            run["streamed"] = True
+            seconds = time.perf_counter() - run["start"]
+        self.timings.observe("first_token", seconds)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        seconds, run = self._finish(run_id)
+        if seconds is None:
+            return
+        prompt_tokens = run["prompt_tokens"]
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(generation.text
+                       for generations in response.generations
+                       for generation in generations)
+        self.timings.observe("generation", seconds)
+        self.timings.record("prompt_tokens",
+                            usage.get("prompt_tokens", prompt_tokens))
+        self.timings.record("completion_tokens",
+                            usage.get("completion_tokens",
+                                      self.count_tokens(text)))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
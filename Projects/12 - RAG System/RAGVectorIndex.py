@@ -0,0 +1,641 @@
+# RAGVectorIndex.py
+# Purpose: In-process NumPy vector index, an alternative to Chroma for
+#          small and medium corpora
+# Author: Javier Corpus
+# Changelog:
+# 10/18/2026 - Initial version
+# 10/18/2026 - Added int8 and product-quantized (PQ) modes with exact
+#              re-ranking, and the evaluate command (recall@k)
+# 10/18/2026 - PQ centroid count scales with the number of vectors
+#
+# The normalized embeddings are stored as one float16 (or float32)
+# matrix in a file that is memory-mapped, so opening the index is
+# instant and the operating system keeps the pages that are used in
+# memory. A query is a single matrix-vector product (cosine similarity)
+# followed by argpartition to get the top k; several queries can be
+# answered with one matrix-matrix product.
+#
+# The int8 and pq modes keep only compressed codes in memory: int8 is
+# 4 times smaller than float32. PQ stores one byte per 8 dimensions
+# (see PQ_SUB_DIM) plus the centroids, which take a fixed
+# dim * centroids * 4 bytes: it is 20 to 30 times smaller on tens of
+# thousands of chunks, but the centroids dominate on small corpora.
+# The number of centroids is scaled down with the number of vectors
+# (see pq_centroids()), which keeps PQ about 10 times smaller from a
+# few hundred chunks. Below PQ_MIN_ROWS int8 is as small and build()
+# warns. The search runs on the codes and the best
+# candidates are re-ranked with the exact float32 vectors, which stay
+# on disk and are only read for those rows.
+#
+# VectorIndex.as_retriever() returns a LangChain retriever, so the
+# index can be passed to create_qa_chain() in place of the Chroma store.
+#
+# Export the app's Chroma store to an index:
+#   python RAGVectorIndex.py build --output Wiki_DDM/numpy_index
+# Compare with Chroma on random vectors:
+#   python RAGVectorIndex.py benchmark --rows 20000 --dim 1536
+# Recall@k of an index against the exact search:
+#   python RAGVectorIndex.py evaluate --index Wiki_DDM/numpy_index
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from typing import Any, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from RAGIndex import open_store
+
+# Constants:
+META_FILE = "meta.json"
+CHUNKS_FILE = "chunks.jsonl"
+VECTORS_FILE = "vectors.bin"
+CODES_FILE = "codes.bin"
+QUANTIZER_FILE = "quantizer.npy"
+DTYPES = ["float16", "float32", "int8", "pq"]
+QUANTIZED = ["int8", "pq"]
+BLOCK_ROWS = 8_192        # Rows converted to float32 at a time
+EXPORT_BATCH = 5_000      # Chroma rows read at a time
+RERANK_FACTORS = {"int8": 10, "pq": 50}   # Candidates re-ranked per result
+PQ_SUB_DIM = 8            # Dimensions encoded in each PQ byte
+PQ_CENTROIDS = 256        # Centroids per PQ sub-vector (one byte)
+PQ_MIN_CENTROIDS = 16
+PQ_ROWS_PER_CENTROID = 16 # Fewer centroids for small corpora
+PQ_MIN_ROWS = 100         # Smallest corpus worth a pq index
+PQ_TRAIN_ROWS = 8_192     # Sample used to train the PQ centroids
+PQ_ITERATIONS = 8         # k-means iterations
+ASSIGN_ELEMENTS = 2**24   # Distances computed at a time by assign()
+
+
+# ------------------------------------------------------------------
+# Scales the rows to unit length, so a dot product is the cosine
+# ------------------------------------------------------------------
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# ------------------------------------------------------------------
+# Indices of the k largest scores of each column, best first
+# ------------------------------------------------------------------
+def top_k(scores, k: int):
+    k = min(k, scores.shape[0])
+    if k == 0:
+        return np.empty((0,) + scores.shape[1:], dtype=np.int64)
+
+    candidates = np.argpartition(-scores, k - 1, axis=0)[:k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=0),
+                       axis=0, kind="stable")
+    return np.take_along_axis(candidates, order, axis=0)
+
+
+# ------------------------------------------------------------------
+# Scores of every row of a matrix with the queries (one per column).
+# NumPy has no fast float16 or int8 product, so other types are
+# converted to float32 by blocks, in a buffer small enough to stay in
+# the CPU cache.
+# ------------------------------------------------------------------
+def matrix_scores(matrix, queries):
+    scores = np.empty((len(matrix), queries.shape[1]), dtype=np.float32)
+    if matrix.dtype == np.float32:
+        return np.matmul(matrix, queries, out=scores)
+
+    buffer = np.empty((min(BLOCK_ROWS, len(matrix)), matrix.shape[1]),
+                      dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = matrix[start:start + BLOCK_ROWS]
+        rows = len(block)
+        np.copyto(buffer[:rows], block)
+        np.matmul(buffer[:rows], queries, out=scores[start:start + rows])
+    return scores
+
+
+# ------------------------------------------------------------------
+# int8 quantization: every dimension is scaled to -127..127. Returns
+# the scale of each dimension and the codes.
+# ------------------------------------------------------------------
+def quantize_int8(vectors):
+    scale = np.maximum(np.abs(vectors).max(axis=0) / 127, 1e-12)
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return scale.astype(np.float32), codes
+
+
+# ------------------------------------------------------------------
+# Centroids per part for `rows` vectors. With 256 centroids, their
+# dim * 256 * 4 bytes are larger than the codes (rows * dim / 8)
+# below 8,192 rows, so small corpora get one per PQ_ROWS_PER_CENTROID
+# rows instead.
+# ------------------------------------------------------------------
+def pq_centroids(rows: int):
+    return max(PQ_MIN_CENTROIDS,
+               min(PQ_CENTROIDS, rows // PQ_ROWS_PER_CENTROID))
+
+
+# ------------------------------------------------------------------
+# Product quantization: the vectors are split in sub-vectors of
+# sub_dim dimensions and each one is replaced by the index of the
+# nearest of pq_centroids(rows) centroids, learned with k-means on a
+# sample. Returns the centroids (parts, centroids, sub_dim) and the
+# codes (parts, rows), one row of codes per part.
+# ------------------------------------------------------------------
+def quantize_pq(vectors, sub_dim: int = PQ_SUB_DIM):
+    rows, dim = vectors.shape
+    # The sub-vectors must divide the vectors evenly
+    sub_dim = next(size for size in range(sub_dim, 0, -1)
+                   if dim % size == 0)
+    parts = dim // sub_dim
+
+    rng = np.random.default_rng(0)
+    sample = vectors[np.sort(rng.choice(rows, min(rows, PQ_TRAIN_ROWS),
+                                        replace=False))]
+    centroids = kmeans(split_parts(sample, parts),
+                       min(pq_centroids(rows), len(sample)), rng)
+
+    codes = np.empty((parts, rows), dtype=np.uint8)
+    for start in range(0, rows, BLOCK_ROWS):
+        block = split_parts(vectors[start:start + BLOCK_ROWS], parts)
+        codes[:, start:start + len(block[0])] = assign(block, centroids)
+    return centroids, codes
+
+
+# Rows (rows, dim) -> sub-vectors (parts, rows, sub_dim)
+def split_parts(vectors, parts: int):
+    return np.ascontiguousarray(
+        vectors.reshape(len(vectors), parts, -1).transpose(1, 0, 2))
+
+
+# ------------------------------------------------------------------
+# Index of the nearest centroid of every sub-vector, all parts at
+# once, ASSIGN_ELEMENTS distances at a time
+# ------------------------------------------------------------------
+def assign(points, centroids):
+    parts, rows, _ = points.shape
+    labels = np.empty((parts, rows), dtype=np.int64)
+    # Nearest centroid = largest p.c - |c|^2 / 2 (|p - c|^2 without
+    # the |p|^2 term, which doesn't change the order, divided by -2)
+    half_norms = -0.5 * (centroids ** 2).sum(axis=-1)[:, None, :]
+
+    step = max(1, ASSIGN_ELEMENTS // max(1, rows * centroids.shape[1]))
+    buffer = np.empty((min(step, parts), rows, centroids.shape[1]),
+                      dtype=np.float32)
+    for start in range(0, parts, step):
+        part_slice = slice(start, start + step)
+        similarity = np.matmul(points[part_slice],
+                               centroids[part_slice].transpose(0, 2, 1),
+                               out=buffer[:len(points[part_slice])])
+        similarity += half_norms[part_slice]
+        labels[part_slice] = similarity.argmax(axis=-1)
+    return labels
+
+
+# ------------------------------------------------------------------
+# k-means of every part, all parts at once. Centroids that lose all
+# their points keep their position.
+# ------------------------------------------------------------------
+def kmeans(points, count: int, rng):
+    parts, rows, sub_dim = points.shape
+    centroids = points[:, rng.choice(rows, count, replace=False)].copy()
+    # Labels of different parts are offset so one bincount does them all
+    offsets = (np.arange(parts) * count)[:, None]
+
+    for _ in range(PQ_ITERATIONS):
+        labels = (assign(points, centroids) + offsets).ravel()
+        counts = np.bincount(labels, minlength=parts * count)
+        counts = counts.reshape(parts, count)
+        for dimension in range(sub_dim):
+            sums = np.bincount(labels,
+                               weights=points[..., dimension].ravel(),
+                               minlength=parts * count)
+            np.divide(sums.reshape(parts, count), counts,
+                      out=centroids[..., dimension], where=counts > 0)
+    return centroids
+
+
+# -------------------------------------------------------------------
+# Memory-mapped vector index. Rows are the chunks, in the order of
+# chunks.jsonl (ID, text and metadata of each one). `embeddings` is
+# used by the retriever to embed the questions.
+#
+# In the int8 and pq modes, `codes` (in memory) are searched and
+# `vectors` are the exact float32 vectors, read from disk to re-rank
+# the best k * rerank_factor rows.
+# -------------------------------------------------------------------
+class VectorIndex:
+
+    def __init__(self, directory: str, embeddings=None):
+        self.directory = directory
+        self.embeddings = embeddings
+        with open(os.path.join(directory, META_FILE),
+                  encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+
+        self.count = self.meta["count"]
+        self.dim = self.meta["dim"]
+        self.dtype = self.meta["dtype"]
+        self.rerank_factor = RERANK_FACTORS.get(self.dtype, 1)
+        self.vectors = np.memmap(os.path.join(directory, VECTORS_FILE),
+                                 dtype=("float32" if self.dtype in QUANTIZED
+                                        else self.dtype),
+                                 mode="r", shape=(self.count, self.dim))
+
+        self.quantizer = None
+        self.codes = None
+        if self.dtype in QUANTIZED:
+            self.quantizer = np.load(os.path.join(directory, QUANTIZER_FILE))
+            codes = np.fromfile(os.path.join(directory, CODES_FILE),
+                                dtype=np.int8 if self.dtype == "int8"
+                                else np.uint8)
+            self.codes = codes.reshape(
+                (self.count, self.dim) if self.dtype == "int8"
+                else (len(self.quantizer), self.count))
+
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        with open(os.path.join(directory, CHUNKS_FILE),
+                  encoding="utf-8") as chunks_file:
+            for line in chunks_file:
+                chunk = json.loads(line)
+                self.ids.append(chunk["id"])
+                self.texts.append(chunk["text"])
+                self.metadatas.append(chunk["metadata"])
+
+    # ------------------------------------------------------------
+    # Writes an index. The vectors are normalized here.
+    # ------------------------------------------------------------
+    @staticmethod
+    def build(directory: str, ids: list, texts: list, metadatas: list,
+              vectors, dtype: str = "float16", fingerprint: str = None,
+              embeddings=None):
+        vectors = normalize(vectors)
+        os.makedirs(directory, exist_ok=True)
+
+        if dtype == "pq" and len(vectors) < PQ_MIN_ROWS:
+            warnings.warn(f"pq index of {len(vectors)} vectors: the "
+                          "centroids take most of the memory, int8 is as "
+                          f"small below {PQ_MIN_ROWS} vectors")
+        if dtype in QUANTIZED:
+            quantizer, codes = (quantize_int8(vectors) if dtype == "int8"
+                                else quantize_pq(vectors))
+            np.save(os.path.join(directory, QUANTIZER_FILE), quantizer)
+            codes.tofile(os.path.join(directory, CODES_FILE))
+        else:
+            vectors = vectors.astype(dtype)
+        vectors.tofile(os.path.join(directory, VECTORS_FILE))
+        with open(os.path.join(directory, CHUNKS_FILE), "w",
+                  encoding="utf-8") as chunks_file:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                chunks_file.write(json.dumps(
+                    {"id": chunk_id, "text": text, "metadata": metadata},
+                    ensure_ascii=False) + "\n")
+
+        # Written last, an index without it is incomplete
+        with open(os.path.join(directory, META_FILE), "w",
+                  encoding="utf-8") as meta_file:
+            json.dump({"count": len(ids), "dim": int(vectors.shape[1]),
+                       "dtype": dtype, "fingerprint": fingerprint},
+                      meta_file)
+
+        return VectorIndex(directory, embeddings)
+
+    # ------------------------------------------------------------
+    # Exports a Chroma store to an index
+    # ------------------------------------------------------------
+    @staticmethod
+    def from_store(store, directory: str, dtype: str = "float16"):
+        ids, texts, metadatas, vectors = [], [], [], []
+        total = store._collection.count()
+
+        for offset in range(0, total, EXPORT_BATCH):
+            batch = store.get(limit=EXPORT_BATCH, offset=offset,
+                              include=["documents", "metadatas",
+                                       "embeddings"])
+            ids.extend(batch["ids"])
+            texts.extend(batch["documents"])
+            metadatas.extend(metadata or {}
+                             for metadata in batch["metadatas"])
+            vectors.extend(batch["embeddings"])
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        return VectorIndex.build(directory, ids, texts, metadatas,
+                                 np.asarray(vectors, dtype=np.float32),
+                                 dtype, store_fingerprint(store),
+                                 store.embeddings)
+
+    # ------------------------------------------------------------
+    # Opens the index in `directory` if it matches the store, or
+    # exports the store again
+    # ------------------------------------------------------------
+    @staticmethod
+    def open_or_build(store, directory: str, dtype: str = "float16"):
+        try:
+            index = VectorIndex(directory, store.embeddings)
+            if (index.meta.get("fingerprint") == store_fingerprint(store)
+                    and index.dtype == dtype):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return VectorIndex.from_store(store, directory, dtype)
+
+    # ------------------------------------------------------------
+    # Cosine similarity of every row with the queries (one per
+    # column), approximate in the int8 and pq modes. The float16
+    # conversion costs more than the product itself: float16 halves
+    # the memory, float32 answers a single query faster.
+    # ------------------------------------------------------------
+    def scores(self, queries):
+        if self.dtype == "int8":
+            return matrix_scores(self.codes, queries * self.quantizer[:, None])
+
+        if self.dtype == "pq":
+            # Score of every centroid of every part with the queries,
+            # then one lookup per part and row
+            parts, _, sub_dim = self.quantizer.shape
+            tables = np.matmul(self.quantizer,
+                               queries.reshape(parts, sub_dim, -1))
+            scores = np.zeros((self.count, queries.shape[1]),
+                              dtype=np.float32)
+            for part in range(parts):
+                scores += tables[part][self.codes[part]]
+            return scores
+
+        return matrix_scores(self.vectors, queries)
+
+    # ------------------------------------------------------------
+    # Returns [(row, score)] of the k nearest rows to a query
+    # ------------------------------------------------------------
+    def search(self, query_vector, k: int = 4):
+        return self.search_batch([query_vector], k)[0]
+
+    # ------------------------------------------------------------
+    # Same as search() for several queries at once
+    # ------------------------------------------------------------
+    def search_batch(self, query_vectors, k: int = 4):
+        queries = normalize(query_vectors).T
+        scores = self.scores(queries)
+        if self.dtype not in QUANTIZED:
+            rows = top_k(scores, k)
+            return [[(int(row), float(scores[row, column]))
+                     for row in rows[:, column]]
+                    for column in range(queries.shape[1])]
+
+        # Re-rank the candidates of each query with the exact vectors,
+        # read in file order
+        candidates = top_k(scores, k * self.rerank_factor)
+        results = []
+        for column in range(queries.shape[1]):
+            rows = np.sort(candidates[:, column])
+            exact = np.asarray(self.vectors[rows]) @ queries[:, column]
+            results.append([(int(rows[best]), float(exact[best]))
+                            for best in top_k(exact, k)])
+        return results
+
+    # ------------------------------------------------------------
+    # search_batch() on the uncompressed vectors, to measure recall
+    # ------------------------------------------------------------
+    def exact_search_batch(self, query_vectors, k: int = 4):
+        queries = normalize(query_vectors).T
+        scores = matrix_scores(self.vectors, queries)
+        rows = top_k(scores, k)
+        return [[(int(row), float(scores[row, column]))
+                 for row in rows[:, column]]
+                for column in range(queries.shape[1])]
+
+    def document(self, row: int):
+        return Document(page_content=self.texts[row],
+                        metadata=dict(self.metadatas[row]))
+
+    def as_retriever(self, embeddings=None, k: int = 4):
+        return VectorIndexRetriever(index=self,
+                                    embeddings=embeddings or self.embeddings,
+                                    k=k)
+
+    # ------------------------------------------------------------
+    # Memory used by the search. The exact vectors of the int8 and
+    # pq modes stay on disk and are not counted.
+    # ------------------------------------------------------------
+    def nbytes(self):
+        if self.dtype in QUANTIZED:
+            return self.codes.nbytes + self.quantizer.nbytes
+        return self.vectors.nbytes
+
+
+# ------------------------------------------------------------------
+# Identifies the content of a Chroma store: hash of every chunk ID
+# with its text hash (see RAGIndex)
+# ------------------------------------------------------------------
+def store_fingerprint(store):
+    entries = store.get(include=["metadatas"])
+    digest = hashlib.sha256()
+    for chunk_id, metadata in sorted(zip(entries["ids"],
+                                         entries["metadatas"])):
+        digest.update(f"{chunk_id}\0{(metadata or {}).get('content_hash')}\n"
+                      .encode("utf-8"))
+    return digest.hexdigest()
+
+
+# -------------------------------------------------------------------
+# LangChain retriever over a VectorIndex. The query is embedded with
+# the same embeddings used to build the store.
+# -------------------------------------------------------------------
+class VectorIndexRetriever(BaseRetriever):
+
+    index: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        query_vector = self.embeddings.embed_query(query)
+        return [self.index.document(row)
+                for row, _ in self.index.search(query_vector, self.k)]
+
+    # ------------------------------------------------------------
+    # Retrieves the documents of several questions with a single
+    # embeddings call and a single matrix product
+    # ------------------------------------------------------------
+    def retrieve_many(self, queries: List[str]):
+        query_vectors = self.embeddings.embed_documents(queries)
+        return [[self.index.document(row) for row, _ in results]
+                for results in self.index.search_batch(query_vectors,
+                                                       self.k)]
+
+
+# ------------------------------------------------------------------
+# Latency percentiles, in milliseconds
+# ------------------------------------------------------------------
+def latency_summary(latencies: list):
+    values = np.asarray(latencies) * 1000
+    return (f"p50 {np.percentile(values, 50):7.2f} ms   "
+            f"p99 {np.percentile(values, 99):7.2f} ms")
+
+
+def recall(found: list, expected: list):
+    hits = sum(len(set(a) & set(b)) for a, b in zip(found, expected))
+    return hits / sum(len(b) for b in expected)
+
+
+# ------------------------------------------------------------------
+# Recall@k of an index against the exact search on its own vectors.
+# The queries are mixes of two random chunks, like a question that
+# touches both.
+# ------------------------------------------------------------------
+def evaluate(directory: str, query_count: int, k: int):
+    index = VectorIndex(directory)
+    rng = np.random.default_rng(0)
+    pairs = rng.integers(0, index.count, size=(query_count, 2))
+    queries = (np.asarray(index.vectors[pairs[:, 0]], dtype=np.float32)
+               + np.asarray(index.vectors[pairs[:, 1]], dtype=np.float32))
+
+    start = time.perf_counter()
+    results = [[row for row, _ in found]
+               for found in index.search_batch(queries, k)]
+    search_time = time.perf_counter() - start
+    exact = [[row for row, _ in found]
+             for found in index.exact_search_batch(queries, k)]
+
+    full_size = index.count * index.dim * 4
+    print(f"{index.dtype} index, {index.count} chunks: "
+          f"{index.nbytes() / 2**20:.1f} MB in memory "
+          f"({full_size / max(index.nbytes(), 1):.1f}x smaller than float32), "
+          f"{search_time / query_count * 1000:.2f} ms/query, "
+          f"recall@{k} {recall(results, exact):.3f}")
+
+
+# ------------------------------------------------------------------
+# Benchmarks the index (every mode, single and batched queries)
+# against Chroma on the same random vectors. Recall is measured
+# against the exact float32 results.
+#
+# Random vectors have no structure for PQ to learn, so its recall
+# here is a worst case.
+# ------------------------------------------------------------------
+def benchmark(rows: int, dim: int, query_count: int, k: int,
+              with_chroma: bool):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((rows, dim), dtype=np.float32)
+    queries = rng.standard_normal((query_count, dim), dtype=np.float32)
+    ids = [f"row-{row}" for row in range(rows)]
+    texts = [""] * rows
+    metadatas = [{} for _ in range(rows)]
+
+    exact = None
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in ["float32", "float16", "int8", "pq"]:
+            start = time.perf_counter()
+            index = VectorIndex.build(os.path.join(directory, dtype), ids,
+                                      texts, metadatas, vectors, dtype)
+            build_time = time.perf_counter() - start
+
+            latencies = []
+            results = []
+            for query in queries:
+                start = time.perf_counter()
+                results.append([row for row, _ in index.search(query, k)])
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            index.search_batch(queries, k)
+            batch_time = time.perf_counter() - start
+
+            if exact is None:
+                exact = results
+            print(f"numpy {dtype:<8} build {build_time:6.2f} s   "
+                  f"{index.nbytes() / 2**20:7.1f} MB   "
+                  f"{latency_summary(latencies)}   "
+                  f"batch {batch_time / query_count * 1000:6.2f} ms/query   "
+                  f"recall@{k} {recall(results, exact):.3f}")
+
+        if with_chroma:
+            import chromadb
+
+            client = chromadb.PersistentClient(
+                path=os.path.join(directory, "chroma"))
+            collection = client.create_collection(
+                "benchmark", metadata={"hnsw:space": "cosine"})
+
+            start = time.perf_counter()
+            for offset in range(0, rows, EXPORT_BATCH):
+                collection.add(
+                    ids=ids[offset:offset + EXPORT_BATCH],
+                    embeddings=vectors[offset:offset + EXPORT_BATCH].tolist())
+            build_time = time.perf_counter() - start
+
+            latencies = []
+            results = []
+            for query in queries:
+                start = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()],
+                                         n_results=k)
+                latencies.append(time.perf_counter() - start)
+                results.append([int(chunk_id.split("-")[1])
+                                for chunk_id in found["ids"][0]])
+
+            start = time.perf_counter()
+            collection.query(query_embeddings=queries.tolist(), n_results=k)
+            batch_time = time.perf_counter() - start
+
+            print(f"chroma (HNSW)  build {build_time:6.2f} s   "
+                  f"{'':>10}   {latency_summary(latencies)}   "
+                  f"batch {batch_time / query_count * 1000:6.2f} ms/query   "
+                  f"recall@{k} {recall(results, exact):.3f}")
+
+
+# ------------------------------------
+# Command line
+# ------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or benchmark the NumPy vector index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="export a Chroma store to an index")
+    build_parser.add_argument("--collection",
+                              default="DayoftheDead-Embeddings")
+    build_parser.add_argument("--persist-directory", default="Wiki_DDM")
+    build_parser.add_argument("--output",
+                              default=os.path.join("Wiki_DDM", "numpy_index"))
+    build_parser.add_argument("--dtype", choices=DTYPES, default="float16")
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate", help="recall@k of an index against the exact search")
+    evaluate_parser.add_argument("--index",
+                                 default=os.path.join("Wiki_DDM",
+                                                      "numpy_index"))
+    evaluate_parser.add_argument("--queries", type=int, default=200)
+    evaluate_parser.add_argument("-k", type=int, default=4)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="compare with Chroma on random vectors")
+    benchmark_parser.add_argument("--rows", type=int, default=20_000)
+    benchmark_parser.add_argument("--dim", type=int, default=1536)
+    benchmark_parser.add_argument("--queries", type=int, default=200)
+    benchmark_parser.add_argument("-k", type=int, default=4)
+    benchmark_parser.add_argument("--no-chroma", action="store_true",
+                                  help="only benchmark the NumPy index")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        store = open_store(args.collection, args.persist_directory, None)
+        index = VectorIndex.from_store(store, args.output, args.dtype)
+        print(f"{index.count} chunks written to {args.output} "
+              f"({index.nbytes() / 2**20:.1f} MB)")
+    elif args.command == "evaluate":
+        evaluate(args.index, args.queries, args.k)
+    else:
+        benchmark(args.rows, args.dim, args.queries, args.k,
+                  not args.no_chroma)
+
+
+if __name__ == "__main__":
+    main()